@@ -0,0 +1,4 @@
+'''
+Benchmarks of API endpoints that run the app in-process against a seeded dataset
+Run with "python -m benchmarks.run --help"
+'''
@@ -0,0 +1,118 @@
+'''
+Contains minimal in-process ASGI client: requests go straight to the app without sockets
+'''
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from starlette.types import ASGIApp, Message
+
+
+class Result(NamedTuple):
+    '''
+    Status, headers and whole body of response
+    '''
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class ASGIClient:
+    '''
+    Class that sends HTTP requests to ASGI app and runs its lifespan
+    '''
+    def __init__(self, app: ASGIApp, client: Tuple[str, int] = ('127.0.0.1', 50000)):
+        '''
+        Saves app and address that requests come from
+        '''
+        self.app: ASGIApp = app
+        self.client: Tuple[str, int] = client
+        self.lifespan_task: Optional[asyncio.Task] = None
+        self.lifespan_queue: asyncio.Queue = asyncio.Queue()
+        self.lifespan_events: asyncio.Queue = asyncio.Queue()
+
+    async def startup(self):
+        '''
+        Runs startup of app lifespan
+        '''
+        async def receive() -> Message:
+            return await self.lifespan_queue.get()
+
+        async def send(message: Message):
+            await self.lifespan_events.put(message)
+
+        self.lifespan_task = asyncio.create_task(self.app({'type': 'lifespan'}, receive, send))
+        await self.lifespan_queue.put({'type': 'lifespan.startup'})
+        message: Message = await self.lifespan_events.get()
+        if message['type'] != 'lifespan.startup.complete':
+            raise RuntimeError(message.get('message', 'Lifespan startup failed'))
+
+    async def shutdown(self):
+        '''
+        Runs shutdown of app lifespan
+        '''
+        if self.lifespan_task is not None:
+            await self.lifespan_queue.put({'type': 'lifespan.shutdown'})
+            await self.lifespan_events.get()
+            await self.lifespan_task
+            self.lifespan_task = None
+
+    async def request(self, method: str, path: str, params: Optional[Dict[str, str]] = None,
+                      headers: Optional[Dict[str, str]] = None, body: bytes = b'') -> Result:
+        '''
+        Sends request and reads whole response
+        '''
+        scope: dict = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'root_path': '', 'query_string': urlencode(params or {}).encode(),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in (headers or {}).items()] +
+                       [(b'host', b'benchmark'), (b'content-length', str(len(body)).encode())],
+            'client': self.client, 'server': ('benchmark', 80),
+        }
+        sent: bool = False
+        done = asyncio.Event()
+        status: int = 500
+        response_headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+
+        async def receive() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response_headers.update((name.decode('latin-1'), value.decode('latin-1'))
+                                        for name, value in message.get('headers', []))
+            elif message['type'] == 'http.response.body':
+                chunks.append(bytes(message.get('body', b'')))
+                if not message.get('more_body', False):
+                    done.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        return Result(status, response_headers, b''.join(chunks))
+
+
+def multipart(fields: Dict[str, Tuple[str, bytes, str]],
+              boundary: str = 'benchmark-boundary') -> Tuple[bytes, str]:
+    '''
+    Encodes files as multipart/form-data; fields map name to (filename, data, content type)
+    Returns body and its content type
+    '''
+    parts: List[bytes] = []
+    for name, (filename, data, content_type) in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'
+                     .encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), 'multipart/form-data; boundary=' + boundary
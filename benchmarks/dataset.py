@@ -0,0 +1,147 @@
+'''
+Contains seeding of benchmark database and storage with generated users, tracks and playlists
+'''
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+
+REPOSITORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS: List[str] = ['love', 'night', 'dora', 'summer', 'road', 'fire', 'rain', 'heart',
+                    'city', 'dream', 'light', 'river', 'ghost', 'gold', 'wave', 'star']
+FRAME: bytes = b'\xff\xfb\x90\x64' + b'\x00' * 413
+PASSWORD: str = 'benchmark'
+BATCH: int = 50000
+
+
+class Scale(NamedTuple):
+    '''
+    Sizes of generated dataset
+    '''
+    users: int
+    tracks: int
+    artists: int
+    playlists: int
+    playlist_size: int
+    files: int
+    file_kb: int
+
+
+SCALES: Dict[str, Scale] = {
+    'small': Scale(users=100, tracks=10000, artists=500, playlists=1000, playlist_size=200,
+                   files=16, file_kb=256),
+    'medium': Scale(users=1000, tracks=200000, artists=10000, playlists=10000,
+                    playlist_size=1000, files=64, file_kb=1024),
+    'large': Scale(users=10000, tracks=2000000, artists=100000, playlists=10000,
+                   playlist_size=2000, files=256, file_kb=4096),
+}
+
+
+class Dataset(NamedTuple):
+    '''
+    Ids of seeded objects that benchmark requests use
+    '''
+    users: List[str]
+    tracks: List[str]
+    streamable: List[str]
+    spare: List[str]
+    playlists: List[str]
+    words: List[str]
+
+
+def mp3_bytes(size: int) -> bytes:
+    '''
+    Returns MPEG1 Layer III 128kbps stream of silent frames of about size bytes
+    '''
+    return FRAME * max(size // len(FRAME), 1)
+
+
+def batches(items: Iterator[tuple]) -> Iterator[List[tuple]]:
+    '''
+    Splits rows into lists of BATCH rows
+    '''
+    batch: List[tuple] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(db_path: str, storage_path: str, salt: str, scale: Scale, seed_value: int = 0) -> Dataset:
+    '''
+    Fills empty database with created schema and storage directory
+    Every user has password PASSWORD, playlists are public and belong to random users,
+    first scale.files tracks have audio files. Spare tracks are in no playlist,
+    so they can be added to any of them
+    '''
+    from src.hashes import SHA256Hasher
+
+    rng = random.Random(seed_value)
+    con = sqlite3.connect(db_path)
+    con.execute('PRAGMA synchronous = OFF')
+
+    password: str = SHA256Hasher(salt).hexdigest(PASSWORD)
+    users: List[str] = [f'user{i}' for i in range(scale.users)]
+    con.executemany('INSERT INTO users VALUES(?, ?, ?)',
+                    [(username, password, False) for username in users])
+
+    tracks: List[str] = [str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                         for _ in range(scale.tracks)]
+    artists: List[int] = [int(rng.paretovariate(1.2)) % scale.artists for _ in tracks]
+    for batch in batches((track, f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}', f'artist{artist}')
+                         for i, (track, artist) in enumerate(zip(tracks, artists))):
+        con.executemany('INSERT INTO tracks VALUES(?, ?, ?)', batch)
+        con.executemany('INSERT INTO track_artists VALUES(?, ?)',
+                        [(artist, track) for track, _, artist in batch])
+
+    spare: List[str] = tracks[-max(len(tracks) // 10, 1):]
+    listed: List[str] = tracks[:-len(spare)]
+    playlists: List[str] = [str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                            for _ in range(scale.playlists)]
+    for batch in batches((playlist, f'playlist {i}', rng.choice(users), 0,
+                          json.dumps(rng.sample(listed, min(scale.playlist_size, len(listed)))))
+                         for i, playlist in enumerate(playlists)):
+        con.executemany('INSERT INTO playlists(uuid, title, creator, access, tracks, version) '
+                        'VALUES(?, ?, ?, ?, ?, 0)', batch)
+    con.commit()
+    con.close()
+
+    os.makedirs(storage_path, exist_ok=True)
+    audio: bytes = mp3_bytes(scale.file_kb * 1024)
+    streamable: List[str] = tracks[:scale.files]
+    for track in streamable:
+        with open(os.path.join(storage_path, track + '.mp3'), 'wb') as file:
+            file.write(audio)
+
+    return Dataset(users, tracks, streamable, spare, playlists, WORDS)
+
+
+def prepare_workdir(workdir: str, scale: Scale, seed_value: int) -> Tuple[dict, Dataset]:
+    '''
+    Makes workdir current directory with copy of config, so database, storage and caches
+    of app are created there, creates schema and seeds it. Returns loaded config and dataset
+    '''
+    shutil.copy(os.path.join(REPOSITORY, 'config.toml'), workdir)
+    os.chdir(workdir)
+    if REPOSITORY not in sys.path:
+        sys.path.insert(0, REPOSITORY)
+
+    from src.config import config
+    from src.bootstrap import bootstrap
+
+    bootstrap(config)
+
+    started: float = time.perf_counter()
+    dataset: Dataset = seed(config['db_path'], config['storage_path'], config['salt'],
+                            scale, seed_value)
+    print(f'Seeded {scale} in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+    return config, dataset
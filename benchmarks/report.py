@@ -0,0 +1,86 @@
+'''
+Contains statistics of benchmark runs, saving of baselines and comparison with them
+'''
+import json
+import math
+from typing import Dict, List, Mapping, Optional
+
+
+def percentile(values: List[float], share: float) -> float:
+    '''
+    Returns nearest-rank percentile of sorted values, share is from 0 to 1
+    '''
+    if not values:
+        return 0.0
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    '''
+    Returns throughput and latency percentiles in milliseconds of one scenario
+    '''
+    values: List[float] = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / seconds, 2) if seconds > 0 else 0.0,
+        'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+        'p90_ms': round(percentile(values, 0.9) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def compare(results: Mapping[str, Mapping[str, float]], baseline: Mapping,
+            threshold: float, min_delta_ms: float = 0.5) -> List[str]:
+    '''
+    Returns regressions of results against baseline: p50 or p99 latency grown
+    by more than threshold (share, e.g. 0.2) and min_delta_ms, throughput fallen
+    by more than threshold, or new errors.
+    Baseline may override threshold of scenario in its "thresholds" mapping
+    '''
+    regressions: List[str] = []
+    for name, old in baseline.get('results', {}).items():
+        new: Optional[Mapping[str, float]] = results.get(name)
+        if new is None:
+            continue
+        limit: float = baseline.get('thresholds', {}).get(name, threshold)
+        for key in ('p50_ms', 'p99_ms'):
+            if (old[key] > 0 and new[key] > old[key] * (1 + limit)
+                    and new[key] - old[key] > min_delta_ms):
+                regressions.append(f'{name}: {key} {old[key]} -> {new[key]} '
+                                   f'(+{(new[key] / old[key] - 1) * 100:.0f}%)')
+        if old['rps'] > 0 and new['rps'] < old['rps'] * (1 - limit):
+            regressions.append(f'{name}: rps {old["rps"]} -> {new["rps"]} '
+                               f'({(new["rps"] / old["rps"] - 1) * 100:.0f}%)')
+        if new['errors'] > old['errors']:
+            regressions.append(f'{name}: errors {old["errors"]} -> {new["errors"]}')
+    return regressions
+
+
+def format_table(results: Mapping[str, Mapping[str, float]]) -> str:
+    '''
+    Returns results as text table
+    '''
+    columns: List[str] = ['requests', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms']
+    lines: List[str] = [f'{"scenario":<16}' + ''.join(f'{column:>11}' for column in columns)]
+    for name, result in results.items():
+        lines.append(f'{name:<16}' + ''.join(f'{result[column]:>11}' for column in columns))
+    return '\n'.join(lines)
+
+
+def save(path: str, meta: Mapping, results: Mapping[str, Mapping[str, float]]):
+    '''
+    Writes results with run parameters as baseline JSON
+    '''
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'meta': meta, 'thresholds': {}, 'results': results}, file, indent=2)
+        file.write('\n')
+
+
+def load(path: str) -> dict:
+    '''
+    Reads baseline JSON
+    '''
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
@@ -0,0 +1,263 @@
+'''
+Runs benchmarks of API endpoints in-process against seeded temporary database and storage
+
+    python -m benchmarks.run --scale small --save baseline.json
+    python -m benchmarks.run --scale small --compare baseline.json
+
+Exits with code 1 if results regressed against compared baseline
+'''
+import argparse
+import asyncio
+import itertools
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional
+
+from benchmarks.client import ASGIClient, Result, multipart
+from benchmarks.dataset import PASSWORD, SCALES, Dataset, Scale, mp3_bytes, prepare_workdir
+from benchmarks.report import compare, format_table, load, save, summarize
+
+
+UPLOAD_KB: int = 64
+
+
+class Context(NamedTuple):
+    '''
+    Seeded dataset, tokens of users by worker and admin token
+    '''
+    client: ASGIClient
+    dataset: Dataset
+    tokens: List[str]
+    admin_token: str
+    rng: random.Random
+    writes: Iterator[int]
+
+
+Scenario = Callable[[Context, int], Awaitable[Result]]
+
+
+def bearer(token: str) -> Dict[str, str]:
+    '''
+    Returns authorization header with token
+    '''
+    return {'Authorization': 'Bearer ' + token}
+
+
+async def login(ctx: Context, worker: int) -> Result:
+    '''
+    POST /login of random user
+    '''
+    body: bytes = f'username={ctx.rng.choice(ctx.dataset.users)}&password={PASSWORD}'.encode()
+    return await ctx.client.request('POST', '/login', headers={
+        'Content-Type': 'application/x-www-form-urlencoded'}, body=body)
+
+
+async def playlist(ctx: Context, worker: int) -> Result:
+    '''
+    GET /playlist of random playlist
+    '''
+    return await ctx.client.request('GET', '/playlist',
+                                    {'playlist_id': ctx.rng.choice(ctx.dataset.playlists)},
+                                    bearer(ctx.tokens[worker]))
+
+
+async def search(ctx: Context, worker: int) -> Result:
+    '''
+    GET /playlist/search of random word in random playlist
+    '''
+    return await ctx.client.request('GET', '/playlist/search',
+                                    {'playlist_id': ctx.rng.choice(ctx.dataset.playlists),
+                                     'search_str': ctx.rng.choice(ctx.dataset.words)},
+                                    bearer(ctx.tokens[worker]))
+
+
+async def stream(ctx: Context, worker: int) -> Result:
+    '''
+    GET /stream of whole random track file
+    '''
+    return await ctx.client.request('GET', '/stream',
+                                    {'uuid': ctx.rng.choice(ctx.dataset.streamable)},
+                                    bearer(ctx.tokens[worker]))
+
+
+async def add_track(ctx: Context, worker: int) -> Result:
+    '''
+    POST /playlist/add_track of spare track to playlist; every request adds new pair
+    '''
+    playlists: List[str] = ctx.dataset.playlists
+    write: int = next(ctx.writes)
+    return await ctx.client.request('POST', '/playlist/add_track',
+                                    {'playlist_id': playlists[write % len(playlists)],
+                                     'track_id': ctx.dataset.spare[write // len(playlists)
+                                                                   % len(ctx.dataset.spare)]},
+                                    bearer(ctx.admin_token))
+
+
+async def upload(ctx: Context, worker: int) -> Result:
+    '''
+    POST /track/add with small audio file
+    '''
+    body, content_type = multipart({'file': ('track.mp3', mp3_bytes(UPLOAD_KB * 1024),
+                                             'audio/mpeg')})
+    return await ctx.client.request('POST', '/track/add',
+                                    {'title': 'benchmark upload', 'artists': 'artist0'},
+                                    {**bearer(ctx.admin_token), 'Content-Type': content_type},
+                                    body)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    'login': login, 'playlist': playlist, 'search': search, 'stream': stream,
+    'add_track': add_track, 'upload': upload,
+}
+
+
+def failed(result: Result) -> bool:
+    '''
+    Checks if request failed; handlers answer errors with status 200 and "error" field
+    '''
+    return result.status >= 400 or result.body.startswith(b'{"error"')
+
+
+async def run_scenario(ctx: Context, scenario: Scenario, requests: int,
+                       concurrency: int) -> Dict[str, float]:
+    '''
+    Sends requests with concurrency workers and returns their statistics
+    '''
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors: int = 0
+
+    async def worker(index: int):
+        nonlocal errors
+        while next(counter) < requests:
+            started: float = time.perf_counter()
+            result: Result = await scenario(ctx, index)
+            latencies.append(time.perf_counter() - started)
+            errors += failed(result)
+
+    started: float = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def token(client: ASGIClient, username: str, password: str) -> str:
+    '''
+    Logs in and returns access token
+    '''
+    result: Result = await client.request('POST', '/login', headers={
+        'Content-Type': 'application/x-www-form-urlencoded'},
+        body=f'username={username}&password={password}'.encode())
+    if failed(result):
+        raise RuntimeError(f'Cannot login as {username}: {result.body!r}')
+    return result.body.split(b'"access_token":"')[1].split(b'"')[0].decode()
+
+
+async def benchmark(app, dataset: Dataset, admin_password: str, names: List[str],
+                    requests: int, warmup: int, concurrency: int,
+                    seed_value: int) -> Dict[str, Dict[str, float]]:
+    '''
+    Runs lifespan of app and scenarios one after another
+    Every worker is logged in as its own user, so per-user stream limits are not hit
+    '''
+    client = ASGIClient(app)
+    await client.startup()
+    try:
+        tokens: List[str] = [await token(client, dataset.users[index % len(dataset.users)],
+                                         PASSWORD) for index in range(concurrency)]
+        ctx = Context(client, dataset, tokens, await token(client, 'admin', admin_password),
+                      random.Random(seed_value), itertools.count())
+        results: Dict[str, Dict[str, float]] = {}
+        for name in names:
+            await run_scenario(ctx, SCENARIOS[name], warmup, concurrency)
+            results[name] = await run_scenario(ctx, SCENARIOS[name], requests, concurrency)
+            print(f'{name}: {results[name]["rps"]} rps, p99 {results[name]["p99_ms"]} ms',
+                  file=sys.stderr)
+        return results
+    finally:
+        await client.shutdown()
+
+
+def prepare(workdir: str, scale: Scale, seed_value: int):
+    '''
+    Seeds workdir and imports app with limits that would distort results off:
+    rate limits, stream pacing and tracing
+    '''
+    config, dataset = prepare_workdir(workdir, scale, seed_value)
+    config['tracing']['sample_rate'] = 0
+    config['rate_limits']['routes'].clear()
+    config['rate_limits']['routes']['default'] = {}
+    config['rate_limits']['max_in_flight'] = 1 << 30
+    config['stream_rate_multiple'] = 1e6
+
+    import duradora
+    return duradora.app, dataset, config['admin_password']
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    '''
+    Parses arguments, runs benchmarks, prints, saves and compares results
+    '''
+    parser = argparse.ArgumentParser(description='Benchmarks of duradora API endpoints')
+    parser.add_argument('--scale', choices=SCALES, default='small', help='size of dataset')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated scenarios: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests first')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--seed', type=int, default=0, help='seed of dataset and requests')
+    parser.add_argument('--workdir', help='directory for database and storage '
+                                          '(temporary one is removed after run)')
+    parser.add_argument('--save', metavar='PATH', help='save results as baseline JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare results with baseline JSON')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative regression of latency and throughput')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='latency growth below this is never a regression')
+    args = parser.parse_args(argv)
+
+    names: List[str] = [name for name in args.scenarios.split(',') if name]
+    unknown: List[str] = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenarios: ' + ', '.join(unknown))
+    save_path: Optional[str] = os.path.abspath(args.save) if args.save else None
+    baseline: Optional[Mapping] = load(args.compare) if args.compare else None
+
+    cwd: str = os.getcwd()
+    workdir: str = args.workdir or tempfile.mkdtemp(prefix='duradora-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        app, dataset, admin_password = prepare(workdir, SCALES[args.scale], args.seed)
+        results: Dict[str, Dict[str, float]] = asyncio.run(benchmark(
+            app, dataset, admin_password, names, args.requests, args.warmup,
+            args.concurrency, args.seed
+        ))
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_table(results))
+    if save_path is not None:
+        save(save_path, {'scale': args.scale, 'requests': args.requests,
+                         'concurrency': args.concurrency, 'seed': args.seed,
+                         'python': platform.python_version(), 'machine': platform.machine()},
+             results)
+    if baseline is not None:
+        if baseline.get('meta', {}).get('scale') != args.scale:
+            print('Warning: baseline was made with scale ' +
+                  str(baseline.get('meta', {}).get('scale')), file=sys.stderr)
+        regressions: List[str] = compare(results, baseline, args.threshold,
+                                           args.min_delta_ms)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
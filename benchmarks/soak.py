@@ -0,0 +1,431 @@
+'''
+Runs soak test: app in uvicorn subprocess under thousands of concurrent streams and uploads
+while memory, file descriptors, threads, threadpool usage and event loop lag of the server
+are sampled. Report can be saved and compared with report of previous version
+
+    python -m benchmarks.soak --streams 2000 --uploads 50 --duration 300 --save soak.json
+    python -m benchmarks.soak --streams 2000 --uploads 50 --duration 300 --compare soak.json
+
+Exits with code 1 if compared report shows more memory, leaked descriptors or lag
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from benchmarks.client import multipart
+from benchmarks.dataset import PASSWORD, REPOSITORY, SCALES, Dataset, mp3_bytes, prepare_workdir
+from benchmarks.report import load
+
+
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*(?:\{[^}]*\})?) (\S+)$')
+LAG_METRIC: str = 'duradora_event_loop_lag_seconds'
+
+
+class Response(NamedTuple):
+    '''
+    Status, size of body and body if it was kept
+    '''
+    status: int
+    size: int
+    body: bytes
+
+
+def dump_toml(table: Mapping, path: Tuple[str, ...] = ()) -> str:
+    '''
+    Formats config back to TOML: values of table first, then its subtables
+    Supports strings, numbers, booleans and lists of them, as config.toml has
+    '''
+    def key(name: str) -> str:
+        return name if re.fullmatch(r'[A-Za-z0-9_-]+', name) else json.dumps(name)
+
+    def value(item) -> str:
+        if isinstance(item, bool):
+            return 'true' if item else 'false'
+        if isinstance(item, (list, tuple)):
+            return '[' + ', '.join(value(element) for element in item) + ']'
+        if isinstance(item, str):
+            return json.dumps(item)
+        return repr(item)
+
+    lines: List[str] = []
+    if path:
+        lines.append('[' + '.'.join(key(name) for name in path) + ']')
+    lines.extend(f'{key(name)} = {value(item)}' for name, item in table.items()
+                 if not isinstance(item, Mapping))
+    out: str = '\n'.join(lines) + '\n' if lines else ''
+    for name, item in table.items():
+        if isinstance(item, Mapping):
+            out += '\n' + dump_toml(item, path + (name,))
+    return out
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    '''
+    Parses Prometheus text format into values by name with labels
+    '''
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match is not None:
+            values[match.group(1)] = float(match.group(2))
+    return values
+
+
+def process_stats(pid: int) -> Dict[str, float]:
+    '''
+    Returns resident memory in MB, threads and open file descriptors of process from /proc
+    '''
+    stats: Dict[str, float] = {}
+    with open(f'/proc/{pid}/status', encoding='utf-8') as status:
+        for line in status:
+            name, _, rest = line.partition(':')
+            if name == 'VmRSS':
+                stats['rss_mb'] = round(int(rest.split()[0]) / 1024, 1)
+            elif name == 'Threads':
+                stats['threads'] = int(rest)
+    stats['fds'] = len(os.listdir(f'/proc/{pid}/fd'))
+    return stats
+
+
+async def http(port: int, method: str, target: str, headers: Optional[Dict[str, str]] = None,
+               body: bytes = b'', keep: bool = False, read_rate: float = 0) -> Response:
+    '''
+    Sends request over new connection and reads response until server closes it
+    Body is only kept if keep is set; read_rate (bytes per second) throttles reading
+    like slow client does
+    '''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        head: str = f'{method} {target} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n' \
+                    f'Content-Length: {len(body)}\r\n' + \
+                    ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+
+        status: int = int((await reader.readline()).split()[1])
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        size: int = 0
+        chunks: List[bytes] = []
+        started: float = time.monotonic()
+        while True:
+            chunk: bytes = await reader.read(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+            if keep:
+                chunks.append(chunk)
+            if read_rate > 0:
+                await asyncio.sleep(max(started + size / read_rate - time.monotonic(), 0))
+        return Response(status, size, b''.join(chunks))
+    finally:
+        writer.close()
+
+
+class Soak:
+    '''
+    Class that runs load against server and samples its resources
+    '''
+    def __init__(self, port: int, pid: int, dataset: Dataset, admin_password: str):
+        '''
+        Saves server address, process and seeded dataset
+        '''
+        self.port: int = port
+        self.pid: int = pid
+        self.dataset: Dataset = dataset
+        self.admin_password: str = admin_password
+        self.tokens: List[str] = []
+        self.admin_token: str = ''
+        self.done: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.received: int = 0
+        self.samples: List[Dict[str, float]] = []
+        self.stop = asyncio.Event()
+
+    async def login(self, username: str, password: str) -> str:
+        '''
+        Returns access token of user
+        '''
+        response: Response = await http(self.port, 'POST', '/login', {
+            'Content-Type': 'application/x-www-form-urlencoded'},
+            f'username={username}&password={password}'.encode(), keep=True)
+        return json.loads(response.body)['access_token']
+
+    async def sample(self, phase: str) -> Dict[str, float]:
+        '''
+        Adds sample of process stats and metrics; time of /metrics request shows loop lag too
+        '''
+        sample: Dict[str, float] = {'time': round(time.monotonic(), 2), 'phase': phase}
+        sample.update(process_stats(self.pid))
+        started: float = time.perf_counter()
+        try:
+            response: Response = await http(self.port, 'GET', '/metrics', keep=True)
+            sample['metrics_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            metrics: Dict[str, float] = parse_metrics(response.body.decode())
+            sample['threadpool_busy'] = metrics.get('duradora_threadpool_threads{state="busy"}', 0)
+            sample['streams_in_flight'] = metrics.get('duradora_streams_in_flight', 0)
+            sample['cached_files'] = metrics.get('duradora_file_cache_entries', 0)
+            if LAG_METRIC in metrics:
+                sample['loop_lag_ms'] = round(metrics[LAG_METRIC] * 1000, 2)
+        except (OSError, ValueError, IndexError) as e:
+            self.errors['metrics ' + type(e).__name__] += 1
+        sample['streams_done'] = self.done['stream']
+        sample['uploads_done'] = self.done['upload']
+        self.samples.append(sample)
+        return sample
+
+    async def streamer(self, index: int, read_rate: float):
+        '''
+        Streams random tracks one after another until stopped
+        '''
+        rng = random.Random(index)
+        token: str = self.tokens[index % len(self.tokens)]
+        while not self.stop.is_set():
+            try:
+                response: Response = await http(
+                    self.port, 'GET', '/stream?uuid=' + rng.choice(self.dataset.streamable),
+                    {'Authorization': 'Bearer ' + token}, read_rate=read_rate
+                )
+                self.received += response.size
+                if response.status == 200:
+                    self.done['stream'] += 1
+                else:
+                    self.errors[f'stream {response.status}'] += 1
+                    await asyncio.sleep(1)
+            except (OSError, ValueError, IndexError) as e:
+                self.errors['stream ' + type(e).__name__] += 1
+                await asyncio.sleep(1)
+
+    async def uploader(self, upload_kb: int):
+        '''
+        Uploads new tracks one after another until stopped
+        '''
+        body, content_type = multipart({'file': ('soak.mp3', mp3_bytes(upload_kb * 1024),
+                                                 'audio/mpeg')})
+        while not self.stop.is_set():
+            try:
+                response: Response = await http(
+                    self.port, 'POST', '/track/add?title=soak',
+                    {'Authorization': 'Bearer ' + self.admin_token,
+                     'Content-Type': content_type}, body, keep=True
+                )
+                if response.status == 200 and not response.body.startswith(b'{"error"'):
+                    self.done['upload'] += 1
+                else:
+                    self.errors[f'upload {response.status}'] += 1
+                    await asyncio.sleep(1)
+            except (OSError, ValueError, IndexError) as e:
+                self.errors['upload ' + type(e).__name__] += 1
+                await asyncio.sleep(1)
+
+    async def run(self, streams: int, uploads: int, duration: float, interval: float,
+                  settle: float, read_rate: float, upload_kb: int, ramp: float):
+        '''
+        Samples idle server, runs load for duration seconds sampling every interval,
+        then stops it and samples again after settle seconds
+        Clients are started evenly during ramp seconds
+        '''
+        self.tokens = [await self.login(username, PASSWORD)
+                       for username in self.dataset.users[:max(min(streams, 100), 1)]]
+        self.admin_token = await self.login('admin', self.admin_password)
+        await self.sample('idle')
+
+        tasks: List[asyncio.Task] = []
+        started: float = time.monotonic()
+        next_sample: float = started + interval
+        clients: List = [(self.streamer, (index, read_rate)) for index in range(streams)] + \
+                        [(self.uploader, (upload_kb,)) for _ in range(uploads)]
+        for number, (client, args) in enumerate(clients):
+            tasks.append(asyncio.create_task(client(*args)))
+            await asyncio.sleep(max(started + ramp * (number + 1) / len(clients)
+                                    - time.monotonic(), 0))
+            if time.monotonic() >= next_sample:
+                await self.sample('ramp')
+                next_sample += interval
+        while time.monotonic() < started + duration:
+            await asyncio.sleep(max(min(next_sample, started + duration) - time.monotonic(), 0))
+            if time.monotonic() >= next_sample:
+                self.print(await self.sample('load'))
+                next_sample += interval
+
+        self.stop.set()
+        await asyncio.wait(tasks, timeout=max(settle, 1) * 10)
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(settle)
+        await self.sample('settled')
+
+    def print(self, sample: Mapping[str, float]):
+        '''
+        Prints progress line
+        '''
+        print(' '.join(f'{name}={value}' for name, value in sample.items()
+                       if name not in ('time', 'phase')), file=sys.stderr)
+
+
+def summarize(samples: List[Dict[str, float]], done: Counter, errors: Counter,
+              received: int) -> Dict[str, float]:
+    '''
+    Returns peaks of samples and growth of memory and descriptors from idle to settled server
+    Every file in file cache keeps descriptor of its map, so they do not count as leaked
+    '''
+    idle: Dict[str, float] = samples[0]
+    settled: Dict[str, float] = samples[-1]
+
+    def peak(name: str) -> float:
+        return max((sample.get(name, 0) for sample in samples), default=0)
+
+    leaked: int = int(settled['fds'] - settled.get('cached_files', 0)
+                      - idle['fds'] + idle.get('cached_files', 0))
+
+    return {
+        'rss_idle_mb': idle['rss_mb'], 'rss_peak_mb': peak('rss_mb'),
+        'rss_settled_mb': settled['rss_mb'],
+        'rss_growth_mb': round(settled['rss_mb'] - idle['rss_mb'], 1),
+        'fds_idle': idle['fds'], 'fds_peak': peak('fds'), 'fds_leaked': leaked,
+        'threads_peak': peak('threads'), 'threadpool_busy_peak': peak('threadpool_busy'),
+        'streams_in_flight_peak': peak('streams_in_flight'),
+        'loop_lag_peak_ms': peak('loop_lag_ms'), 'metrics_peak_ms': peak('metrics_ms'),
+        'streams_done': done['stream'], 'uploads_done': done['upload'],
+        'received_mb': round(received / 2 ** 20, 1), 'errors': sum(errors.values()),
+    }
+
+
+def compare(summary: Mapping[str, float], old: Mapping[str, float], threshold: float,
+            fd_tolerance: int = 8) -> List[str]:
+    '''
+    Returns regressions of summary against old one: peak and settled memory,
+    threadpool usage and lag grown by more than threshold, or more leaked descriptors
+    '''
+    regressions: List[str] = []
+    for key in ('rss_peak_mb', 'rss_growth_mb', 'threadpool_busy_peak', 'loop_lag_peak_ms'):
+        if key in old and summary[key] > max(old[key], 1) * (1 + threshold):
+            regressions.append(f'{key}: {old[key]} -> {summary[key]}')
+    if summary['fds_leaked'] > old.get('fds_leaked', 0) + fd_tolerance:
+        regressions.append(f'fds_leaked: {old.get("fds_leaked", 0)} -> {summary["fds_leaked"]}')
+    return regressions
+
+
+def raise_fd_limit():
+    '''
+    Raises soft limit of open files to hard one; server process inherits it
+    '''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def start_server(workdir: str, port: int) -> subprocess.Popen:
+    '''
+    Starts uvicorn with app in workdir and waits until it answers
+    '''
+    env: Dict[str, str] = dict(os.environ, PYTHONPATH=REPOSITORY)
+    with open(os.path.join(workdir, 'server.log'), 'wb') as log:
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'duradora:app',
+                                   '--port', str(port), '--log-level', 'warning',
+                                   '--no-access-log'],
+                                  cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline: float = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            if asyncio.run(http(port, 'GET', '/metrics')).status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    with open(os.path.join(workdir, 'server.log'), encoding='utf-8', errors='replace') as log:
+        raise RuntimeError('Server did not start:\n' + log.read()[-2000:])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    '''
+    Parses arguments, prepares server, runs soak test, prints, saves and compares report
+    '''
+    parser = argparse.ArgumentParser(description='Soak test of duradora server')
+    parser.add_argument('--scale', choices=SCALES, default='small', help='size of dataset')
+    parser.add_argument('--streams', type=int, default=1000, help='concurrent stream clients')
+    parser.add_argument('--uploads', type=int, default=10, help='concurrent upload clients')
+    parser.add_argument('--upload-kb', type=int, default=8192, help='size of uploaded file')
+    parser.add_argument('--read-kbps', type=float, default=0,
+                        help='read rate of stream clients, 0 reads as fast as sent')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds to start all clients')
+    parser.add_argument('--interval', type=float, default=2, help='seconds between samples')
+    parser.add_argument('--settle', type=float, default=5,
+                        help='seconds to wait after load before last sample')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0, help='seed of dataset')
+    parser.add_argument('--workdir', help='directory for database, storage and server log '
+                                          '(temporary one is removed after run)')
+    parser.add_argument('--save', metavar='PATH', help='save report as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare with report JSON')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative growth of memory, threadpool usage and lag')
+    args = parser.parse_args(argv)
+
+    save_path: Optional[str] = os.path.abspath(args.save) if args.save else None
+    old: Optional[Mapping] = load(args.compare) if args.compare else None
+    raise_fd_limit()
+
+    cwd: str = os.getcwd()
+    workdir: str = args.workdir or tempfile.mkdtemp(prefix='duradora-soak-')
+    os.makedirs(workdir, exist_ok=True)
+    server: Optional[subprocess.Popen] = None
+    try:
+        config, dataset = prepare_workdir(workdir, SCALES[args.scale], args.seed)
+        config['tracing']['sample_rate'] = 0
+        config['rate_limits']['routes'] = {'default': {}}
+        config['rate_limits']['max_in_flight'] = 1 << 30
+        config['stream_max_per_user'] = args.streams + 1
+        config['stream_max_per_node'] = args.streams + 1
+        with open('config.toml', 'w', encoding='utf-8') as file:
+            file.write(dump_toml(config))
+
+        server = start_server(workdir, args.port)
+        soak = Soak(args.port, server.pid, dataset, config['admin_password'])
+        asyncio.run(soak.run(args.streams, args.uploads, args.duration, args.interval,
+                             args.settle, args.read_kbps * 1000, args.upload_kb, args.ramp))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary: Dict[str, float] = summarize(soak.samples, soak.done, soak.errors, soak.received)
+    print('\n'.join(f'{name:<24}{value}' for name, value in summary.items()))
+    for error, count in soak.errors.most_common():
+        print(f'error {error}: {count}')
+    if save_path is not None:
+        with open(save_path, 'w', encoding='utf-8') as file:
+            json.dump({'meta': {key: value for key, value in vars(args).items()
+                                if key not in ('save', 'compare', 'workdir')} |
+                               {'python': platform.python_version(), 'machine': platform.machine()},
+                       'summary': summary, 'errors': dict(soak.errors), 'samples': soak.samples},
+                      file, indent=2)
+            file.write('\n')
+    if old is not None:
+        regressions: List[str] = compare(summary, old['summary'], args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
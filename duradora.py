@@ -1,39 +1,152 @@
 '''
 Main file with all endpoints
 '''
-from typing import Annotated, List
+from contextlib import asynccontextmanager
+from typing import Annotated, List, Optional
 
-from fastapi import FastAPI, Depends, UploadFile, File
+from fastapi import FastAPI, Depends, UploadFile, File, Request, Query
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
 
+from src.config import config
+from src.caching import HTTPCache
+from src.encoding import ResponseEncoder
+from src.ratelimit import RateLimitMiddleware
+from src.metrics import MetricsMiddleware, registry, threadpool_usage
+from src.tracing import TracingMiddleware
+from src.resources import Resources
+from src.bootstrap import bootstrap
 from src.responses import Success, Error
 
 from src.db.user_controller import User
-from src.auth import Auth, Token, RegisterUser
+from src.auth import Auth, Token, RegisterUser, oauth2_scheme, optional_oauth2_scheme
 from src.users import UserHandler
+from src.admin import AdminHandler
+from src.db.querylog import SlowQuery
+from src.watchdog import BlockedStack
 
 from src.db.track_controller import DBTrack
+from src.db.play_controller import PlayCount, ChartEntry
 from src.tracks import TrackHandler, TrackWithFile, DBTrackWithFile, TrackUUID
 
-from src.playlists import PlaylistHandler, PlaylistForCreation, PlaylistUUID, DBPlaylist
+from src.shuffle import ShuffleWindow
+from src.playlists import (PlaylistHandler, PlaylistForCreation, PlaylistUUID, DBPlaylist,
+                           PlaylistDelta, PlaylistBatch, RelatedTrack)
 
 
-auth = Auth()
-tracks = TrackHandler()
-playlists = PlaylistHandler()
-users = UserHandler()
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    '''
+    Initializes database once for all workers, creates shared resources and handlers on them,
+    runs background work while app is running and closes everything on shutdown
+    '''
+    bootstrap()
+    resources = Resources()
+    users = UserHandler(resources)
+    app.state.resources = resources
+    app.state.auth = Auth(resources)
+    app.state.users = users
+    app.state.tracks = TrackHandler(resources, users)
+    app.state.playlists = PlaylistHandler(resources, users)
+    app.state.admin = AdminHandler(resources, users)
+    app.state.cache = HTTPCache(config['cache'])
+    app.state.encoder = ResponseEncoder(config['compression'])
+    resources.start()
+    try:
+        yield
+    finally:
+        await resources.close()
+
+
+async def get_auth(request: Request) -> Auth:
+    '''
+    Returns auth handler of app
+    '''
+    return request.app.state.auth
+
+async def get_users(request: Request) -> UserHandler:
+    '''
+    Returns user handler of app
+    '''
+    return request.app.state.users
+
+async def get_tracks(request: Request) -> TrackHandler:
+    '''
+    Returns track handler of app
+    '''
+    return request.app.state.tracks
+
+async def get_playlists(request: Request) -> PlaylistHandler:
+    '''
+    Returns playlist handler of app
+    '''
+    return request.app.state.playlists
+
+async def get_admin(request: Request) -> AdminHandler:
+    '''
+    Returns admin handler of app
+    '''
+    return request.app.state.admin
+
+async def get_cache(request: Request) -> HTTPCache:
+    '''
+    Returns HTTP cache validator of app
+    '''
+    return request.app.state.cache
+
+async def get_encoder(request: Request) -> ResponseEncoder:
+    '''
+    Returns response encoder of app
+    '''
+    return request.app.state.encoder
+
+
+AuthDep = Annotated[Auth, Depends(get_auth)]
+Users = Annotated[UserHandler, Depends(get_users)]
+Tracks = Annotated[TrackHandler, Depends(get_tracks)]
+Playlists = Annotated[PlaylistHandler, Depends(get_playlists)]
+Admin = Annotated[AdminHandler, Depends(get_admin)]
+Cache = Annotated[HTTPCache, Depends(get_cache)]
+Encoder = Annotated[ResponseEncoder, Depends(get_encoder)]
+
+
+async def current_user(auth: AuthDep,
+                       token: Annotated[str, Depends(oauth2_scheme)]) -> User | Error:
+    '''
+    Returns user of JWT or credentials error
+    '''
+    return await auth.get_current_user(token)
+
+async def optional_user(
+    auth: AuthDep, token: Annotated[Optional[str], Depends(optional_oauth2_scheme)]
+) -> Optional[User]:
+    '''
+    Returns user of JWT or None if there is no valid one
+    '''
+    return await auth.get_optional_user(token)
+
+
+Executor = Annotated[User, Depends(current_user)]
+OptionalExecutor = Annotated[Optional[User], Depends(optional_user)]
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RateLimitMiddleware, identify=Auth.token_username)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+registry.callback('duradora_threadpool_threads', 'Threads of default threadpool', 'gauge',
+                  ('state',), threadpool_usage)
 
 @app.post('/register', response_model=Success | Error)
-async def register(user: RegisterUser) -> Success | Error:
+async def register(auth: AuthDep, user: RegisterUser) -> Success | Error:
     '''
     Registers new user
     '''
     return await auth.register_user(user)
 
 @app.post('/login', response_model=Token | Error)
-async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token | Error:
+async def login(auth: AuthDep,
+                form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token | Error:
     '''
     Attempts to login with username and password
     If succeeds, returns JWT token for authorization
@@ -41,8 +154,7 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> T
     return await auth.login_user(User(username=form_data.username, password=form_data.password))
 
 @app.post('/user/update', response_model=Success | Error)
-async def update_user(executor: Annotated[User, Depends(auth.get_current_user)],
-                      user: User) -> Success | Error:
+async def update_user(users: Users, executor: Executor, user: User) -> Success | Error:
     '''
     Attempts to update user. Is in authorized zone.
     Works only if executor is admin or if executor updates themself.
@@ -51,7 +163,7 @@ async def update_user(executor: Annotated[User, Depends(auth.get_current_user)],
     return await users.update_user(executor.username, user)
 
 @app.post('/track/add', response_model=TrackUUID | Error)
-async def add_track(executor: Annotated[User, Depends(auth.get_current_user)],
+async def add_track(tracks: Tracks, executor: Executor,
                     title: str | None = None, artists: str | None = None,
                     file: Annotated[UploadFile, File()] = None) -> TrackUUID | Error:
     '''
@@ -61,7 +173,7 @@ async def add_track(executor: Annotated[User, Depends(auth.get_current_user)],
                                   TrackWithFile(title=title, artists=artists, file=file))
 
 @app.post('/track/update', response_model=TrackUUID | Error)
-async def update_track(executor: Annotated[User, Depends(auth.get_current_user)],
+async def update_track(tracks: Tracks, executor: Executor,
                        uuid: str, title: str | None = None, artists: str | None = None,
                        file: Annotated[UploadFile, File()] = None) -> TrackUUID | Error:
     '''
@@ -73,21 +185,83 @@ async def update_track(executor: Annotated[User, Depends(auth.get_current_user)]
     )
 
 @app.get('/track', response_model=DBTrack | Error)
-async def get_track(uuid: str) -> DBTrack | Error:
+async def get_track(tracks: Tracks, cache: Cache, request: Request, response: Response,
+                    uuid: str) -> DBTrack | Error:
     '''
     Returns track metadata by uuid
+    Answers with 304 if client copy matches If-None-Match
     '''
-    return await tracks.get_track(uuid)
+    track: DBTrack | Error = await tracks.get_track(uuid)
+    if isinstance(track, Error):
+        return track
+    etag: str = cache.etag(track.uuid, track.title, track.artists)
+    return cache.respond(request.headers, response, 'track', etag) or track
 
 @app.get('/stream', response_model=None)
-async def stream_track(uuid: str) -> StreamingResponse | Error:
+async def stream_track(tracks: Tracks, request: Request, executor: OptionalExecutor,
+                       uuid: str) -> StreamingResponse | Response | Error:
     '''
     Streams track by uuid
+    Authorization is optional, it is used to attribute plays and limit streams per user;
+    anonymous streams are limited per client address
+    '''
+    return await tracks.stream_track(uuid, request.headers,
+                                     executor.username if executor is not None else None,
+                                     request.client.host if request.client else None)
+
+@app.get('/track/plays', response_model=List[PlayCount] | Error)
+async def get_track_plays(tracks: Tracks, uuid: str, period: str = 'day',
+                          limit: int = 30) -> List[PlayCount] | Error:
+    '''
+    Returns number of started and completed plays of track in last periods
+    Period is 'hour' or 'day'
+    '''
+    return await tracks.get_plays(uuid, period, limit)
+
+@app.get('/track/related', response_model=List[RelatedTrack] | Error)
+async def get_related_tracks(playlists: Playlists, uuid: str,
+                             limit: int = 10) -> List[RelatedTrack] | Error:
     '''
-    return await tracks.stream_track(uuid)
+    Returns tracks that listeners also added to playlists with this track
+    '''
+    return await playlists.get_related(uuid, limit)
+
+@app.get('/artist/radio', response_model=ShuffleWindow | Error)
+async def artist_radio(tracks: Tracks, artist: str, seed: int | None = None, offset: int = 0,
+                       limit: int = 20, weighted: bool = False) -> ShuffleWindow | Error:
+    '''
+    Returns window of shuffled queue of artist tracks
+    Pass returned seed to get next windows of the same queue
+    '''
+    return await tracks.artist_radio(artist, seed, offset, limit, weighted)
+
+@app.get('/charts/top', response_model=List[ChartEntry] | Error)
+async def get_top_tracks(tracks: Tracks, period: str = 'day', bucket: int | None = None,
+                         limit: int = 50) -> List[ChartEntry] | Error:
+    '''
+    Returns most played tracks of day, week or all time
+    Bucket is unix time inside wanted period, current one by default
+    '''
+    return await tracks.get_top_tracks(period, bucket, limit)
+
+@app.get('/charts/artist', response_model=List[ChartEntry] | Error)
+async def get_artist_top(tracks: Tracks, artist: str, limit: int = 50) -> List[ChartEntry] | Error:
+    '''
+    Returns most played tracks of artist
+    '''
+    return await tracks.get_artist_top(artist, limit)
+
+@app.get('/track/peaks', response_model=None)
+async def get_track_peaks(tracks: Tracks, request: Request, uuid: str,
+                          resolution: int = 1024) -> Response | Error:
+    '''
+    Returns precomputed waveform peaks of track as bytes 0..255
+    Resolution is the desired number of peaks, nearest stored one is returned
+    '''
+    return await tracks.get_peaks(uuid, resolution, request.headers)
 
 @app.post('/playlist', response_model=PlaylistUUID | Error)
-async def create_playlist(executor: Annotated[User, Depends(auth.get_current_user)],
+async def create_playlist(playlists: Playlists, executor: Executor,
                           playlist: PlaylistForCreation) -> PlaylistUUID | Error:
     '''
     Creates playlist for user executor. Is in authorized zone
@@ -95,16 +269,65 @@ async def create_playlist(executor: Annotated[User, Depends(auth.get_current_use
     return await playlists.create_playlist_for_user(executor.username, playlist)
 
 @app.get('/playlist', response_model=DBPlaylist | Error)
-async def get_playlist(executor: Annotated[User, Depends(auth.get_current_user)],
-                       playlist_id: str) -> DBPlaylist | Error:
+async def get_playlist(playlists: Playlists, cache: Cache, request: Request, response: Response,
+                       executor: Executor, playlist_id: str) -> DBPlaylist | Error:
     '''
     Shows playlist by id. Is in authorized zone
     Does not show private playlists of others to non-admins
+    Answers with 304 if client copy matches If-None-Match
+    '''
+    playlist: DBPlaylist | Error = await playlists.get_playlist(executor.username, playlist_id)
+    if isinstance(playlist, Error):
+        return playlist
+    etag: str = cache.etag(playlist.uuid, playlist.version)
+    return cache.respond(request.headers, response, 'playlist', etag) or playlist
+
+@app.get('/playlist/changes', response_model=PlaylistDelta | Error)
+async def get_playlist_changes(playlists: Playlists, executor: Executor,
+                               playlist_id: str, since: int) -> PlaylistDelta | Error:
+    '''
+    Returns track list changes of playlist made after version since
+    If they are too old, returns the whole track list with full = true
+    '''
+    return await playlists.get_changes(executor.username, playlist_id, since)
+
+@app.get('/playlist/shuffle', response_model=ShuffleWindow | Error)
+async def shuffle_playlist(playlists: Playlists, executor: Executor,
+                           playlist_id: str, seed: int | None = None, offset: int = 0,
+                           limit: int = 20, weighted: bool = False) -> ShuffleWindow | Error:
+    '''
+    Returns window of shuffled playlist with track metadata
+    Pass returned seed to get next windows of the same order
+    '''
+    return await playlists.shuffle_playlist(executor.username, playlist_id, seed,
+                                            offset, limit, weighted)
+
+@app.get('/playlist/stream', response_model=None)
+async def stream_playlist(tracks: Tracks, playlists: Playlists, request: Request,
+                          executor: Executor, playlist_id: str,
+                          start: int = 0) -> StreamingResponse | Response | Error:
     '''
-    return await playlists.get_playlist(executor.username, playlist_id)
+    Streams tracks of playlist starting from position start without gaps
+    Every track is a part of multipart/mixed response with X-Track-Id header
+    Counts as one stream in limits and pacing of /stream
+    '''
+    playlist = await playlists.get_playlist(executor.username, playlist_id)
+    if isinstance(playlist, Error):
+        return playlist
+    return await tracks.stream_tracks(playlist.tracks[max(start, 0):], executor.username,
+                                      request.client.host if request.client else None)
+
+@app.get('/playlist/events', response_model=None)
+async def watch_playlists(playlists: Playlists, executor: Executor,
+                          playlist_id: Annotated[List[str], Query()]) -> StreamingResponse | Error:
+    '''
+    Opens server-sent events stream that notifies about new versions of playlists
+    Access is checked like in GET /playlist
+    '''
+    return await playlists.watch_playlists(executor.username, playlist_id)
 
 @app.post('/playlist/add_track', response_model=Success | Error)
-async def add_track_to_playlist(executor: Annotated[User, Depends(auth.get_current_user)],
+async def add_track_to_playlist(playlists: Playlists, executor: Executor,
                                 playlist_id: str, track_id: str) -> Success | Error:
     '''
     Adds track to playlist
@@ -113,7 +336,7 @@ async def add_track_to_playlist(executor: Annotated[User, Depends(auth.get_curre
     return await playlists.add_track_to_playlist(executor.username, playlist_id, track_id)
 
 @app.post('/playlist/remove_track', response_model=Success | Error)
-async def remove_track_from_playlist(executor: Annotated[User, Depends(auth.get_current_user)],
+async def remove_track_from_playlist(playlists: Playlists, executor: Executor,
                                      playlist_id: str, track_id: str) -> Success | Error:
     '''
     Removes track from playlist
@@ -121,19 +344,66 @@ async def remove_track_from_playlist(executor: Annotated[User, Depends(auth.get_
     '''
     return await playlists.remove_track_from_playlist(executor.username, playlist_id, track_id)
 
+@app.post('/playlist/batch', response_model=Success | Error)
+async def update_playlist_tracks(playlists: Playlists, executor: Executor,
+                                 batch: PlaylistBatch) -> Success | Error:
+    '''
+    Applies list of add/remove/move operations to playlist in one transaction
+    Can only be performed by its creator or an admin
+    '''
+    return await playlists.apply_batch(executor.username, batch)
+
 @app.get('/user/{username}/playlists', response_model=List[DBPlaylist])
-async def show_user_playlists(executor: Annotated[User, Depends(auth.get_current_user)],
-                              username: str) -> List[DBPlaylist]:
+async def show_user_playlists(playlists: Playlists, encoder: Encoder, request: Request,
+                              executor: Executor, username: str) -> Response:
     '''
     Shows playlist created by username
     If executor is not admin and not username, shows only public ones
+    Response is compressed and may be MessagePack, depending on request headers
     '''
-    return await playlists.show_user_playlists(executor.username, username)
+    return encoder.encode(request.headers,
+                          await playlists.show_user_playlists(executor.username, username))
 
 @app.get('/playlist/search', response_model=List[DBTrack] | Error)
-async def search_playlist(executor: Annotated[User, Depends(auth.get_current_user)],
-                          playlist_id: str, search_str: str) -> List[DBTrack] | Error:
+async def search_playlist(playlists: Playlists, encoder: Encoder, request: Request,
+                          executor: Executor, playlist_id: str, search_str: str) -> Response:
     '''
     Tries to search by track name in playlists
+    Response is compressed and may be MessagePack, depending on request headers
+    '''
+    return encoder.encode(
+        request.headers,
+        await playlists.search_playlist(executor.username, playlist_id, search_str)
+    )
+
+@app.get('/admin/slow_queries', response_model=List[SlowQuery] | Error)
+async def slow_queries(admin: Admin, executor: Executor) -> List[SlowQuery] | Error:
+    '''
+    Returns slowest SQL statements of this worker with their query plans
+    Can only be done by admin
+    '''
+    return await admin.slow_queries(executor.username)
+
+@app.get('/admin/blocking', response_model=List[BlockedStack] | Error)
+async def blocking_calls(admin: Admin, executor: Executor) -> List[BlockedStack] | Error:
+    '''
+    Returns stacks of calls that blocked event loop of this worker longer than threshold
+    Can only be done by admin
+    '''
+    return await admin.blocking_calls(executor.username)
+
+@app.get('/admin/profile', response_model=None)
+async def profile(admin: Admin, executor: Executor,
+                  seconds: float = 10, interval_ms: float = 10) -> PlainTextResponse | Error:
+    '''
+    Profiles this worker for given time and returns collapsed stacks of all threads
+    Can only be done by admin
+    '''
+    return await admin.profile(executor.username, seconds, interval_ms)
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    '''
+    Returns metrics of this worker in Prometheus text format
     '''
-    return await playlists.search_playlist(executor.username, playlist_id, search_str)
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
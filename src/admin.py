@@ -0,0 +1,62 @@
+'''
+Module for diagnostics of running worker that are available only to admins
+'''
+from typing import List
+
+from fastapi.responses import PlainTextResponse
+
+from src.config import config
+from src.db.querylog import QueryLog, SlowQuery, query_log
+from src.profiler import SamplingProfiler
+from src.resources import Resources
+from src.responses import Error
+from src.users import UserHandler
+from src.watchdog import BlockedStack, LoopWatchdog
+
+
+class AdminHandler:
+    '''
+    Class that handles diagnostic requests of admins
+    '''
+    def __init__(self, resources: Resources, user_handler: UserHandler):
+        '''
+        Initializes query log and profiler of this worker, takes event loop watchdog
+        from shared resources
+        '''
+        self.user_handler: UserHandler = user_handler
+        self.query_log: QueryLog = query_log
+        self.profiler = SamplingProfiler(config['profile_max_seconds'],
+                                         config['profile_min_interval_ms'] / 1000)
+        self.watchdog: LoopWatchdog = resources.watchdog
+
+    async def slow_queries(self, executor: str) -> List[SlowQuery] | Error:
+        '''
+        Returns slowest SQL statements of this worker, slowest first
+        Can only be done by admin
+        '''
+        if not self.user_handler.is_admin(executor):
+            return Error(error="This user has no rights to execute this command")
+        return self.query_log.report()
+
+    async def blocking_calls(self, executor: str) -> List[BlockedStack] | Error:
+        '''
+        Returns stacks of calls that blocked event loop of this worker, most frequent first
+        Can only be done by admin
+        '''
+        if not self.user_handler.is_admin(executor):
+            return Error(error="This user has no rights to execute this command")
+        return self.watchdog.report()
+
+    async def profile(self, executor: str, seconds: float,
+                      interval_ms: float) -> PlainTextResponse | Error:
+        '''
+        Samples stacks of all threads of this worker for given time
+        and returns them collapsed, ready for flame graph tools
+        Can only be done by admin
+        '''
+        if not self.user_handler.is_admin(executor):
+            return Error(error="This user has no rights to execute this command")
+        out = await self.profiler.profile(seconds, interval_ms / 1000)
+        if out is None:
+            return Error(error="Profiler is already running")
+        return PlainTextResponse(out)
@@ -0,0 +1,122 @@
+'''
+Contains admission control and bandwidth shaping of streams: concurrency limits and token buckets
+'''
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class TokenBucket:
+    '''
+    Token bucket refilled at rate tokens per second up to capacity
+    Tokens may be borrowed: taking more than there is leaves a debt
+    and returns time to wait until it is paid, which paces the caller
+    '''
+    def __init__(self, rate: float, capacity: float):
+        '''
+        Starts with full bucket
+        '''
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        '''
+        Adds tokens for time passed since last refill. Lock should be held
+        '''
+        now: float = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        '''
+        Takes amount of tokens and returns seconds to wait before using them
+        '''
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+            return max(-self.tokens / self.rate, 0.0)
+
+    def try_take(self, amount: float = 1) -> float:
+        '''
+        Takes amount of tokens only if there are enough of them
+        Returns 0 on success, otherwise seconds until they will be available
+        '''
+        with self.lock:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+
+class StreamAdmission:
+    '''
+    Class that counts streams of this worker by client (user or IP)
+    and paces them at a multiple of their bitrate sharing optional node egress limit
+    '''
+    def __init__(self, per_client: int, per_node: int, rate_multiple: float,
+                 burst_seconds: float, node_bytes_per_second: float):
+        '''
+        Saves limits. Node egress is not limited if node_bytes_per_second is 0
+        '''
+        self.per_client: int = per_client
+        self.per_node: int = per_node
+        self.rate_multiple: float = rate_multiple
+        self.burst_seconds: float = burst_seconds
+        self.node: Optional[TokenBucket] = None
+        if node_bytes_per_second > 0:
+            self.node = TokenBucket(node_bytes_per_second, node_bytes_per_second)
+        self.active: Counter = Counter()
+        self.total: int = 0
+        self.rejected: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def acquire(self, client: str) -> Optional[int]:
+        '''
+        Tries to start stream of client
+        Returns None if it is admitted, otherwise status code to reject it with:
+        429 if client has too many streams, 503 if worker is full
+        '''
+        with self.lock:
+            status: Optional[int] = None
+            if self.active[client] >= self.per_client:
+                status = 429
+            elif self.total >= self.per_node:
+                status = 503
+            if status is not None:
+                self.rejected[status] += 1
+                return status
+            self.active[client] += 1
+            self.total += 1
+        return None
+
+    def release(self, client: str):
+        '''
+        Marks end of stream of client
+        '''
+        with self.lock:
+            self.active[client] -= 1
+            if self.active[client] <= 0:
+                del self.active[client]
+            self.total -= 1
+
+    def pacer(self, bitrate: int) -> TokenBucket:
+        '''
+        Returns bucket for stream of given bitrate (bits per second)
+        First burst_seconds of audio are sent at once, the rest at rate_multiple of bitrate
+        '''
+        rate: float = bitrate / 8 * self.rate_multiple
+        return TokenBucket(rate, max(bitrate / 8 * self.burst_seconds, 1))
+
+    def delay(self, pacer: TokenBucket, size: int) -> float:
+        '''
+        Returns seconds to wait before sending size bytes of stream
+        '''
+        wait: float = pacer.take(size)
+        if self.node is not None:
+            wait = max(wait, self.node.take(size))
+        return wait
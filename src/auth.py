@@ -6,16 +6,18 @@ from datetime import datetime, timedelta, timezone
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from pydantic import BaseModel
 
 from src.db.user_controller import UserController, User
 from src.config import config
+from src.resources import Resources
 from src.hashes import SHA256Hasher
 from src.responses import Error, Success
+from src.tracing import trace_methods
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login', auto_error=False)
 
 class Token(BaseModel):
     '''
@@ -40,15 +42,16 @@ class RegisterUser(BaseModel):
     password: str
 
 
+@trace_methods
 class Auth:
     '''
     Class for handling user authorization via JWT
     '''
-    def __init__(self):
+    def __init__(self, resources: Resources):
         '''
-        Initializes user db controller and hasher
+        Takes user controller from shared resources and initializes hasher
         '''
-        self.controller = UserController(config['db_path'])
+        self.controller: UserController = resources.users
         self.hasher = SHA256Hasher(config['salt'])
 
     def get_user(self, username: str) -> Optional[User]:
@@ -77,20 +80,30 @@ class Auth:
         expires += timedelta(minutes=config['access_token_expire_minutes'])
 
         to_encode.update({'exp': expires})
+        from jose import jwt  # imported on first use, it is slow to import
         encoded_jwt: str = jwt.encode(to_encode, config['secret_key'], algorithm=config['algorithm'])
         return encoded_jwt
 
-    async def get_current_user(self, token: Annotated[str, Depends(oauth2_scheme)]) -> User | Error:
+    @staticmethod
+    def token_username(token: str) -> Optional[str]:
         '''
-        Tries to extract user from given JWT. Returns user or credentials error
+        Returns username from JWT if its signature is valid, without looking it up in database
+        Needs no handler, so middlewares can use it before app starts
         '''
-        creds_error = Error(error='invalid credentials')
+        from jose import JWTError, jwt  # imported on first use, it is slow to import
         try:
             payload: dict = jwt.decode(token, config['secret_key'], algorithms=[config['algorithm']])
-            username: str = payload.get('username')
-            if username is None:
-                return creds_error
         except JWTError:
+            return None
+        return payload.get('username')
+
+    async def get_current_user(self, token: Annotated[str, Depends(oauth2_scheme)]) -> User | Error:
+        '''
+        Tries to extract user from given JWT. Returns user or credentials error
+        '''
+        creds_error = Error(error='invalid credentials')
+        username: Optional[str] = self.token_username(token)
+        if username is None:
             return creds_error
 
         user: Optional[User] = self.get_user(username)
@@ -98,6 +111,20 @@ class Auth:
             return creds_error
         return user
 
+    async def get_optional_user(
+        self, token: Annotated[Optional[str], Depends(optional_oauth2_scheme)]
+    ) -> Optional[User]:
+        '''
+        Same as get_current_user, but for endpoints that also work without authorization
+        Returns None if there is no token or it is invalid
+        '''
+        if token is None:
+            return None
+        user: User | Error = await self.get_current_user(token)
+        if isinstance(user, Error):
+            return None
+        return user
+
     async def register_user(self, user: RegisterUser) -> Success | Error:
         '''
         Tries to add user into database
@@ -0,0 +1,44 @@
+'''
+Contains one-time initialization of database: schema and admin user
+'''
+import fcntl
+import sqlite3
+from typing import Mapping
+
+from src.config import config
+from src.db.schema import SCHEMA_VERSION, create_schema
+from src.db.user_controller import UserController, User
+from src.hashes import SHA256Hasher
+
+
+def schema_version(con: sqlite3.Connection) -> int:
+    '''
+    Returns version of schema saved in database
+    '''
+    return con.execute('PRAGMA user_version').fetchone()[0]
+
+
+def bootstrap(settings: Mapping = config):
+    '''
+    Creates schema and admin user if database is not initialized with current schema version
+    Workers starting together take file lock next to database, so only the first one
+    does the work and the others see the new version; initialized database is only read
+    '''
+    con = sqlite3.connect(settings['db_path'])
+    try:
+        if schema_version(con) >= SCHEMA_VERSION:
+            return
+        with open(settings['db_path'] + '.lock', 'wb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if schema_version(con) >= SCHEMA_VERSION:
+                return
+            create_schema(con)
+            controller = UserController(con)
+            if controller.find_user('admin') is None:
+                hasher = SHA256Hasher(settings['salt'])
+                controller.create_user(User(username='admin', is_admin=True,
+                                            password=hasher.hexdigest(settings['admin_password'])))
+            con.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            con.commit()
+    finally:
+        con.close()
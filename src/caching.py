@@ -0,0 +1,87 @@
+'''
+Contains helpers for HTTP caching: validators, conditional requests and Cache-Control policies
+'''
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Dict, Mapping, Optional, Tuple
+
+from fastapi import Response
+
+
+class HTTPCache:
+    '''
+    Class that builds ETag/Last-Modified validators, answers conditional requests
+    and sets Cache-Control according to per-endpoint policies
+    '''
+    def __init__(self, policies: Mapping[str, str]):
+        '''
+        Saves Cache-Control values by endpoint name
+        '''
+        self.policies: Mapping[str, str] = policies
+
+    def etag(self, *parts) -> str:
+        '''
+        Returns strong ETag derived from given values (row contents or version)
+        '''
+        return '"' + blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest() + '"'
+
+    def file_validators(self, path: str) -> Optional[Tuple[str, float, int]]:
+        '''
+        Returns ETag, modification time and size of file, or None if there is no such file
+        Needs only one stat call, so it replaces existence check
+        '''
+        try:
+            stat: os.stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return self.stat_validators(stat)
+
+    def stat_validators(self, stat: os.stat_result) -> Tuple[str, float, int]:
+        '''
+        Returns ETag, modification time and size of file from its stat result
+        '''
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', stat.st_mtime, stat.st_size
+
+    def is_fresh(self, request_headers: Mapping[str, str],
+                 etag: str, last_modified: Optional[float] = None) -> bool:
+        '''
+        Checks If-None-Match and If-Modified-Since headers of request
+        Returns True if client copy is still valid and 304 can be sent
+        '''
+        if_none_match: Optional[str] = request_headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+
+        if_modified_since: Optional[str] = request_headers.get('if-modified-since')
+        if if_modified_since is None or last_modified is None:
+            return False
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def headers(self, endpoint: str, etag: str,
+                last_modified: Optional[float] = None) -> Dict[str, str]:
+        '''
+        Returns caching headers for response of endpoint
+        '''
+        out: Dict[str, str] = {'ETag': etag}
+        if endpoint in self.policies:
+            out['Cache-Control'] = self.policies[endpoint]
+        if last_modified is not None:
+            out['Last-Modified'] = formatdate(last_modified, usegmt=True)
+        return out
+
+    def respond(self, request_headers: Mapping[str, str], response: Response, endpoint: str,
+                etag: str, last_modified: Optional[float] = None) -> Optional[Response]:
+        '''
+        Returns empty 304 response if client copy is valid
+        Otherwise sets caching headers on response and returns None
+        '''
+        headers: Dict[str, str] = self.headers(endpoint, etag, last_modified)
+        if self.is_fresh(request_headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return None
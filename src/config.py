@@ -1,4 +1,45 @@
+'''
+Contains config of app read from config.toml of working directory
+'''
 import tomllib
+from typing import Iterator, MutableMapping, Optional
 
-with open('config.toml', 'rb') as config_file:
-    config = tomllib.load(config_file)
+
+class Config(MutableMapping):
+    '''
+    Mapping that reads toml file on first access, so importing modules does no I/O
+    and the file is taken from working directory of the moment config is needed
+    '''
+    def __init__(self, path: str):
+        '''
+        Saves path of file
+        '''
+        self.path: str = path
+        self.data: Optional[dict] = None
+
+    def load(self) -> dict:
+        '''
+        Reads file if it is not read yet and returns its tables
+        '''
+        if self.data is None:
+            with open(self.path, 'rb') as config_file:
+                self.data = tomllib.load(config_file)
+        return self.data
+
+    def __getitem__(self, key: str):
+        return self.load()[key]
+
+    def __setitem__(self, key: str, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key: str):
+        del self.load()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+
+config = Config('config.toml')
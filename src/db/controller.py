@@ -1,21 +1,81 @@
 '''
 Base class for all DB controllers
 '''
+import contextlib
+import functools
+import inspect
 import sqlite3
+import time
+from typing import Callable, Iterator
+
+from src.metrics import db_seconds
+from src.db.querylog import TracedCursor
+
+
+def untimed(method: Callable) -> Callable:
+    '''
+    Marks controller method that does not use database, so it is not timed
+    '''
+    method.untimed = True
+    return method
+
+
+def timed(controller: str, method: Callable) -> Callable:
+    '''
+    Wraps controller method so its duration is observed in db_seconds metric
+    '''
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started: float = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            db_seconds.observe(controller, method.__name__, value=time.perf_counter() - started)
+    return wrapper
+
 
 class Controller:
     '''
     Base class for all DB controllers
+    Public methods of subclasses are timed, and every statement is traced by cursor
+    Rows are converted to models without validation, since they come from our own tables
     '''
-    def __init__(self, database: str):
+    def __init_subclass__(cls, **kwargs):
+        '''
+        Wraps public methods defined in subclass with timing
+        '''
+        super().__init_subclass__(**kwargs)
+        for name, method in list(vars(cls).items()):
+            if (inspect.isfunction(method) and not name.startswith('_')
+                    and not getattr(method, 'untimed', False)):
+                setattr(cls, name, timed(cls.__name__, method))
+
+    def __init__(self, database: str | sqlite3.Connection):
+        '''
+        Opens connection to database at path or uses given shared connection, and saves cursor
+        '''
+        self.owns_connection: bool = isinstance(database, str)
+        self.con: sqlite3.Connection = (sqlite3.connect(database) if self.owns_connection
+                                        else database)
+        self.cur: sqlite3.Cursor = self.con.cursor(factory=TracedCursor)
+
+    @untimed
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
         '''
-        Opens connection to database and saves cursor
+        Commits statements executed in block, or rolls them back if block raises,
+        so a failed write does not stay pending on connection shared with other controllers
         '''
-        self.con: sqlite3.Connection = sqlite3.connect(database)
-        self.cur: sqlite3.Cursor = self.con.cursor()
+        try:
+            yield
+        except BaseException:
+            self.con.rollback()
+            raise
+        self.con.commit()
 
     def __del__(self):
         '''
-        Closes the connection when object is deleted
+        Closes the connection when object is deleted, unless it is shared
         '''
-        self.con.close()
+        if self.owns_connection:
+            self.con.close()
@@ -0,0 +1,143 @@
+'''
+A higher-level API for SQL tables "plays", "play_rollups" and charts built from them
+'''
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.db.controller import Controller, untimed
+from src.db.track_controller import split_artists
+
+
+# track, username ('' for anonymous), event ('start' or 'complete'), unix time
+PlayEvent = Tuple[str, str, str, int]
+
+# period ('hour' or 'day'), bucket start time, track, username, starts, completes
+PlayRollup = Tuple[str, int, str, str, int, int]
+
+# period ('day', 'week' or 'all'), bucket start time (0 for 'all'), track, plays
+ChartRow = Tuple[str, int, str, int]
+
+
+class PlayCount(BaseModel):
+    '''
+    Pydantic model representing number of plays of track in one period
+    '''
+    bucket: int
+    starts: int
+    completes: int
+
+
+class ChartEntry(BaseModel):
+    '''
+    Pydantic model representing track in chart
+    '''
+    uuid: str
+    title: str | None = None
+    artists: str | None = None
+    plays: int
+
+
+class PlayController(Controller):
+    '''
+    Class that provides higher-level API for append-only table "plays",
+    its hourly and daily rollups in table "play_rollups"
+    and charts in tables "charts" and "artist_charts".
+    Rollups and charts are materialized: they are updated from new events only
+    '''
+
+    def record(self, events: List[PlayEvent], rollups: List[PlayRollup],
+               charts: List[ChartRow]):
+        '''
+        Appends events and adds their counts to rollups and charts in one transaction
+        '''
+        with self.transaction():
+            self.cur.executemany('INSERT INTO plays VALUES(?, ?, ?, ?)', events)
+            self.cur.executemany(
+                'INSERT INTO play_rollups VALUES(?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(period, bucket, track, username) DO UPDATE SET '
+                'starts = starts + excluded.starts, completes = completes + excluded.completes',
+                rollups
+            )
+            self.cur.executemany(
+                'INSERT INTO charts VALUES(?, ?, ?, ?) '
+                'ON CONFLICT(period, bucket, track) DO UPDATE SET plays = plays + excluded.plays',
+                charts
+            )
+            self.add_artist_plays({track: plays for period, _, track, plays in charts
+                                   if period == 'all'})
+
+    def add_artist_plays(self, plays: Dict[str, int]):
+        '''
+        Adds plays of tracks to charts of their artists. Does not commit
+        '''
+        tracks: List[str] = list(plays)
+        rows: List[Tuple[str, str, int]] = []
+        for i in range(0, len(tracks), 500):
+            chunk: List[str] = tracks[i:i + 500]
+            self.cur.execute('SELECT uuid, artists FROM tracks WHERE uuid IN (' +
+                             ', '.join('?' * len(chunk)) + ')', chunk)
+            for track, artists in self.cur.fetchall():
+                rows += [(artist, track, plays[track]) for artist in split_artists(artists)]
+        self.cur.executemany(
+            'INSERT INTO artist_charts VALUES(?, ?, ?) '
+            'ON CONFLICT(artist, track) DO UPDATE SET plays = plays + excluded.plays',
+            rows
+        )
+
+    def prune_charts(self, period: str, bucket: int):
+        '''
+        Removes charts of period that start before bucket
+        '''
+        self.cur.execute('DELETE FROM charts WHERE period = ? AND bucket < ?', (period, bucket))
+        self.con.commit()
+
+    def top_tracks(self, period: str, bucket: int, limit: int) -> List[ChartEntry]:
+        '''
+        Returns most played tracks of period starting at bucket
+        '''
+        self.cur.execute('SELECT charts.track, tracks.title, tracks.artists, charts.plays '
+                         'FROM charts LEFT JOIN tracks ON tracks.uuid = charts.track '
+                         'WHERE charts.period = ? AND charts.bucket = ? '
+                         'ORDER BY charts.plays DESC LIMIT ?', (period, bucket, limit))
+        return list(map(self.chart_entry, self.cur.fetchall()))
+
+    def artist_top(self, artist: str, limit: int) -> List[ChartEntry]:
+        '''
+        Returns most played tracks of artist of all time
+        '''
+        self.cur.execute('SELECT artist_charts.track, tracks.title, tracks.artists, '
+                         'artist_charts.plays FROM artist_charts '
+                         'LEFT JOIN tracks ON tracks.uuid = artist_charts.track '
+                         'WHERE artist_charts.artist = ? '
+                         'ORDER BY artist_charts.plays DESC LIMIT ?', (artist, limit))
+        return list(map(self.chart_entry, self.cur.fetchall()))
+
+    def play_counts(self, tracks: List[str]) -> Dict[str, int]:
+        '''
+        Returns all-time number of plays of tracks that were played at least once
+        '''
+        out: Dict[str, int] = {}
+        for i in range(0, len(tracks), 500):
+            chunk: List[str] = tracks[i:i + 500]
+            self.cur.execute("SELECT track, plays FROM charts WHERE period = 'all' AND bucket = 0 "
+                             "AND track IN (" + ', '.join('?' * len(chunk)) + ")", chunk)
+            out.update(self.cur.fetchall())
+        return out
+
+    @untimed
+    def chart_entry(self, t: Tuple[str, Optional[str], Optional[str], int]) -> ChartEntry:
+        '''
+        Converts database entry into ChartEntry
+        '''
+        return ChartEntry.model_construct(uuid=t[0], title=t[1], artists=t[2], plays=t[3])
+
+    def track_plays(self, track: str, period: str, limit: int) -> List[PlayCount]:
+        '''
+        Returns plays of track by all users in last limit periods, newest first
+        '''
+        self.cur.execute('SELECT bucket, SUM(starts), SUM(completes) FROM play_rollups '
+                         'WHERE track = ? AND period = ? GROUP BY bucket '
+                         'ORDER BY bucket DESC LIMIT ?', (track, period, limit))
+        out: List[Tuple[int, int, int]] = self.cur.fetchall()
+        return [PlayCount.model_construct(bucket=t[0], starts=t[1], completes=t[2]) for t in out]
@@ -1,14 +1,19 @@
 '''
 A higher-level API for SQL table "playlists"
 '''
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Literal, Set, Dict
+from collections import Counter, defaultdict
+from itertools import combinations, permutations
+import heapq
 import uuid
 from enum import IntEnum
 import json
+import sqlite3
 
 from pydantic import BaseModel
 
-from src.db.controller import Controller
+from src.db.controller import Controller, untimed
+from src.db.track_controller import DBTrack
 
 
 class Access(IntEnum):
@@ -33,14 +38,101 @@ class Playlist(BaseModel):
 class DBPlaylist(Playlist):
     '''
     Pydantic model representing playlist stored in database
+    Version grows by one on every update
     '''
     uuid: str
+    version: int = 0
+
+
+class PlaylistChange(BaseModel):
+    '''
+    Pydantic model representing one change of playlist track list
+    Applying changes in order to old track list gives the new one
+    '''
+    version: int
+    op: Literal['add', 'remove', 'move']
+    track: str
+    position: int | None = None
+
+
+class RelatedTrack(DBTrack):
+    '''
+    Pydantic model representing track together with number of playlists
+    in which it occurs with another track
+    '''
+    weight: int
+
+
+PlaylistEntry = Tuple[str, str, str, int, str, int]
+PlaylistVersion = Tuple[str, int, str, int]
+
+
+def diff_tracks(old: List[str], new: List[str]) -> List[Tuple[str, str, Optional[int]]]:
+    '''
+    Returns (op, track, position) operations that turn old track list into new one
+    Tracks in playlist are unique, so removes go first, then every position of new list
+    is fixed by either moving a present track or adding a missing one
+    '''
+    new_set = set(new)
+    ops: List[Tuple[str, str, Optional[int]]] = [('remove', track, None)
+                                                 for track in old if track not in new_set]
+    current: List[str] = [track for track in old if track in new_set]
+    present = set(current)
+
+    for i, track in enumerate(new):
+        if i < len(current) and current[i] == track:
+            continue
+        if track in present:
+            current.remove(track)
+            ops.append(('move', track, i))
+        else:
+            present.add(track)
+            ops.append(('add', track, i))
+        current.insert(i, track)
+    return ops
+
+
+def cooccurrence_delta(old: List[str], new: List[str],
+                       max_size: int) -> List[Tuple[str, str, int]]:
+    '''
+    Returns changes of co-occurrence counts (track, other track, delta) in both directions
+    when playlist track list changes from old to new.
+    Playlists longer than max_size do not count, so a change never costs more than max_size^2
+    '''
+    old_set: Set[str] = set(old) if len(old) <= max_size else set()
+    new_set: Set[str] = set(new) if len(new) <= max_size else set()
+    kept: List[str] = list(old_set & new_set)
+
+    pairs: List[Tuple[str, str, int]] = []
+    for changed, delta in ((old_set - new_set, -1), (new_set - old_set, 1)):
+        changed_pairs = list(combinations(changed, 2)) + [(a, b) for a in changed for b in kept]
+        for first, second in changed_pairs:
+            pairs.append((first, second, delta))
+            pairs.append((second, first, delta))
+    return pairs
 
 
 class PlaylistController(Controller):
     '''
-    Class that provides higher-level API for SQL table "playlists"
+    Class that provides higher-level API for SQL table "playlists",
+    its change log in table "playlist_changes"
+    and track co-occurrence counts in table "related_tracks"
     '''
+    def __init__(self, database: str | sqlite3.Connection, changelog_versions: int = 100,
+                 related_max_playlist: int = 500, related_top: int = 50,
+                 related_max_delta: int = 20000):
+        '''
+        Opens connection to database or uses given one
+        Change log keeps only changes of last changelog_versions versions of every playlist
+        Only public playlists with at most related_max_playlist tracks count for related tracks,
+        every track keeps only related_top most related ones, and changes of more than
+        related_max_delta counts are left to background rebuild
+        '''
+        super().__init__(database)
+        self.changelog_versions: int = changelog_versions
+        self.related_max_playlist: int = related_max_playlist
+        self.related_top: int = related_top
+        self.related_max_delta: int = related_max_delta
 
     def create_playlist(self, playlist: Playlist) -> str:
         '''
@@ -48,25 +140,31 @@ class PlaylistController(Controller):
         Returns uuid of new playlist
         '''
         playlist_id: str = str(uuid.uuid4())
-        self.cur.execute('INSERT INTO playlists VALUES(?, ?, ?, ?, ?)',
-                         (playlist_id,
-                          playlist.title,
-                          playlist.creator,
-                          int(playlist.access),
-                          json.dumps(playlist.tracks)))
-        self.con.commit()
+        with self.transaction():
+            self.cur.execute('INSERT INTO playlists(uuid, title, creator, access, tracks, version) '
+                             'VALUES(?, ?, ?, ?, ?, 0)',
+                             (playlist_id,
+                              playlist.title,
+                              playlist.creator,
+                              int(playlist.access),
+                              json.dumps(playlist.tracks)))
+            if playlist.access == Access.PUBLIC:
+                self.add_cooccurrences(cooccurrence_delta([], playlist.tracks,
+                                                          self.related_max_playlist))
         return playlist_id
 
-    def playlist_from_entry(self, t: Tuple[str, str, str, int, str]) -> DBPlaylist:
+    @untimed
+    def playlist_from_entry(self, t: PlaylistEntry) -> DBPlaylist:
         '''
         Converts database entry into DBPlaylist
         '''
-        return DBPlaylist(
+        return DBPlaylist.model_construct(
             uuid=t[0],
             title=t[1],
             creator=t[2],
             access=Access(t[3]),
-            tracks=json.loads(t[4])
+            tracks=json.loads(t[4]),
+            version=t[5]
         )
 
     def find_playlist(self, uuid_str: str) -> Optional[DBPlaylist]:
@@ -74,32 +172,163 @@ class PlaylistController(Controller):
         Tries to find playilst by uuid
         Returns DBPlaylist if found, otherwise None
         '''
-        self.cur.execute('SELECT * FROM playlists WHERE uuid = ?', (uuid_str,))
-        out: Optional[Tuple[str, str, str, int, str]] = self.cur.fetchone()
+        self.cur.execute('SELECT uuid, title, creator, access, tracks, version FROM playlists '
+                         'WHERE uuid = ?', (uuid_str,))
+        out: Optional[PlaylistEntry] = self.cur.fetchone()
         if out is not None:
             return self.playlist_from_entry(out)
         return None
 
+    def playlist_versions(self, uuids: List[str]) -> List[PlaylistVersion]:
+        '''
+        Returns uuid, version, creator and access of found playlists without their track lists
+        '''
+        self.cur.execute('SELECT uuid, version, creator, access FROM playlists '
+                         f'WHERE uuid IN ({", ".join("?" * len(uuids))})', uuids)
+        return self.cur.fetchall()
+
     def user_playlists(self, username: str) -> List[DBPlaylist]:
         '''
         Returns all playlists with creator == username as list
         '''
-        self.cur.execute('SELECT * FROM playlists WHERE creator = ?', (username,))
-        out: List[Tuple[str, str, str, int, str]] = self.cur.fetchall()
+        self.cur.execute('SELECT uuid, title, creator, access, tracks, version FROM playlists '
+                         'WHERE creator = ?', (username,))
+        out: List[PlaylistEntry] = self.cur.fetchall()
         return list(map(self.playlist_from_entry, out))
 
     def update_playlist(self, playlist: DBPlaylist):
         '''
         Updates dbplaylist with playlist.uuid with new values
+        Bumps its version, writes track list changes to change log and compacts the log,
+        updates co-occurrence counts of changed tracks, counting tracks of playlist
+        only while it is public
+        Sets playlist.version to the new version
         '''
-        self.cur.execute(
-            'UPDATE playlists SET title = ?, creator = ?, access = ?, tracks = ? WHERE uuid = ?',
-            (
-                playlist.title,
-                playlist.creator,
-                int(playlist.access),
-                json.dumps(playlist.tracks),
-                playlist.uuid
+        self.cur.execute('SELECT tracks, version, access FROM playlists WHERE uuid = ?',
+                         (playlist.uuid,))
+        out: Optional[Tuple[str, int, int]] = self.cur.fetchone()
+        if out is None:
+            return
+        version: int = out[1] + 1
+        old: List[str] = json.loads(out[0])
+        counted_old: List[str] = old if out[2] == Access.PUBLIC else []
+        counted_new: List[str] = playlist.tracks if playlist.access == Access.PUBLIC else []
+
+        with self.transaction():
+            self.cur.execute(
+                'UPDATE playlists SET title = ?, creator = ?, access = ?, tracks = ?, version = ? '
+                'WHERE uuid = ?',
+                (
+                    playlist.title,
+                    playlist.creator,
+                    int(playlist.access),
+                    json.dumps(playlist.tracks),
+                    version,
+                    playlist.uuid
+                )
             )
+            self.cur.executemany(
+                'INSERT INTO playlist_changes VALUES(?, ?, ?, ?, ?)',
+                [(playlist.uuid, version, op, track, position)
+                 for op, track, position in diff_tracks(old, playlist.tracks)]
+            )
+            self.cur.execute('DELETE FROM playlist_changes WHERE playlist = ? AND version <= ?',
+                             (playlist.uuid, version - self.changelog_versions))
+            self.add_cooccurrences(cooccurrence_delta(counted_old, counted_new,
+                                                      self.related_max_playlist))
+        playlist.version = version
+
+    def add_cooccurrences(self, pairs: List[Tuple[str, str, int]]):
+        '''
+        Adds deltas to co-occurrence counts, removes pairs that do not co-occur anymore
+        and keeps only related_top pairs of every track that gained some
+        More than related_max_delta deltas are not applied, counts are marked stale instead
+        Does not commit
+        '''
+        if len(pairs) > self.related_max_delta:
+            self.cur.execute('UPDATE related_state SET stale = 1')
+            return
+        self.cur.executemany(
+            'INSERT INTO related_tracks VALUES(?, ?, ?) '
+            'ON CONFLICT(track, other) DO UPDATE SET weight = weight + excluded.weight',
+            pairs
+        )
+        self.cur.executemany(
+            'DELETE FROM related_tracks WHERE track = ? AND other = ? AND weight <= 0',
+            [(track, other) for track, other, delta in pairs if delta < 0]
+        )
+        self.cur.executemany(
+            'DELETE FROM related_tracks WHERE track = ?1 AND other NOT IN '
+            '(SELECT other FROM related_tracks WHERE track = ?1 '
+            'ORDER BY weight DESC, other LIMIT ?2)',
+            [(track, self.related_top) for track in {track for track, _, delta in pairs
+                                                     if delta > 0}]
         )
-        self.con.commit()
+
+    def related_stale(self) -> bool:
+        '''
+        Returns whether co-occurrence counts need rebuild
+        '''
+        self.cur.execute('SELECT stale FROM related_state')
+        out: Optional[Tuple[int]] = self.cur.fetchone()
+        return out is not None and bool(out[0])
+
+    def rebuild_related(self) -> bool:
+        '''
+        Recomputes co-occurrence counts of public playlists, keeping related_top of every track
+        Counts are computed without holding write lock and written only if no playlist
+        has changed meanwhile, which also clears stale mark
+        Returns whether counts were written
+        '''
+        state_sql: str = 'SELECT COUNT(*), TOTAL(version) FROM playlists'
+        self.cur.execute(state_sql)
+        state: Tuple[int, float] = self.cur.fetchone()
+        self.cur.execute('SELECT tracks FROM playlists WHERE access = ?', (int(Access.PUBLIC),))
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        for (tracks,) in self.cur.fetchall():
+            unique: Set[str] = set(json.loads(tracks))
+            if len(unique) <= self.related_max_playlist:
+                for track, other in permutations(unique, 2):
+                    counts[track][other] += 1
+        rows: List[Tuple[str, str, int]] = [
+            (track, other, weight) for track, others in counts.items()
+            for other, weight in heapq.nsmallest(self.related_top, others.items(),
+                                                 key=lambda t: (-t[1], t[0]))
+        ]
+
+        with self.transaction():
+            self.cur.execute('BEGIN IMMEDIATE')
+            self.cur.execute(state_sql)
+            if tuple(self.cur.fetchone()) != tuple(state):
+                return False
+            self.cur.execute('DELETE FROM related_tracks')
+            self.cur.executemany('INSERT INTO related_tracks VALUES(?, ?, ?)', rows)
+            self.cur.execute('UPDATE related_state SET stale = 0')
+        return True
+
+    def related_tracks(self, track: str, limit: int) -> List[RelatedTrack]:
+        '''
+        Returns tracks that occur in the same playlists as track most often
+        '''
+        self.cur.execute('SELECT related_tracks.other, tracks.title, tracks.artists, '
+                         'related_tracks.weight FROM related_tracks '
+                         'LEFT JOIN tracks ON tracks.uuid = related_tracks.other '
+                         'WHERE related_tracks.track = ? '
+                         'ORDER BY related_tracks.weight DESC LIMIT ?', (track, limit))
+        return [RelatedTrack.model_construct(uuid=t[0], title=t[1], artists=t[2], weight=t[3])
+                for t in self.cur.fetchall()]
+
+    def changes_since(self, playlist: DBPlaylist, version: int) -> Optional[List[PlaylistChange]]:
+        '''
+        Returns changes of playlist made after version
+        Returns None if they were already compacted away and full track list is needed
+        '''
+        if version < 0 or version > playlist.version:
+            return None
+        if version < playlist.version - self.changelog_versions:
+            return None
+        self.cur.execute('SELECT version, op, track, position FROM playlist_changes '
+                         'WHERE playlist = ? AND version > ? ORDER BY version, rowid',
+                         (playlist.uuid, version))
+        return [PlaylistChange.model_construct(version=t[0], op=t[1], track=t[2], position=t[3])
+                for t in self.cur.fetchall()]
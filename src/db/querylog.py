@@ -0,0 +1,179 @@
+'''
+Contains tracing of SQL statements: cursor that times them and log of slow ones
+'''
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+class SlowQuery(BaseModel):
+    '''
+    Pydantic model representing statement in top of slowest ones
+    '''
+    sql: str
+    caller: str
+    count: int
+    max_ms: float
+    total_ms: float
+    rows: int
+    plan: List[str] = []
+
+
+class QueryLog:
+    '''
+    Class that logs statements slower than threshold with their query plans
+    and keeps top of slowest statements by (sql, caller): when it is full,
+    statement with the smallest maximum duration is replaced
+    '''
+    def __init__(self, threshold: float = 0.05, top: int = 50):
+        '''
+        Saves threshold in seconds and size of top
+        '''
+        self.threshold: float = threshold
+        self.top: int = top
+        self.slowest: Dict[Tuple[str, str], SlowQuery] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, threshold: float, top: int):
+        '''
+        Applies threshold and size of top from config, dropping statements over the new top
+        '''
+        with self.lock:
+            self.threshold = threshold
+            self.top = top
+            while len(self.slowest) > top:
+                del self.slowest[min(self.slowest, key=lambda k: self.slowest[k].max_ms)]
+
+    def explain(self, con: sqlite3.Connection, sql: str, params) -> List[str]:
+        '''
+        Returns EXPLAIN QUERY PLAN of statement, or nothing if it cannot be explained
+        '''
+        if sql.lstrip()[:6].upper() not in ('SELECT', 'UPDATE', 'DELETE'):
+            return []
+        try:
+            return [row[-1] for row in con.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        except sqlite3.Error:
+            return []
+
+    def record(self, con: sqlite3.Connection, sql: str, params, duration: float,
+               rows: int, caller: str):
+        '''
+        Adds finished statement to top and logs it if it is slow
+        '''
+        plan: List[str] = []
+        if duration >= self.threshold:
+            plan = self.explain(con, sql, params)
+            logger.warning('Slow query in %s: %.1f ms, %d rows: %s; plan: %s', caller,
+                           duration * 1000, rows, ' '.join(sql.split()), '; '.join(plan))
+
+        key: Tuple[str, str] = (sql, caller)
+        with self.lock:
+            entry: Optional[SlowQuery] = self.slowest.get(key)
+            if entry is None:
+                if len(self.slowest) >= self.top:
+                    fastest: Tuple[str, str] = min(self.slowest,
+                                                   key=lambda k: self.slowest[k].max_ms)
+                    if self.slowest[fastest].max_ms >= duration * 1000:
+                        return
+                    del self.slowest[fastest]
+                entry = self.slowest[key] = SlowQuery.model_construct(
+                    sql=' '.join(sql.split()), caller=caller, count=0, max_ms=0.0,
+                    total_ms=0.0, rows=0, plan=[]
+                )
+            entry.count += 1
+            entry.total_ms += duration * 1000
+            if duration * 1000 >= entry.max_ms:
+                entry.max_ms = duration * 1000
+                entry.rows = rows
+                entry.plan = plan or entry.plan
+
+    def report(self) -> List[SlowQuery]:
+        '''
+        Returns top of statements, slowest first
+        '''
+        with self.lock:
+            return sorted((entry.model_copy() for entry in self.slowest.values()),
+                          key=lambda entry: entry.max_ms, reverse=True)
+
+
+# Configured by app on startup
+query_log = QueryLog()
+
+
+class TracedCursor(sqlite3.Cursor):
+    '''
+    Cursor that times every statement and reports it to query log and current trace
+    with row count and method that executed it. Time of SELECT includes fetching its rows,
+    so statement is reported when rows are fetched or next statement is executed
+    '''
+    log: QueryLog = query_log
+
+    def __init__(self, *args, **kwargs):
+        '''
+        Starts without pending statement
+        '''
+        super().__init__(*args, **kwargs)
+        self.pending: Optional[tuple] = None
+
+    def finish(self, rows: int):
+        '''
+        Reports pending statement
+        '''
+        if self.pending is not None:
+            sql, params, started, caller = self.pending
+            self.pending = None
+            duration: float = time.perf_counter() - started
+            tracer.add_span('sql', duration, statement=sql, rows=rows, caller=caller)
+            self.log.record(self.connection, sql, params, duration, rows, caller)
+
+    def execute(self, sql: str, params=(), /):
+        '''
+        Executes statement; its report waits for fetch if it returns rows
+        '''
+        self.finish(0)
+        caller: str = sys._getframe(1).f_code.co_qualname
+        started: float = time.perf_counter()
+        super().execute(sql, params)
+        self.pending = (sql, params, started, caller)
+        if self.description is None:
+            self.finish(max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql: str, seq_of_params, /):
+        '''
+        Executes statement for every parameter set and reports them as one statement
+        '''
+        self.finish(0)
+        caller: str = sys._getframe(1).f_code.co_qualname
+        started: float = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        duration: float = time.perf_counter() - started
+        tracer.add_span('sql', duration, statement=sql, rows=max(self.rowcount, 0), caller=caller)
+        self.log.record(self.connection, sql, (), duration, max(self.rowcount, 0), caller)
+        return self
+
+    def fetchone(self):
+        '''
+        Fetches one row and reports statement
+        '''
+        row = super().fetchone()
+        self.finish(int(row is not None))
+        return row
+
+    def fetchall(self) -> list:
+        '''
+        Fetches all rows and reports statement
+        '''
+        rows: list = super().fetchall()
+        self.finish(len(rows))
+        return rows
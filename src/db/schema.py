@@ -0,0 +1,113 @@
+'''
+Contains schema of database
+'''
+import sqlite3
+
+from src.db.track_controller import TrackController
+
+
+SCHEMA_VERSION = 2
+
+
+def create_schema(con: sqlite3.Connection):
+    '''
+    Creates missing tables and indexes and fills derived tables created for existing data
+    Co-occurrence counts are only marked stale, they are rebuilt in background by workers
+    '''
+    cur: sqlite3.Cursor = con.cursor()
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS users(
+                    username STRING PRIMARY KEY,
+                    password STRING,
+                    is_admin BOOLEAN
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS tracks(
+                    uuid STRING PRIMARY KEY,
+                    title STRING,
+                    artists STRING
+    )''')
+
+    artists_exist = cur.execute("SELECT name FROM sqlite_master "
+                                "WHERE type = 'table' AND name = 'track_artists'").fetchone()
+    cur.execute('''CREATE TABLE IF NOT EXISTS track_artists(
+                    artist STRING,
+                    track STRING,
+                    PRIMARY KEY(artist, track)
+    ) WITHOUT ROWID''')
+    if artists_exist is None:
+        TrackController(con).rebuild_artists()
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS playlists(
+                    uuid STRING PRIMARY KEY,
+                    title STRING,
+                    creator STRING,
+                    access INTEGER,
+                    tracks STRING,
+                    version INTEGER DEFAULT 0
+    )''')
+
+    if 'version' not in [column[1] for column in cur.execute('PRAGMA table_info(playlists)')]:
+        cur.execute('ALTER TABLE playlists ADD COLUMN version INTEGER DEFAULT 0')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS playlist_changes(
+                    playlist STRING,
+                    version INTEGER,
+                    op STRING,
+                    track STRING,
+                    position INTEGER
+    )''')
+    cur.execute('CREATE INDEX IF NOT EXISTS playlist_changes_version '
+                'ON playlist_changes(playlist, version)')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS plays(
+                    track STRING,
+                    username STRING,
+                    event STRING,
+                    time INTEGER
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS play_rollups(
+                    period STRING,
+                    bucket INTEGER,
+                    track STRING,
+                    username STRING,
+                    starts INTEGER,
+                    completes INTEGER,
+                    PRIMARY KEY(period, bucket, track, username)
+    ) WITHOUT ROWID''')
+    cur.execute('CREATE INDEX IF NOT EXISTS play_rollups_track '
+                'ON play_rollups(track, period, bucket)')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS charts(
+                    period STRING,
+                    bucket INTEGER,
+                    track STRING,
+                    plays INTEGER,
+                    PRIMARY KEY(period, bucket, track)
+    ) WITHOUT ROWID''')
+    cur.execute('CREATE INDEX IF NOT EXISTS charts_top ON charts(period, bucket, plays DESC)')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS artist_charts(
+                    artist STRING,
+                    track STRING,
+                    plays INTEGER,
+                    PRIMARY KEY(artist, track)
+    ) WITHOUT ROWID''')
+    cur.execute('CREATE INDEX IF NOT EXISTS artist_charts_top ON artist_charts(artist, plays DESC)')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS related_tracks(
+                    track STRING,
+                    other STRING,
+                    weight INTEGER,
+                    PRIMARY KEY(track, other)
+    ) WITHOUT ROWID''')
+    cur.execute('CREATE INDEX IF NOT EXISTS related_tracks_top '
+                'ON related_tracks(track, weight DESC)')
+
+    state_exists = cur.execute("SELECT name FROM sqlite_master "
+                               "WHERE type = 'table' AND name = 'related_state'").fetchone()
+    cur.execute('CREATE TABLE IF NOT EXISTS related_state(stale INTEGER)')
+    if state_exists is None:
+        cur.execute('INSERT INTO related_state VALUES(1)')
+    con.commit()
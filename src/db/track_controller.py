@@ -1,12 +1,12 @@
 '''
 A higher-level API for SQL table "tracks"
 '''
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Dict
 import uuid
 
 from pydantic import BaseModel
 
-from src.db.controller import Controller
+from src.db.controller import Controller, untimed
 
 class Track(BaseModel):
     '''
@@ -30,9 +30,17 @@ class TrackUUID(BaseModel):
     uuid: str
 
 
+def split_artists(artists: Optional[str]) -> List[str]:
+    '''
+    Splits artists string of track into separate artists. They are separated by commas
+    '''
+    return [artist.strip() for artist in (artists or '').split(',') if artist.strip()]
+
+
 class TrackController(Controller):
     '''
     Class that provides higher-level API for SQL table "tracks"
+    and its index of tracks by artist in table "track_artists"
     '''
 
     def create_track(self, track: Track) -> str:
@@ -41,16 +49,19 @@ class TrackController(Controller):
         Returns uuid of new track
         '''
         track_id: str = str(uuid.uuid4())
-        self.cur.execute('INSERT INTO tracks VALUES(?, ?, ?)',
-                         (track_id, track.title, track.artists))
-        self.con.commit()
+        with self.transaction():
+            self.cur.execute('INSERT INTO tracks VALUES(?, ?, ?)',
+                             (track_id, track.title, track.artists))
+            self.cur.executemany('INSERT OR IGNORE INTO track_artists VALUES(?, ?)',
+                                 [(artist, track_id) for artist in split_artists(track.artists)])
         return track_id
 
+    @untimed
     def track_from_entry(self, t: Tuple[str, str, str]) -> DBTrack:
         '''
         Converts database entry into Track
         '''
-        return DBTrack(uuid=t[0], title=t[1], artists=t[2])
+        return DBTrack.model_construct(uuid=t[0], title=t[1], artists=t[2])
 
     def find_track(self, uuid_str: str) -> Optional[DBTrack]:
         '''
@@ -63,10 +74,47 @@ class TrackController(Controller):
             return self.track_from_entry(out)
         return None
 
+    def find_tracks(self, uuids: List[str]) -> List[DBTrack]:
+        '''
+        Finds all tracks with given uuids, querying them in chunks
+        Returns tracks in order of uuids, missing ones are skipped
+        '''
+        found: Dict[str, DBTrack] = {}
+        for i in range(0, len(uuids), 500):
+            chunk: List[str] = uuids[i:i + 500]
+            self.cur.execute(
+                'SELECT * FROM tracks WHERE uuid IN (' + ', '.join('?' * len(chunk)) + ')',
+                chunk
+            )
+            for entry in self.cur.fetchall():
+                found[entry[0]] = self.track_from_entry(entry)
+        return [found[uuid_str] for uuid_str in uuids if uuid_str in found]
+
     def update_track(self, track: DBTrack):
         '''
         Updates dbtrack with track.uuid with new values
         '''
-        self.cur.execute('UPDATE tracks SET title = ?, artists = ? WHERE uuid = ?',
-                         (track.title, track.artists, track.uuid))
-        self.con.commit()
+        with self.transaction():
+            self.cur.execute('UPDATE tracks SET title = ?, artists = ? WHERE uuid = ?',
+                             (track.title, track.artists, track.uuid))
+            self.cur.execute('DELETE FROM track_artists WHERE track = ?', (track.uuid,))
+            self.cur.executemany('INSERT OR IGNORE INTO track_artists VALUES(?, ?)',
+                                 [(artist, track.uuid) for artist in split_artists(track.artists)])
+
+    def artist_track_ids(self, artist: str) -> List[str]:
+        '''
+        Returns uuids of all tracks of artist
+        '''
+        self.cur.execute('SELECT track FROM track_artists WHERE artist = ?', (artist,))
+        return [t[0] for t in self.cur.fetchall()]
+
+    def rebuild_artists(self):
+        '''
+        Recomputes index of tracks by artist from table "tracks"
+        '''
+        with self.transaction():
+            self.cur.execute('DELETE FROM track_artists')
+            self.cur.execute('SELECT uuid, artists FROM tracks')
+            self.cur.executemany('INSERT OR IGNORE INTO track_artists VALUES(?, ?)',
+                                 [(artist, t[0]) for t in self.cur.fetchall()
+                                  for artist in split_artists(t[1])])
@@ -5,7 +5,7 @@ from typing import Optional, Tuple
 
 from pydantic import BaseModel
 
-from src.db.controller import Controller
+from src.db.controller import Controller, untimed
 
 
 class User(BaseModel):
@@ -30,11 +30,12 @@ class UserController(Controller):
                          (user.username, user.password, user.is_admin))
         self.con.commit()
 
+    @untimed
     def user_from_tuple(self, t: Tuple[str, str, bool]) -> User:
         '''
         Converts unnamed tuple with values in right order into user
         '''
-        return User(**{key: t[i] for i, key in enumerate(User.model_fields.keys())})
+        return User.model_construct(username=t[0], password=t[1], is_admin=bool(t[2]))
 
     def find_user(self, username: str) -> Optional[User]:
         '''
@@ -0,0 +1,106 @@
+'''
+Contains content negotiation for API responses: compression and binary encodings
+'''
+import gzip
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Response
+from pydantic_core import to_json, to_jsonable_python
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def parse_quality(header: Optional[str]) -> Dict[str, float]:
+    '''
+    Parses header like Accept or Accept-Encoding into {value: q}
+    '''
+    out: Dict[str, float] = {}
+    for item in (header or '').split(','):
+        value, *params = item.strip().split(';')
+        if not value:
+            continue
+        quality: float = 1.0
+        for param in params:
+            key, _, number = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        out[value.strip().lower()] = quality
+    return out
+
+
+class ResponseEncoder:
+    '''
+    Class that serializes models without revalidating them
+    and encodes them as requested by client headers
+    '''
+    def __init__(self, settings: Mapping[str, int]):
+        '''
+        Saves minimal size for compression and compression levels
+        '''
+        self.min_size: int = settings['min_size']
+        self.gzip_level: int = settings['gzip_level']
+        self.brotli_quality: int = settings['brotli_quality']
+
+    def content_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        '''
+        Returns best supported compression accepted by client, or None
+        '''
+        accepted: Dict[str, float] = parse_quality(accept_encoding)
+        candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+        candidates = [c for c in candidates if accepted.get(c, accepted.get('*', 0)) > 0]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: accepted.get(c, accepted.get('*', 0)))
+
+    def wants_msgpack(self, accept: Optional[str]) -> bool:
+        '''
+        Returns True if client prefers MessagePack and it is available
+        '''
+        if msgpack is None:
+            return False
+        accepted: Dict[str, float] = parse_quality(accept)
+        best: float = max((accepted.get(t, 0) for t in MSGPACK_TYPES), default=0)
+        return best > 0 and best >= accepted.get('application/json', 0)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        '''
+        Compresses body with encoding
+        '''
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def encode(self, request_headers: Mapping[str, str], data: Any) -> Response:
+        '''
+        Serializes data (models or lists of them) straight from their schemas
+        and builds response with negotiated media type and compression
+        '''
+        if self.wants_msgpack(request_headers.get('accept')):
+            body: bytes = msgpack.packb(to_jsonable_python(data))
+            media_type: str = 'application/msgpack'
+        else:
+            body = to_json(data)
+            media_type = 'application/json'
+
+        headers: Dict[str, str] = {'Vary': 'Accept, Accept-Encoding'}
+        if len(body) >= self.min_size:
+            encoding: Optional[str] = self.content_encoding(request_headers.get('accept-encoding'))
+            if encoding is not None:
+                body = self.compress(body, encoding)
+                headers['Content-Encoding'] = encoding
+
+        return Response(content=body, media_type=media_type, headers=headers)
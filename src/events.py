@@ -0,0 +1,104 @@
+'''
+Contains in-process publishing of playlist change notifications to subscribers
+'''
+import asyncio
+import json
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Set
+
+
+class PlaylistEvents:
+    '''
+    Class that fans out playlist change notifications to subscribed queues of this worker
+    Every subscriber has a bounded queue, so slow consumers cannot grow memory:
+    when queue overflows, its backlog is replaced by one "resync" event
+    '''
+    def __init__(self, queue_size: int, keepalive: float):
+        '''
+        Saves queue size for subscribers and keepalive interval in seconds
+        '''
+        self.queue_size: int = queue_size
+        self.keepalive: float = keepalive
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, playlist_ids: Iterable[str]) -> asyncio.Queue:
+        '''
+        Creates queue that receives events of all given playlists
+        '''
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for playlist_id in playlist_ids:
+            self.subscribers.setdefault(playlist_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, playlist_ids: Iterable[str]):
+        '''
+        Removes queue from subscribers of given playlists
+        '''
+        for playlist_id in playlist_ids:
+            queues: Set[asyncio.Queue] = self.subscribers.get(playlist_id, set())
+            queues.discard(queue)
+            if not queues:
+                self.subscribers.pop(playlist_id, None)
+
+    def publish(self, playlist_id: str, version: int):
+        '''
+        Notifies subscribers of playlist that it has changed to version
+        '''
+        event: dict = {'type': 'change', 'playlist': playlist_id, 'version': version}
+        for queue in self.subscribers.get(playlist_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'type': 'resync'})
+
+    async def stream(self, playlist_ids: List[str],
+                     versions: Callable[[], Dict[str, int]]) -> AsyncIterator[str]:
+        '''
+        Yields server-sent events for playlists, versions returns current versions
+        of those the subscriber may still see
+        Queue is subscribed before versions are read, so changes made in between are not lost.
+        Changes made by other workers do not reach this worker's queues, so versions are
+        also polled every keepalive interval and the changed ones are sent.
+        When a playlist is gone from versions, "revoked" event is sent and stream ends
+        '''
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = self.subscribe(playlist_ids)
+        try:
+            sent: Dict[str, int] = {}
+            while True:
+                current: Dict[str, int] = versions()
+                revoked: List[str] = [playlist_id for playlist_id in playlist_ids
+                                      if playlist_id not in current]
+                if revoked:
+                    yield self.format({'type': 'revoked', 'playlists': revoked})
+                    return
+                changed: bool = False
+                for playlist_id, version in current.items():
+                    if version > sent.get(playlist_id, -1):
+                        sent[playlist_id] = version
+                        changed = True
+                        yield self.format({'type': 'change', 'playlist': playlist_id,
+                                           'version': version})
+                if not changed:
+                    yield ': keepalive\n\n'
+
+                deadline: float = loop.time() + self.keepalive
+                while True:
+                    try:
+                        event: dict = await asyncio.wait_for(queue.get(),
+                                                             max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                    if event['type'] == 'change':
+                        sent[event['playlist']] = max(sent.get(event['playlist'], -1),
+                                                      event['version'])
+                    yield self.format(event)
+        finally:
+            self.unsubscribe(queue, playlist_ids)
+
+    def format(self, event: dict) -> str:
+        '''
+        Formats event as server-sent event
+        '''
+        return 'event: ' + event['type'] + '\ndata: ' + json.dumps(event) + '\n\n'
@@ -0,0 +1,269 @@
+'''
+Contains cache of memory-mapped track files and response that sends their slices
+'''
+import asyncio
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Mapping, Optional, Tuple
+
+import anyio
+from fastapi import Response
+from starlette.types import Receive, Scope, Send
+
+from src.metrics import stream_bytes
+from src.tracing import tracer
+
+
+class MappedFile:
+    '''
+    Read-only memory map of one file, shared by all streams of this worker
+    Map is closed when file is dropped from cache and no stream uses it
+    '''
+    def __init__(self, path: str):
+        '''
+        Opens and maps file. Descriptor is not needed after mapping
+        '''
+        with open(path, 'rb') as mapped_file:
+            self.stat: os.stat_result = os.fstat(mapped_file.fileno())
+            self.map: Optional[mmap.mmap] = None
+            if self.stat.st_size > 0:
+                self.map = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map is not None and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.refs: int = 0
+        self.stale: bool = False
+        self.checked: float = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        '''
+        Returns size of file at the moment it was mapped
+        '''
+        return self.stat.st_size
+
+    def view(self, start: int, end: int) -> memoryview:
+        '''
+        Returns bytes start..end of file without copying
+        '''
+        if self.map is None:
+            return memoryview(b'')
+        if hasattr(mmap, 'MADV_WILLNEED') and end > start:
+            page: int = start - start % mmap.PAGESIZE
+            self.map.madvise(mmap.MADV_WILLNEED, page, end - page)
+        return memoryview(self.map)[start:end]
+
+    def close(self):
+        '''
+        Unmaps file. If a slice is still referenced (e.g. by transport buffer),
+        map is left to be closed when it is garbage collected
+        '''
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+
+
+class FileCache:
+    '''
+    Class that keeps up to capacity mapped files of this worker in LRU order
+    Files used by streams are counted, so eviction or invalidation closes them
+    only after the last stream is over. Entries are checked with stat
+    at most every revalidate seconds to notice files replaced by other workers
+    '''
+    def __init__(self, capacity: int, revalidate: float):
+        '''
+        Saves limits
+        '''
+        self.capacity: int = capacity
+        self.revalidate: float = revalidate
+        self.files: OrderedDict[str, MappedFile] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+    def changed(self, mapped: MappedFile, path: str) -> bool:
+        '''
+        Checks if file at path is not the one that was mapped
+        '''
+        try:
+            stat: os.stat_result = os.stat(path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != \
+            (mapped.stat.st_ino, mapped.stat.st_size, mapped.stat.st_mtime_ns)
+
+    def acquire(self, key: str, path: str) -> Optional[MappedFile]:
+        '''
+        Returns mapped file for key, mapping path if needed, or None if there is no file
+        Every acquired file should be released
+        '''
+        with self.lock:
+            mapped: Optional[MappedFile] = self.files.get(key)
+            if mapped is not None and time.monotonic() - mapped.checked > self.revalidate:
+                if self.changed(mapped, path):
+                    self.drop(key)
+                    mapped = None
+                else:
+                    mapped.checked = time.monotonic()
+            if mapped is not None:
+                self.files.move_to_end(key)
+                self.hits += 1
+                mapped.refs += 1
+                return mapped
+
+        try:
+            with tracer.span('file.map', path=path):
+                mapped = MappedFile(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.misses += 1
+            self.drop(key)
+            self.files[key] = mapped
+            mapped.refs += 1
+            while len(self.files) > self.capacity:
+                self.drop(next(iter(self.files)))
+        return mapped
+
+    def release(self, mapped: MappedFile):
+        '''
+        Marks end of stream using mapped file
+        '''
+        with self.lock:
+            mapped.refs -= 1
+            if mapped.stale and mapped.refs == 0:
+                mapped.close()
+
+    def drop(self, key: str):
+        '''
+        Removes file from cache, closing it if it is not used. Lock should be held
+        '''
+        mapped: Optional[MappedFile] = self.files.pop(key, None)
+        if mapped is not None:
+            mapped.stale = True
+            if mapped.refs == 0:
+                mapped.close()
+
+    def invalidate(self, key: str):
+        '''
+        Removes file from cache after it was replaced
+        '''
+        with self.lock:
+            self.drop(key)
+
+    def close(self):
+        '''
+        Removes all files; files used by streams are closed when streams end
+        '''
+        with self.lock:
+            for key in list(self.files):
+                self.drop(key)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    '''
+    Parses single byte range of Range header into start and end (exclusive)
+    Returns None if there is no range or it is malformed (whole file is sent then)
+    Raises ValueError if range cannot be satisfied
+    '''
+    if header is None or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, sep, last = header[6:].strip().partition('-')
+    if not sep or not (first.isdigit() or last.isdigit()):
+        return None
+    if not first.isdigit():
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), min(int(last) + 1, size) if last.isdigit() else size
+    if start >= size or end <= start:
+        raise ValueError(header)
+    return start, end
+
+
+class MappedFileResponse(Response):
+    '''
+    Response that sends part of mapped file as memoryview slices straight from page cache,
+    without reading file in threadpool. Releases file when it is sent or client is gone
+    '''
+    chunk_size: int = 65536
+    endpoint: str = 'stream'
+
+    def __init__(self, files: FileCache, mapped: MappedFile, start: int, end: int,
+                 status_code: int = 200, headers: Optional[Mapping[str, str]] = None,
+                 media_type: Optional[str] = None, head: bytes = b'',
+                 on_complete: Optional[Callable[[], None]] = None,
+                 on_close: Optional[Callable[[], None]] = None,
+                 pace: Optional[Callable[[int], float]] = None):
+        '''
+        Head, if given, is sent instead of the first bytes of file
+        on_complete is called after the last byte is sent, on_close in any case
+        pace returns seconds to wait before sending given number of bytes
+        '''
+        self.files: FileCache = files
+        self.mapped: MappedFile = mapped
+        self.start: int = start
+        self.end: int = end
+        self.head: bytes = head
+        self.on_complete: Optional[Callable[[], None]] = on_complete
+        self.on_close: Optional[Callable[[], None]] = on_close
+        self.pace: Optional[Callable[[int], float]] = pace
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers['content-length'] = str(end - start)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        '''
+        Sends file while listening for disconnect of client, like StreamingResponse does
+        If client is gone, sending stops and on_complete is not called
+        '''
+        completed: bool = False
+        try:
+            async with anyio.create_task_group() as task_group:
+                async def listen_for_disconnect():
+                    while (await receive())['type'] != 'http.disconnect':
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(listen_for_disconnect)
+                await self.send_file(send)
+                completed = True
+                task_group.cancel_scope.cancel()
+        finally:
+            self.files.release(self.mapped)
+            if self.on_close is not None:
+                self.on_close()
+        if completed and self.on_complete is not None:
+            self.on_complete()
+
+    async def send_file(self, send: Send):
+        '''
+        Sends headers and then file by chunks
+        '''
+        await send({'type': 'http.response.start', 'status': self.status_code,
+                    'headers': self.raw_headers})
+        position: int = self.start
+        if self.head and position == 0:
+            await self.send_chunk(send, self.head[:self.end])
+            position = min(len(self.head), self.end)
+        while position < self.end:
+            chunk_end: int = min(position + self.chunk_size, self.end)
+            await self.send_chunk(send, self.mapped.view(position, chunk_end))
+            position = chunk_end
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def send_chunk(self, send: Send, chunk: bytes):
+        '''
+        Sends chunk of body, waiting before it if stream is paced
+        '''
+        if self.pace is not None:
+            wait: float = self.pace(len(chunk))
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        stream_bytes.inc(self.endpoint, value=len(chunk))
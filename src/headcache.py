@@ -0,0 +1,135 @@
+'''
+Contains cache of first bytes of popular track files shared by all workers of one host
+'''
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Optional
+
+
+# uuid, mtime and size of cached file, time of last use, length of cached head, crc32 of head
+SLOT_HEADER = struct.Struct('<36sdQdII')
+
+
+class HeadCache:
+    '''
+    Class that keeps heads of most streamed files in a memory-mapped file,
+    so every worker process serves them from the same pages.
+    File consists of fixed slots grouped into sets by hash of track id;
+    least recently used slot of the set is replaced.
+    Slots are written without inter-process locks: header is cleared first
+    and written last, and readers check crc32, so a torn slot is just a miss
+    '''
+    def __init__(self, path: str, slots: int, ways: int, head_size: int, admit_after: int):
+        '''
+        Maps cache file (creating it if needed). A file is cached
+        after it was streamed admit_after times by this worker
+        '''
+        self.ways: int = max(min(ways, slots), 1)
+        self.sets: int = max(slots // self.ways, 1)
+        self.head_size: int = head_size
+        self.slot_size: int = SLOT_HEADER.size + head_size
+        self.admit_after: int = admit_after
+        self.streams: Counter = Counter()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+        size: int = self.sets * self.ways * self.slot_size
+        fd: int = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def slots(self, uuid: str) -> range:
+        '''
+        Returns offsets of slots of the set where uuid can be stored
+        '''
+        first: int = zlib.crc32(uuid.encode()) % self.sets * self.ways
+        return range(first * self.slot_size, (first + self.ways) * self.slot_size, self.slot_size)
+
+    def find(self, uuid: str) -> Optional[int]:
+        '''
+        Returns offset of slot holding uuid
+        '''
+        key: bytes = uuid.encode()[:36].ljust(36, b'\x00')
+        for offset in self.slots(uuid):
+            if self.map[offset:offset + 36] == key:
+                return offset
+        return None
+
+    def get(self, uuid: str, mtime: float, size: int) -> Optional[bytes]:
+        '''
+        Returns cached head of file if it is cached for the same mtime and size
+        '''
+        offset: Optional[int] = self.find(uuid)
+        if offset is not None:
+            header: tuple = SLOT_HEADER.unpack_from(self.map, offset)
+            start: int = offset + SLOT_HEADER.size
+            head: bytes = self.map[start:start + header[4]]
+            if (header[1] == mtime and header[2] == size and header[4] > 0
+                    and zlib.crc32(head) == header[5]):
+                struct.pack_into('<d', self.map, offset + 52, time.time())
+                self.hits += 1
+                return head
+        self.misses += 1
+        return None
+
+    def admit(self, uuid: str) -> bool:
+        '''
+        Counts stream of uuid and tells if its head should be cached now
+        Counts are halved when there are too many of them, so memory stays bounded
+        '''
+        with self.lock:
+            self.streams[uuid] += 1
+            if self.streams[uuid] < self.admit_after:
+                return False
+            del self.streams[uuid]
+            if len(self.streams) > self.sets * self.ways * 16:
+                self.streams = Counter({key: count // 2 for key, count in self.streams.items()
+                                        if count > 1})
+        return True
+
+    def put(self, uuid: str, mtime: float, size: int, head: bytes):
+        '''
+        Stores head of file in free or least recently used slot of its set
+        '''
+        head = head[:self.head_size]
+        with self.lock:
+            offset: Optional[int] = self.find(uuid)
+            if offset is None:
+                offset = min(self.slots(uuid),
+                             key=lambda slot: SLOT_HEADER.unpack_from(self.map, slot)[3])
+            self.map[offset:offset + SLOT_HEADER.size] = b'\x00' * SLOT_HEADER.size
+            start: int = offset + SLOT_HEADER.size
+            self.map[start:start + len(head)] = head
+            SLOT_HEADER.pack_into(self.map, offset, uuid.encode(), mtime, size,
+                                  time.time(), len(head), zlib.crc32(head))
+
+    def invalidate(self, uuid: str):
+        '''
+        Removes uuid from cache
+        '''
+        with self.lock:
+            offset: Optional[int] = self.find(uuid)
+            if offset is not None:
+                self.map[offset:offset + SLOT_HEADER.size] = b'\x00' * SLOT_HEADER.size
+
+    def close(self):
+        '''
+        Unmaps cache file; cached heads stay in it for other workers and restarts
+        '''
+        self.map.close()
+
+    def hit_rate(self) -> float:
+        '''
+        Returns share of lookups of this worker that were served from cache
+        '''
+        return self.hits / max(self.hits + self.misses, 1)
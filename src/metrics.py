@@ -0,0 +1,296 @@
+'''
+Contains metrics collected in process and rendered in Prometheus text format
+'''
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import anyio.to_thread
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                      0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    '''
+    Formats label set as {name="value",...}
+    '''
+    pairs: List[str] = [name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"')
+                        .replace('\n', '\\n') + '"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    '''
+    Base class of metric with labels. Values are written to shards of threads
+    that update them, so updates need no locks; shards are summed when rendered
+    '''
+    kind: str = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        '''
+        Saves name, help text and label names
+        '''
+        self.name: str = name
+        self.description: str = description
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.shards: Dict[int, dict] = {}
+
+    def shard(self) -> dict:
+        '''
+        Returns values written by current thread
+        '''
+        shard: Optional[dict] = self.shards.get(threading.get_ident())
+        if shard is None:
+            shard = self.shards.setdefault(threading.get_ident(), {})
+        return shard
+
+    def samples(self) -> List[str]:
+        '''
+        Returns lines with values of metric
+        '''
+        raise NotImplementedError
+
+    def render(self) -> str:
+        '''
+        Returns metric in Prometheus text format
+        '''
+        return (f'# HELP {self.name} {self.description}\n# TYPE {self.name} {self.kind}\n' +
+                ''.join(line + '\n' for line in self.samples()))
+
+
+class Counter(Metric):
+    '''
+    Monotonic counter
+    '''
+    kind = 'counter'
+
+    def inc(self, *labels: str, value: float = 1):
+        '''
+        Adds value to counter with given label values
+        '''
+        shard: dict = self.shard()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def values(self) -> Dict[Labels, float]:
+        '''
+        Returns totals of all shards by label values
+        '''
+        out: Dict[Labels, float] = {}
+        for shard in list(self.shards.values()):
+            for labels, value in list(shard.items()):
+                out[labels] = out.get(labels, 0) + value
+        return out
+
+    def value(self, *labels: str) -> float:
+        '''
+        Returns total for given label values
+        '''
+        return self.values().get(labels, 0)
+
+    def samples(self) -> List[str]:
+        '''
+        Returns one line for every label set
+        '''
+        return [self.name + format_labels(self.labels, labels) + f' {value}'
+                for labels, value in sorted(self.values().items())]
+
+
+class Histogram(Metric):
+    '''
+    Histogram of observed values with fixed buckets
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        '''
+        Saves bucket upper bounds in addition to Metric fields
+        '''
+        super().__init__(name, description, labels)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+
+    def observe(self, *labels: str, value: float):
+        '''
+        Adds value to histogram with given label values
+        Shard keeps count of every bucket (not cumulative), sum and count
+        '''
+        shard: dict = self.shard()
+        counts: Optional[List[float]] = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def values(self) -> Dict[Labels, List[float]]:
+        '''
+        Returns bucket counts, sum and count of all shards by label values
+        '''
+        out: Dict[Labels, List[float]] = {}
+        for shard in list(self.shards.values()):
+            for labels, counts in list(shard.items()):
+                total: List[float] = out.setdefault(labels, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return out
+
+    def samples(self) -> List[str]:
+        '''
+        Returns cumulative buckets, sum and count for every label set
+        '''
+        lines: List[str] = []
+        for labels, counts in sorted(self.values().items()):
+            cumulative: float = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le: str = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket' + format_labels(self.labels, labels, le) +
+                             f' {cumulative}')
+            lines.append(f'{self.name}_sum' + format_labels(self.labels, labels) + f' {counts[-2]}')
+            lines.append(f'{self.name}_count' + format_labels(self.labels, labels) +
+                         f' {counts[-1]}')
+        return lines
+
+
+class CallbackMetric(Metric):
+    '''
+    Metric whose values are read from other objects when it is rendered
+    '''
+    def __init__(self, name: str, description: str, kind: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]]):
+        '''
+        Saves kind ('gauge' or 'counter') and function returning values by label values
+        '''
+        super().__init__(name, description, labels)
+        self.kind = kind
+        self.collect: Callable[[], Dict[Labels, float]] = collect
+
+    def samples(self) -> List[str]:
+        '''
+        Returns one line for every collected label set
+        '''
+        return [self.name + format_labels(self.labels, labels) + f' {value}'
+                for labels, value in sorted(self.collect().items())]
+
+
+class Registry:
+    '''
+    Class that keeps metrics by name and renders all of them
+    Metrics are created on first request, later requests return the same metric;
+    callback metric is replaced instead, so it reads the latest object that registered it
+    '''
+    def __init__(self):
+        '''
+        Starts with no metrics
+        '''
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def add(self, metric: Metric) -> Metric:
+        '''
+        Registers metric unless metric with the same name exists. Returns registered one
+        '''
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        '''
+        Returns counter with given name
+        '''
+        return self.add(Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        '''
+        Returns histogram with given name
+        '''
+        return self.add(Histogram(name, description, labels, buckets))
+
+    def callback(self, name: str, description: str, kind: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]]) -> CallbackMetric:
+        '''
+        Registers metric with given name that reads values with collect, replacing old one
+        '''
+        metric = CallbackMetric(name, description, kind, labels, collect)
+        with self.lock:
+            self.metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        '''
+        Returns all metrics in Prometheus text format
+        Metric that fails to collect is skipped
+        '''
+        out: List[str] = []
+        for metric in list(self.metrics.values()):
+            try:
+                out.append(metric.render())
+            except Exception:
+                continue
+        return ''.join(out)
+
+
+registry = Registry()
+
+db_seconds: Histogram = registry.histogram('duradora_db_seconds',
+                                           'Time spent in database controller methods',
+                                           ('controller', 'method'), DB_BUCKETS)
+stream_bytes: Counter = registry.counter('duradora_stream_bytes_total',
+                                         'Bytes of audio sent to clients', ('endpoint',))
+
+
+def threadpool_usage() -> Dict[Labels, float]:
+    '''
+    Returns busy and total threads of default threadpool that runs sync endpoints
+    and stream generators. Only works in event loop thread
+    '''
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {('busy',): limiter.borrowed_tokens, ('limit',): limiter.total_tokens}
+
+
+class MetricsMiddleware:
+    '''
+    Middleware that counts requests and their duration by route template and status
+    '''
+    def __init__(self, app: ASGIApp, metrics: Registry = registry):
+        '''
+        Creates request metrics in registry
+        '''
+        self.app: ASGIApp = app
+        self.requests: Histogram = metrics.histogram('duradora_request_seconds',
+                                                     'Duration of requests',
+                                                     ('route', 'method', 'status'))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        '''
+        Passes request on and observes its duration
+        '''
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started: float = time.perf_counter()
+        status: int = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            self.requests.observe(getattr(route, 'path', 'unmatched'), scope['method'],
+                                  str(status), value=time.perf_counter() - started)
@@ -0,0 +1,176 @@
+'''
+Contains parsing of MPEG audio Layer III frames without decoding audio
+'''
+from typing import Dict, List, Optional, Tuple
+
+
+MP3_BITRATES: Dict[int, List[int]] = {
+    # kbps by bitrate index for Layer III, MPEG1 and MPEG2/2.5
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+MP3_SAMPLE_RATES: Dict[int, List[int]] = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+
+
+class MP3Frame:
+    '''
+    Parsed header of one MPEG audio Layer III frame
+    '''
+    def __init__(self, offset: int, length: int, version: int,
+                 bitrate: int, sample_rate: int, channels: int, crc: bool):
+        '''
+        Saves header values
+        '''
+        self.offset: int = offset
+        self.length: int = length
+        self.version: int = version
+        self.bitrate: int = bitrate
+        self.sample_rate: int = sample_rate
+        self.channels: int = channels
+        self.crc: bool = crc
+
+    @property
+    def side_info_size(self) -> int:
+        '''
+        Size of side information block that follows the header
+        '''
+        if self.version == 3:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+
+def skip_id3(data: bytes) -> int:
+    '''
+    Returns offset of audio data after ID3v2 tag, or 0 if there is no tag
+    '''
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size: int = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer: int = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def parse_mp3_header(data: bytes, offset: int) -> Optional[MP3Frame]:
+    '''
+    Tries to parse Layer III frame header at offset
+    Returns MP3Frame if header is valid, otherwise None
+    '''
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version: int = (b1 >> 3) & 3
+    layer: int = (b1 >> 1) & 3
+    bitrate_index: int = b2 >> 4
+    rate_index: int = (b2 >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate: int = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate: int = MP3_SAMPLE_RATES[version][rate_index]
+    padding: int = (b2 >> 1) & 1
+    coefficient: int = 144 if version == 3 else 72
+    length: int = coefficient * bitrate // sample_rate + padding
+
+    return MP3Frame(offset=offset,
+                    length=length,
+                    version=version,
+                    bitrate=bitrate,
+                    sample_rate=sample_rate,
+                    channels=1 if b3 >> 6 == 3 else 2,
+                    crc=not b1 & 1)
+
+
+def find_first_frame(data: bytes, offset: int = 0) -> Optional[MP3Frame]:
+    '''
+    Finds first valid Layer III frame starting from offset.
+    Frame is valid if it is followed by another valid frame or by end of data
+    '''
+    position: int = data.find(b'\xff', offset)
+    while position != -1:
+        frame: Optional[MP3Frame] = parse_mp3_header(data, position)
+        if frame is not None:
+            following: int = position + frame.length
+            if following >= len(data) or parse_mp3_header(data, following) is not None:
+                return frame
+        position = data.find(b'\xff', position + 1)
+    return None
+
+
+def frame_global_gain(data: bytes, frame: MP3Frame) -> int:
+    '''
+    Returns the largest global_gain value among granules and channels of frame.
+    global_gain is the quantizer step size, so it follows the loudness of the frame
+    without decoding the audio
+    '''
+    start: int = frame.offset + 4 + (2 if frame.crc else 0)
+    side: bytes = data[start:start + frame.side_info_size]
+    if len(side) < frame.side_info_size:
+        return 0
+    bits: int = int.from_bytes(side, 'big')
+    total: int = len(side) * 8
+
+    if frame.version == 3:
+        base: int = 9 + (5 if frame.channels == 1 else 3) + 4 * frame.channels
+        granules, block = 2, 59
+    else:
+        base = 8 + (1 if frame.channels == 1 else 2)
+        granules, block = 1, 63
+
+    gain: int = 0
+    for i in range(granules * frame.channels):
+        position: int = base + i * block + 21
+        gain = max(gain, (bits >> (total - position - 8)) & 0xFF)
+    return gain
+
+
+def is_info_frame(data: bytes, frame: MP3Frame) -> bool:
+    '''
+    Checks if frame is a Xing/Info header frame. It carries no audio and
+    would be heard as a short gap when tracks are joined
+    '''
+    start: int = frame.offset + 4 + (2 if frame.crc else 0) + frame.side_info_size
+    return data[start:start + 4] in (b'Xing', b'Info')
+
+
+def audio_range(path: str, size: int) -> Tuple[int, int]:
+    '''
+    Returns offsets of first and after the last audio frame of file of given size:
+    skips ID3v2 tag, junk before first frame and Xing/Info frame, cuts ID3v1 tag at the end.
+    If no frames are found, returns whole file after ID3v2 tag
+    '''
+    with open(path, 'rb') as audio:
+        start: int = min(skip_id3(audio.read(10)), size)
+        audio.seek(start)
+        data: bytes = audio.read(65536)
+        end: int = size
+        if size - start >= 128:
+            audio.seek(size - 128)
+            if audio.read(3) == b'TAG':
+                end = size - 128
+
+    frame: Optional[MP3Frame] = find_first_frame(data)
+    if frame is None:
+        return start, end
+    if is_info_frame(data, frame):
+        return min(start + frame.offset + frame.length, end), end
+    return start + frame.offset, end
+
+
+def first_bitrate(data: bytes) -> Optional[int]:
+    '''
+    Returns bitrate (bits per second) of first audio frame of mp3 data, skipping Xing/Info frame
+    '''
+    frame: Optional[MP3Frame] = find_first_frame(data, skip_id3(data))
+    if frame is not None and is_info_frame(data, frame):
+        frame = parse_mp3_header(data, frame.offset + frame.length) or frame
+    return frame.bitrate if frame is not None else None
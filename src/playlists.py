@@ -1,14 +1,22 @@
 '''
 Module for operating with playlists: adding/removing tracks, updating them, etc
 '''
-from typing import Optional, List
+import random
+from typing import Optional, List, Dict, Literal, Set
 from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
 
-from src.db.playlist_controller import PlaylistController, Playlist, DBPlaylist, Access
+from src.db.playlist_controller import (PlaylistController, Playlist, DBPlaylist, Access,
+                                       PlaylistChange, RelatedTrack)
 from src.db.track_controller import TrackController, DBTrack
+from src.db.play_controller import PlayController
+from src.shuffle import ShuffleWindow, shuffle_window
 from src.users import UserHandler
+from src.events import PlaylistEvents
 from src.responses import Error, Success
 from src.config import config
+from src.resources import Resources
+from src.tracing import trace_methods
 
 
 class PlaylistForCreation(BaseModel):
@@ -27,17 +35,52 @@ class PlaylistUUID(BaseModel):
     uuid: str
 
 
+class PlaylistOperation(BaseModel):
+    '''
+    Model representing one operation of batch playlist update
+    Position is required for move, add appends track if position is not given
+    '''
+    op: Literal['add', 'remove', 'move']
+    track_id: str
+    position: int | None = None
+
+
+class PlaylistBatch(BaseModel):
+    '''
+    Model containing operations that should be applied to playlist at once
+    '''
+    playlist_id: str
+    operations: List[PlaylistOperation]
+
+
+class PlaylistDelta(BaseModel):
+    '''
+    Model containing changes of playlist since some version
+    If full is True, changes are not available and tracks contain the whole track list
+    '''
+    uuid: str
+    version: int
+    full: bool = False
+    changes: List[PlaylistChange] = []
+    tracks: List[str] | None = None
+
+
+@trace_methods
 class PlaylistHandler:
     '''
     Class that handles all operations with playlists
     '''
-    def __init__(self):
+    def __init__(self, resources: Resources, user_handler: UserHandler):
         '''
-        Initializes database controller
+        Takes database controllers from shared resources and initializes playlist events
         '''
-        self.controller = PlaylistController(config['db_path'])
-        self.track_controller = TrackController(config['db_path'])
-        self.user_handler = UserHandler()
+        self.controller: PlaylistController = resources.playlists
+        self.track_controller: TrackController = resources.tracks
+        self.play_controller: PlayController = resources.plays
+        self.user_handler: UserHandler = user_handler
+        self.batch_limit: int = config['playlist_batch_limit']
+        self.events = PlaylistEvents(config['events_queue_size'],
+                                     config['events_keepalive_seconds'])
 
     async def create_playlist_for_user(self, executor: str,
                                        playlist: PlaylistForCreation) -> PlaylistUUID | Error:
@@ -80,6 +123,7 @@ class PlaylistHandler:
 
             playlist.tracks.append(track_id)
             self.controller.update_playlist(playlist)
+            self.events.publish(playlist.uuid, playlist.version)
         except Exception as e:
             return Error(error=repr(e))
 
@@ -106,6 +150,64 @@ class PlaylistHandler:
 
             playlist.tracks.remove(track_id)
             self.controller.update_playlist(playlist)
+            self.events.publish(playlist.uuid, playlist.version)
+        except Exception as e:
+            return Error(error=repr(e))
+
+        return Success(success=True)
+
+    def apply_operations(self, tracks: List[str],
+                         operations: List[PlaylistOperation]) -> Optional[str]:
+        '''
+        Applies operations to tracks in place
+        Returns description of the first invalid operation, otherwise None
+        '''
+        present: Set[str] = set(tracks)
+        for i, operation in enumerate(operations):
+            track_id: str = operation.track_id
+            if operation.op == 'add' and track_id in present:
+                return f"Operation {i}: track is already present"
+            if operation.op != 'add' and track_id not in present:
+                return f"Operation {i}: no such track in playlist"
+
+            if operation.op != 'add':
+                tracks.remove(track_id)
+                present.discard(track_id)
+            if operation.op == 'remove':
+                continue
+
+            position: int = len(tracks) if operation.position is None else operation.position
+            if operation.op == 'move' and operation.position is None:
+                return f"Operation {i}: position is required"
+            if not 0 <= position <= len(tracks):
+                return f"Operation {i}: position is out of range"
+            tracks.insert(position, track_id)
+            present.add(track_id)
+        return None
+
+    async def apply_batch(self, username: str, batch: PlaylistBatch) -> Success | Error:
+        '''
+        Applies all operations of batch to playlist with one permission check and one write
+        If any operation is invalid, playlist is not changed and Error is returned
+        Can only be performed by creator or admin
+        '''
+        try:
+            if len(batch.operations) > self.batch_limit:
+                return Error(error=f"Batch can contain at most {self.batch_limit} operations")
+
+            playlist: DBPlaylist = self.controller.find_playlist(batch.playlist_id)
+
+            if playlist is None:
+                return Error(error="No such playlist")
+            if playlist.creator != username and not self.user_handler.is_admin(username):
+                return Error(error="This user has no rights to execute this command")
+
+            error: Optional[str] = self.apply_operations(playlist.tracks, batch.operations)
+            if error is not None:
+                return Error(error=error)
+
+            self.controller.update_playlist(playlist)
+            self.events.publish(playlist.uuid, playlist.version)
         except Exception as e:
             return Error(error=repr(e))
 
@@ -132,6 +234,82 @@ class PlaylistHandler:
         except Exception as e:
             return Error(error=repr(e))
 
+    async def get_changes(self, username: str,
+                          playlist_id: str, version: int) -> PlaylistDelta | Error:
+        '''
+        Returns changes of playlist made after version, checking rights like get_playlist
+        If log does not reach that version anymore, returns full track list instead
+        '''
+        try:
+            playlist: DBPlaylist | Error = await self.get_playlist(username, playlist_id)
+            if isinstance(playlist, Error):
+                return playlist
+
+            changes: Optional[List[PlaylistChange]] = self.controller.changes_since(playlist,
+                                                                                    version)
+            if changes is None:
+                return PlaylistDelta(uuid=playlist.uuid, version=playlist.version,
+                                     full=True, tracks=playlist.tracks)
+            return PlaylistDelta(uuid=playlist.uuid, version=playlist.version, changes=changes)
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def watch_playlists(self, username: str,
+                              playlist_ids: List[str]) -> StreamingResponse | Error:
+        '''
+        Opens server-sent events stream with changes of playlists
+        Every playlist is checked like in get_playlist, Error is returned if any check fails
+        Rights are checked again on every poll of versions, so stream ends
+        when a playlist becomes private
+        '''
+        checked: List[str] = []
+        for playlist_id in playlist_ids:
+            playlist: DBPlaylist | Error = await self.get_playlist(username, playlist_id)
+            if isinstance(playlist, Error):
+                return playlist
+            checked.append(playlist.uuid)
+        is_admin: bool = self.user_handler.is_admin(username)
+
+        def versions() -> Dict[str, int]:
+            return {playlist_id: version for playlist_id, version, creator, access
+                    in self.controller.playlist_versions(checked)
+                    if access != int(Access.PRIVATE) or creator == username or is_admin}
+
+        return StreamingResponse(self.events.stream(checked, versions),
+                                 media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache'})
+
+    async def shuffle_playlist(self, username: str, playlist_id: str, seed: Optional[int],
+                               offset: int, limit: int, weighted: bool) -> ShuffleWindow | Error:
+        '''
+        Returns window of playlist shuffled with seed, checking rights like get_playlist
+        Random seed is chosen if not given; it is returned so next windows use the same order
+        If weighted, often played tracks tend to go first
+        '''
+        try:
+            playlist: DBPlaylist | Error = await self.get_playlist(username, playlist_id)
+            if isinstance(playlist, Error):
+                return playlist
+
+            seed = random.randrange(2 ** 31) if seed is None else seed
+            weights: Optional[Dict[str, int]] = None
+            if weighted:
+                weights = self.play_controller.play_counts(playlist.tracks)
+            window: List[str] = shuffle_window(playlist.tracks, seed, offset, limit, weights)
+            return ShuffleWindow(seed=seed, offset=offset, total=len(playlist.tracks),
+                                 tracks=self.track_controller.find_tracks(window))
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def get_related(self, track_id: str, limit: int) -> List[RelatedTrack] | Error:
+        '''
+        Returns tracks that are most often added to the same playlists as track_id
+        '''
+        try:
+            return self.controller.related_tracks(track_id, limit)
+        except Exception as e:
+            return Error(error=repr(e))
+
     async def show_user_playlists(self, executor: str, user: str) -> List[DBPlaylist]:
         '''
         Shows all playlists owned by user
@@ -155,14 +333,8 @@ class PlaylistHandler:
             if isinstance(playlist, Error):
                 return playlist
 
-            def check_track(track_id: str) -> bool:
-                track: Optional[DBTrack] = self.track_controller.find_track(track_id)
-                if track is None:
-                    return False
-                return track.title.find(search_str) != -1
-
-            uuids = list(filter(check_track, playlist.tracks))
-            out = list(map(self.track_controller.find_track, uuids))
-            return out
+            tracks: List[DBTrack] = self.track_controller.find_tracks(playlist.tracks)
+            return [track for track in tracks
+                    if track.title is not None and track.title.find(search_str) != -1]
         except Exception as e:
             return Error(error=repr(e))
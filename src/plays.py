@@ -0,0 +1,127 @@
+'''
+Module for recording listening events: buffering, batching and rollups
+'''
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from src.db.play_controller import PlayController, PlayEvent, PlayRollup, ChartRow
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS: Dict[str, int] = {'hour': 3600, 'day': 86400}
+CHART_PERIODS: Dict[str, int] = {'day': 86400, 'week': 7 * 86400, 'all': 0}
+
+
+def chart_bucket(period: str, timestamp: int) -> int:
+    '''
+    Returns start of chart period containing timestamp
+    Weeks start on Monday (unix epoch is Thursday), all-time chart has bucket 0
+    '''
+    length: int = CHART_PERIODS[period]
+    if length == 0:
+        return 0
+    offset: int = 4 * 86400 if period == 'week' else 0
+    return (timestamp - offset) // length * length + offset
+
+
+class PlayRecorder:
+    '''
+    Class that buffers play events in memory and writes them in batches
+    together with incremental hourly and daily rollups and play charts.
+    Events can be recorded from any thread (stream generators run in threadpool),
+    but flushing touches the database, so it only happens on the event loop thread
+    '''
+    def __init__(self, controller: PlayController, batch_size: int, flush_seconds: float,
+                 chart_retention: int):
+        '''
+        Saves controller, flush thresholds and number of daily and weekly charts to keep
+        '''
+        self.controller: PlayController = controller
+        self.batch_size: int = batch_size
+        self.flush_seconds: float = flush_seconds
+        self.chart_retention: int = chart_retention
+        self.buffer: List[PlayEvent] = []
+        self.lock = threading.Lock()
+
+    def record(self, track: str, username: Optional[str], event: str):
+        '''
+        Adds event to buffer. Anonymous listeners are stored with empty username
+        '''
+        with self.lock:
+            self.buffer.append((track, username or '', event, int(time.time())))
+
+    def rollups(self, events: List[PlayEvent]) -> List[PlayRollup]:
+        '''
+        Aggregates events into rows that should be added to rollups
+        '''
+        counts: Counter = Counter()
+        for track, username, event, timestamp in events:
+            for period, length in PERIODS.items():
+                counts[(period, timestamp - timestamp % length, track, username, event)] += 1
+
+        rows: Dict[Tuple[str, int, str, str], List[int]] = {}
+        for (period, bucket, track, username, event), count in counts.items():
+            row: List[int] = rows.setdefault((period, bucket, track, username), [0, 0])
+            row[0 if event == 'start' else 1] += count
+        return [key + (starts, completes) for key, (starts, completes) in rows.items()]
+
+    def charts(self, events: List[PlayEvent]) -> List[ChartRow]:
+        '''
+        Counts started plays of every track for every chart period
+        '''
+        counts: Counter = Counter()
+        for track, _, event, timestamp in events:
+            if event == 'start':
+                for period in CHART_PERIODS:
+                    counts[(period, chart_bucket(period, timestamp), track)] += 1
+        return [key + (plays,) for key, plays in counts.items()]
+
+    def prune_charts(self):
+        '''
+        Removes daily and weekly charts older than chart_retention periods
+        '''
+        now: int = int(time.time())
+        for period, length in CHART_PERIODS.items():
+            if length != 0:
+                bucket: int = chart_bucket(period, now) - self.chart_retention * length
+                self.controller.prune_charts(period, bucket)
+
+    def flush(self):
+        '''
+        Writes buffered events and their rollups to database
+        If writing fails, events are returned to buffer
+        '''
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if not events:
+            return
+        try:
+            self.controller.record(events, self.rollups(events), self.charts(events))
+        except Exception:
+            with self.lock:
+                self.buffer = events + self.buffer
+            raise
+
+    def flush_if_full(self):
+        '''
+        Flushes buffer if it has reached batch size
+        '''
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    async def run(self):
+        '''
+        Flushes buffer and prunes old charts every flush_seconds until cancelled
+        '''
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                self.prune_charts()
+            except Exception:
+                logger.exception('Failed to flush play events')
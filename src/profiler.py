@@ -0,0 +1,73 @@
+'''
+Contains in-process sampling profiler that returns collapsed stacks for flame graphs
+'''
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+
+def collapse(frame: Optional[FrameType]) -> List[str]:
+    '''
+    Returns names of functions of stack from outermost to innermost
+    '''
+    names: List[str] = []
+    while frame is not None:
+        names.append(frame.f_globals.get('__name__', '?') + ':' + frame.f_code.co_qualname)
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+class SamplingProfiler:
+    '''
+    Class that periodically takes stacks of all threads of this process
+    and counts identical stacks. Sampling runs in its own thread, so the event loop
+    and threadpool threads are sampled as they are. Only one profile runs at a time
+    '''
+    def __init__(self, max_seconds: float, min_interval: float):
+        '''
+        Saves limits of one profile
+        '''
+        self.max_seconds: float = max_seconds
+        self.min_interval: float = min_interval
+        self.lock = threading.Lock()
+
+    def sample(self, stacks: Counter):
+        '''
+        Adds current stack of every thread except the calling one
+        '''
+        names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+        current: int = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident != current:
+                stacks[';'.join([names.get(ident, str(ident))] + collapse(frame))] += 1
+
+    def run(self, seconds: float, interval: float) -> Counter:
+        '''
+        Samples stacks every interval seconds for given time
+        '''
+        stacks: Counter = Counter()
+        deadline: float = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample(stacks)
+            time.sleep(interval)
+        return stacks
+
+    async def profile(self, seconds: float, interval: float) -> Optional[str]:
+        '''
+        Profiles process and returns collapsed stacks, one "stack count" per line,
+        or None if another profile is running. Time and interval are clamped to limits
+        '''
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            stacks: Counter = await asyncio.to_thread(
+                self.run, min(max(seconds, 0), self.max_seconds), max(interval, self.min_interval)
+            )
+        finally:
+            self.lock.release()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
@@ -0,0 +1,151 @@
+'''
+Contains ASGI middleware that rate limits requests with token buckets and sheds load
+'''
+import json
+import math
+import random
+import time
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.admission import TokenBucket
+from src.config import config
+from src.metrics import Counter, Registry, registry
+
+
+class RateLimitMiddleware:
+    '''
+    Middleware that checks requests before they reach endpoints (and database):
+    every client (user from signed JWT, otherwise IP address) has a token bucket per route,
+    and routes may have a bucket shared by all clients.
+    Load is shed when too many requests wait for response or, for sheddable routes,
+    when latency to response start grows while requests are queued
+    '''
+    latency_weight: float = 0.1
+
+    def __init__(self, app: ASGIApp, identify: Callable[[str], Optional[str]],
+                 settings: Optional[Mapping] = None, metrics: Registry = registry):
+        '''
+        Saves limits from settings ([rate_limits] of config by default)
+        and function that returns username from JWT
+        Middleware is created on first request, so config is not read on import of app
+        Rejected requests are counted in metrics
+        '''
+        settings = config['rate_limits'] if settings is None else settings
+        self.app: ASGIApp = app
+        self.identify: Callable[[str], Optional[str]] = identify
+        self.routes: Mapping[str, Mapping] = settings['routes']
+        self.max_in_flight: int = settings['max_in_flight']
+        self.shed_in_flight: int = settings['shed_in_flight']
+        self.target_latency: float = settings['target_latency_ms'] / 1000
+        self.max_clients: int = settings['max_clients']
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.in_flight: int = 0
+        self.latency: float = 0.0
+        self.rejected: Counter = metrics.counter('duradora_requests_rejected_total',
+                                                 'Requests rejected by rate limits and shedding',
+                                                 ('reason', 'route'))
+
+    def client(self, scope: Scope) -> str:
+        '''
+        Returns bucket key of client: username if request has valid bearer token, else address
+        '''
+        for name, value in scope.get('headers', ()):
+            if name == b'authorization' and value[:7].lower() == b'bearer ':
+                username: Optional[str] = self.identify(value[7:].decode('latin-1'))
+                if username is not None:
+                    return 'user:' + username
+        client: Optional[Tuple[str, int]] = scope.get('client')
+        return 'ip:' + (client[0] if client else '')
+
+    def bucket(self, route: str, client: str, limit: Tuple[float, float]) -> TokenBucket:
+        '''
+        Returns bucket of client for route, creating it if needed
+        When there are too many buckets, full (idle) ones are dropped,
+        and if that is not enough, the older half of them
+        '''
+        bucket: Optional[TokenBucket] = self.buckets.get((route, client))
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                for key, old in list(self.buckets.items()):
+                    old.refill()
+                    if old.tokens >= old.capacity:
+                        del self.buckets[key]
+                if len(self.buckets) >= self.max_clients // 2:
+                    for key in list(self.buckets)[:len(self.buckets) // 2]:
+                        del self.buckets[key]
+            bucket = self.buckets[(route, client)] = TokenBucket(limit[0], limit[1])
+        return bucket
+
+    def route(self, scope: Scope) -> str:
+        '''
+        Returns name of limits of request: its path if it has own limits, else "default"
+        '''
+        return scope['path'] if scope['path'] in self.routes else 'default'
+
+    def check(self, scope: Scope) -> Optional[Tuple[int, str, float]]:
+        '''
+        Returns status, reason and seconds to retry after if request should be rejected
+        '''
+        route: str = self.route(scope)
+        limits: Mapping = self.routes.get(route, {})
+
+        if self.in_flight >= self.max_in_flight:
+            return 503, 'overload', 1.0
+        if (limits.get('shed', False) and self.in_flight >= self.shed_in_flight
+                and self.latency > self.target_latency
+                and random.random() < min((self.latency - self.target_latency)
+                                          / self.target_latency, 1.0)):
+            return 503, 'shed', 1.0
+
+        if 'client' in limits:
+            wait: float = self.bucket(route, self.client(scope), limits['client']).try_take()
+            if wait > 0:
+                return 429, 'client', wait
+        if 'route' in limits:
+            wait = self.bucket(route, '', limits['route']).try_take()
+            if wait > 0:
+                return 429, 'route', wait
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        '''
+        Rejects request or passes it on, measuring time until response starts
+        '''
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        rejected: Optional[Tuple[int, str, float]] = self.check(scope)
+        if rejected is not None:
+            status, reason, wait = rejected
+            self.rejected.inc(reason, self.route(scope))
+            body: bytes = json.dumps({'error': 'Too many requests, retry later'}).encode()
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': [(b'content-type', b'application/json'),
+                                    (b'content-length', str(len(body)).encode()),
+                                    (b'retry-after', str(math.ceil(wait)).encode())]})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        started: float = time.monotonic()
+        waiting: bool = True
+        self.in_flight += 1
+
+        def done():
+            nonlocal waiting
+            if waiting:
+                waiting = False
+                self.in_flight -= 1
+                self.latency += self.latency_weight * (time.monotonic() - started - self.latency)
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                done()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            done()
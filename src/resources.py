@@ -0,0 +1,127 @@
+'''
+Contains container of resources shared by all handlers of a worker
+'''
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Mapping, Optional
+
+from src.config import config
+from src.db.play_controller import PlayController
+from src.db.playlist_controller import PlaylistController
+from src.db.querylog import query_log
+from src.db.track_controller import TrackController
+from src.db.user_controller import UserController
+from src.filecache import FileCache
+from src.headcache import HeadCache
+from src.plays import PlayRecorder
+from src.tracing import tracer
+from src.watchdog import LoopWatchdog
+
+
+logger = logging.getLogger(__name__)
+
+
+class Resources:
+    '''
+    Class that owns everything handlers share: one database connection with controllers
+    on it, play recorder, prefetch threads, head and file caches and event loop watchdog.
+    It is created in app lifespan and closed there in reverse order of dependencies.
+    Handlers use the connection from event loop thread, so one connection is enough
+    '''
+    def __init__(self, settings: Mapping = config):
+        '''
+        Configures tracing and query log of worker, opens database connection and storage,
+        creates caches and thread pool
+        '''
+        self.settings: Mapping = settings
+        tracer.configure(settings['tracing'])
+        query_log.configure(settings['slow_query_ms'] / 1000, settings['slow_query_top'])
+        self.con: sqlite3.Connection = sqlite3.connect(settings['db_path'],
+                                                       check_same_thread=False)
+        self.users = UserController(self.con)
+        self.tracks = TrackController(self.con)
+        self.playlists = self.playlist_controller(self.con)
+        self.plays = PlayController(self.con)
+        self.recorder = PlayRecorder(self.plays, settings['plays_batch_size'],
+                                     settings['plays_flush_seconds'], settings['charts_retention'])
+
+        self.storage: str = settings['storage_path']
+        os.makedirs(self.storage, exist_ok=True)
+        self.prefetcher = ThreadPoolExecutor(max_workers=settings['prefetch_threads'],
+                                             thread_name_prefix='prefetch')
+        # relative path of head cache is inside storage, next to the files it caches
+        self.heads = HeadCache(os.path.join(self.storage, settings['head_cache_path']),
+                               settings['head_cache_slots'],
+                               settings['head_cache_ways'], settings['head_cache_kb'] * 1024,
+                               settings['head_cache_admit'])
+        self.files = FileCache(settings['file_cache_size'],
+                               settings['file_cache_revalidate_seconds'])
+        self.watchdog = LoopWatchdog(settings['loop_watchdog_interval_ms'] / 1000,
+                                     settings['loop_watchdog_threshold_ms'] / 1000,
+                                     settings['loop_watchdog_log_seconds'],
+                                     settings['loop_watchdog_top'])
+        self.flusher: Optional[asyncio.Task] = None
+        self.rebuilder: Optional[asyncio.Task] = None
+
+    def playlist_controller(self, database: str | sqlite3.Connection) -> PlaylistController:
+        '''
+        Creates playlist controller with settings of worker
+        '''
+        return PlaylistController(database, self.settings['playlist_changelog_versions'],
+                                  self.settings['related_max_playlist'],
+                                  self.settings['related_top'],
+                                  self.settings['related_max_delta'])
+
+    def rebuild_related(self) -> bool:
+        '''
+        Rebuilds co-occurrence counts on its own connection, so the shared one
+        is not used from another thread
+        '''
+        return self.playlist_controller(self.settings['db_path']).rebuild_related()
+
+    async def run_related(self):
+        '''
+        Rebuilds co-occurrence counts in thread when they are stale,
+        checking every related_rebuild_seconds until cancelled
+        '''
+        while True:
+            try:
+                if self.playlists.related_stale() and not await asyncio.to_thread(
+                        self.rebuild_related):
+                    logger.info('Playlists changed during rebuild of related tracks, will retry')
+            except Exception:
+                logger.exception('Failed to rebuild related tracks')
+            await asyncio.sleep(self.settings['related_rebuild_seconds'])
+
+    def start(self):
+        '''
+        Starts background work in running event loop: flushing of plays,
+        rebuild of related tracks and watchdog
+        '''
+        self.flusher = asyncio.create_task(self.recorder.run())
+        self.rebuilder = asyncio.create_task(self.run_related())
+        self.watchdog.start()
+
+    async def close(self):
+        '''
+        Stops background work, writes buffered plays, stops prefetching,
+        unmaps caches and closes database connection last
+        '''
+        self.watchdog.stop()
+        for task in (self.flusher, self.rebuilder):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.flusher = None
+        self.rebuilder = None
+        try:
+            self.recorder.flush()
+        except Exception:
+            logger.exception('Failed to flush play events on shutdown')
+        self.prefetcher.shutdown(wait=True, cancel_futures=True)
+        self.files.close()
+        self.heads.close()
+        self.con.close()
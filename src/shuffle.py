@@ -0,0 +1,90 @@
+'''
+Contains deterministic shuffling for queues: pseudo-random permutations and weighted sampling
+'''
+import math
+from hashlib import blake2b
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from src.db.track_controller import DBTrack
+
+
+class ShuffleWindow(BaseModel):
+    '''
+    Model containing a window of shuffled queue
+    Same seed gives the same order, so next pages are requested with it
+    '''
+    seed: int
+    offset: int
+    total: int
+    tracks: List[DBTrack]
+
+
+def seeded_hash(seed: int, value: str, bits: int = 64) -> int:
+    '''
+    Returns deterministic pseudo-random number of given bit length for seed and value
+    '''
+    digest: bytes = blake2b(f'{seed}:{value}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> (64 - bits)
+
+
+class FeistelPermutation:
+    '''
+    Pseudo-random permutation of range(size) defined by seed.
+    Any position is computed on its own with a small Feistel network
+    and cycle walking, so a window does not need the whole order
+    '''
+    def __init__(self, size: int, seed: int, rounds: int = 4):
+        '''
+        Picks the smallest even power of two domain that covers size
+        '''
+        self.size: int = size
+        self.seed: int = seed
+        self.rounds: int = rounds
+        self.half_bits: int = max((max(size, 2) - 1).bit_length() + 1, 2) // 2
+        self.mask: int = (1 << self.half_bits) - 1
+
+    def encrypt(self, value: int) -> int:
+        '''
+        Applies Feistel network to value of the power of two domain
+        '''
+        left, right = value >> self.half_bits, value & self.mask
+        for i in range(self.rounds):
+            round_value: int = seeded_hash(self.seed, f'{i}:{right}', self.half_bits)
+            left, right = right, left ^ round_value
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        '''
+        Returns position that index is moved to
+        '''
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value: int = self.encrypt(index)
+        while value >= self.size:
+            value = self.encrypt(value)
+        return value
+
+    def window(self, offset: int, limit: int) -> List[int]:
+        '''
+        Returns permuted positions offset..offset + limit
+        '''
+        return [self[i] for i in range(max(offset, 0), min(offset + limit, self.size))]
+
+
+def shuffle_window(ids: List[str], seed: int, offset: int, limit: int,
+                   weights: Optional[Dict[str, int]] = None) -> List[str]:
+    '''
+    Returns window of ids shuffled with seed
+    If weights (play counts) are given, ids with bigger weight tend to go first:
+    weighted sampling without replacement with keys u^(1/(w + 1)), compared as logarithms
+    '''
+    if weights is None:
+        return [ids[i] for i in FeistelPermutation(len(ids), seed).window(offset, limit)]
+
+    def key(uuid: str) -> float:
+        uniform: float = (seeded_hash(seed, uuid, 53) + 1) / (2 ** 53 + 1)
+        return math.log(uniform) / (weights.get(uuid, 0) + 1)
+
+    return sorted(ids, key=key, reverse=True)[max(offset, 0):max(offset, 0) + limit]
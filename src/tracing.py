@@ -0,0 +1,296 @@
+'''
+Contains lightweight request tracing: spans kept in context variables, sampling and exporting
+'''
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    '''
+    One timed operation of a trace
+    '''
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, object]] = None):
+        '''
+        Starts span now with random id
+        '''
+        self.name: str = name
+        self.trace_id: str = trace_id
+        self.span_id: str = os.urandom(8).hex()
+        self.parent_id: Optional[str] = parent_id
+        self.attributes: Dict[str, object] = attributes or {}
+        self.start: int = time.time_ns()
+        self.end: Optional[int] = None
+
+    def export(self) -> dict:
+        '''
+        Returns span in OTLP JSON field names
+        '''
+        return {
+            'traceId': self.trace_id, 'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '', 'name': self.name,
+            'startTimeUnixNano': self.start, 'endTimeUnixNano': self.end,
+            'attributes': [{'key': key, 'value': {'stringValue': str(value)}}
+                           for key, value in self.attributes.items()],
+        }
+
+
+class SpanExporter:
+    '''
+    Class that sends finished spans in batches from background thread
+    to JSON lines file and/or HTTP collector. Spans are dropped if queue is full,
+    so tracing never blocks requests
+    '''
+    def __init__(self, path: str = '', endpoint: str = '', batch_size: int = 256,
+                 flush_seconds: float = 2, queue_size: int = 10000):
+        '''
+        Saves destinations; thread is started on first span
+        '''
+        self.path: str = path
+        self.endpoint: str = endpoint
+        self.batch_size: int = batch_size
+        self.flush_seconds: float = flush_seconds
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped: int = 0
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def export(self, span: Span):
+        '''
+        Queues span for sending
+        '''
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='span-exporter',
+                                                   daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(span.export())
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self, batch: List[dict]):
+        '''
+        Writes batch of spans to file and posts it to collector
+        '''
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as out:
+                out.writelines(json.dumps(span) + '\n' for span in batch)
+        if self.endpoint:
+            body: bytes = json.dumps({'resourceSpans': [{'scopeSpans': [{'spans': batch}]}]})\
+                .encode('utf-8')
+            request = urllib.request.Request(self.endpoint, body,
+                                             {'Content-Type': 'application/json'})
+            urllib.request.urlopen(request, timeout=5).close()
+
+    def run(self):
+        '''
+        Collects spans into batches and writes them until process exits
+        '''
+        while True:
+            batch: List[dict] = [self.queue.get()]
+            deadline: float = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception('Failed to export %d spans', len(batch))
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+current_trace: ContextVar[str] = ContextVar('current_trace', default='')
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    '''
+    Parses W3C traceparent header into trace id, parent span id and sampled flag
+    '''
+    if header is None:
+        return None
+    parts: List[str] = header.strip().split('-')
+    if (len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2
+            or parts[1] == '0' * 32):
+        return None
+    try:
+        flags: int = bytes.fromhex(parts[1] + parts[2] + parts[3])[-1]
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Tracer:
+    '''
+    Class that starts traces of requests and spans inside them
+    Spans are only created in sampled traces; elsewhere tracing costs one context lookup
+    '''
+    def __init__(self, sample_rate: float = 0.0, exporter: Optional[SpanExporter] = None):
+        '''
+        Saves share of requests to trace and exporter
+        '''
+        self.sample_rate: float = sample_rate
+        self.exporter: SpanExporter = exporter or SpanExporter()
+
+    def configure(self, settings: Mapping):
+        '''
+        Applies [tracing] table of config: share of traced requests and exporter
+        '''
+        self.sample_rate = settings['sample_rate']
+        self.exporter = SpanExporter(settings['file'], settings['endpoint'],
+                                     settings['batch_size'], settings['flush_seconds'],
+                                     settings['queue_size'])
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None) -> Tuple[str, Optional[Span]]:
+        '''
+        Returns trace id of request and its root span, if request is sampled
+        Trace id and sampling decision of traceparent header are used if it is valid
+        '''
+        parent: Optional[Tuple[str, str, bool]] = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < self.sample_rate
+        return trace_id, Span(name, trace_id, parent_id) if sampled else None
+
+    def finish(self, span: Span):
+        '''
+        Ends span and exports it
+        '''
+        span.end = time.time_ns()
+        self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        '''
+        Runs block inside child span of current one
+        '''
+        parent: Optional[Span] = current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        finally:
+            current_span.reset(token)
+            self.finish(span)
+
+    def add_span(self, name: str, duration: float, **attributes):
+        '''
+        Exports already finished child span of current one that took duration seconds
+        '''
+        parent: Optional[Span] = current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+            span.start -= int(duration * 1e9)
+            self.finish(span)
+
+
+# Traces nothing until app configures it on startup
+tracer = Tracer()
+
+
+def traced(function: Callable) -> Callable:
+    '''
+    Wraps sync or async function so its calls are spans named by its qualified name
+    '''
+    name: str = function.__qualname__
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            if current_span.get() is None:
+                return await function(*args, **kwargs)
+            with tracer.span(name):
+                return await function(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if current_span.get() is None:
+            return function(*args, **kwargs)
+        with tracer.span(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def trace_methods(cls: type) -> type:
+    '''
+    Class decorator that makes spans of all public methods defined in class
+    '''
+    for name, method in list(vars(cls).items()):
+        if inspect.isfunction(method) and not name.startswith('_'):
+            setattr(cls, name, traced(method))
+    return cls
+
+
+class TracingMiddleware:
+    '''
+    Middleware that starts trace of every request, names its root span
+    by route template and returns trace id in X-Trace-Id header
+    '''
+    def __init__(self, app: ASGIApp, request_tracer: Tracer = tracer):
+        '''
+        Saves tracer
+        '''
+        self.app: ASGIApp = app
+        self.tracer: Tracer = request_tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        '''
+        Runs request inside its root span
+        '''
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers: Mapping[bytes, bytes] = dict(scope.get('headers', ()))
+        traceparent: Optional[bytes] = headers.get(b'traceparent')
+        trace_id, span = self.tracer.start_trace(
+            scope['method'] + ' ' + scope['path'],
+            traceparent.decode('latin-1') if traceparent else None
+        )
+        trace_token = current_trace.set(trace_id)
+        span_token = current_span.set(span)
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                message = dict(message)
+                message['headers'] = list(message.get('headers', [])) + \
+                    [(b'x-trace-id', trace_id.encode())]
+                if span is not None:
+                    span.attributes['http.status_code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            if span is not None:
+                route = scope.get('route')
+                if route is not None:
+                    span.name = scope['method'] + ' ' + route.path
+                span.attributes['http.target'] = scope['path']
+                self.tracer.finish(span)
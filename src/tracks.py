@@ -1,16 +1,35 @@
 '''
 Module for operating with tracks: files, databases, etc
 '''
+import asyncio
 import os
-from typing import Optional
+import time
+import random
+import uuid as uuid_module
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple, Mapping, List
 
 from fastapi import UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from starlette.types import Receive, Scope, Send
 
 from src.db.track_controller import TrackController, Track, DBTrack, TrackUUID
+from src.db.play_controller import PlayCount, ChartEntry
 from src.responses import Error
 from src.users import UserHandler
+from src.waveform import PeaksBuilder
+from src.mp3 import audio_range, first_bitrate
+from src.caching import HTTPCache
+from src.headcache import HeadCache
+from src.filecache import FileCache, MappedFile, MappedFileResponse, parse_range
+from src.admission import StreamAdmission, TokenBucket
+from src.metrics import Registry, registry, stream_bytes
+from src.plays import PlayRecorder, PERIODS, CHART_PERIODS, chart_bucket
+from src.shuffle import ShuffleWindow, shuffle_window
 from src.config import config
+from src.resources import Resources
+from src.tracing import trace_methods
 
 class TrackWithFile(Track):
     '''
@@ -26,29 +45,105 @@ class DBTrackWithFile(DBTrack):
     file: UploadFile | None = None
 
 
+class ClosingStreamingResponse(StreamingResponse):
+    '''
+    StreamingResponse that calls on_close when it ends in any way,
+    even if client is gone before body is started
+    '''
+    def __init__(self, content: AsyncIterator[bytes], on_close: Callable[[], None],
+                 media_type: Optional[str] = None):
+        '''
+        Saves on_close
+        '''
+        super().__init__(content, media_type=media_type)
+        self.on_close: Callable[[], None] = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+@trace_methods
 class TrackHandler:
     '''
     Class that handles all operations with tracks
     '''
-    def __init__(self):
+    def __init__(self, resources: Resources, user_handler: UserHandler):
+        '''
+        Takes controllers, storage, caches and prefetch threads from shared resources
+        and initializes stream admission
         '''
-        Initializes database and storage path
+        self.controller: TrackController = resources.tracks
+        self.storage: str = resources.storage
+        self.user_handler: UserHandler = user_handler
+        self.peaks = PeaksBuilder(config['peaks_resolutions'])
+        self.cache = HTTPCache(config['cache'])
+        self.plays: PlayRecorder = resources.recorder
+        self.prefetch_bytes: int = config['prefetch_bytes']
+        self.prefetcher: ThreadPoolExecutor = resources.prefetcher
+        self.heads: HeadCache = resources.heads
+        self.files: FileCache = resources.files
+        self.admission = StreamAdmission(config['stream_max_per_user'],
+                                         config['stream_max_per_node'],
+                                         config['stream_rate_multiple'],
+                                         config['stream_burst_seconds'],
+                                         config['stream_node_mbps'] * 125000)
+        self.stream_default_bitrate: int = config['stream_default_kbps'] * 1000
+        self.stream_retry_after: int = config['stream_retry_after']
+        self.register_metrics(registry)
+
+    def register_metrics(self, metrics: Registry):
+        '''
+        Exposes streams, stream rejections and cache lookups of this handler in metrics
         '''
-        self.controller = TrackController(config['db_path'])
-        self.storage: str = config['storage_path']
-        self.user_handler = UserHandler()
-        os.makedirs(self.storage, exist_ok=True)
+        caches = {'head': self.heads, 'file': self.files}
+        metrics.callback('duradora_streams_in_flight', 'Streams being sent', 'gauge', (),
+                         lambda: {(): self.admission.total})
+        metrics.callback('duradora_streams_rejected_total', 'Streams rejected by admission control',
+                         'counter', ('status',),
+                         lambda: {(str(status),): count
+                                  for status, count in self.admission.rejected.items()})
+        metrics.callback('duradora_cache_hits_total', 'Lookups served from cache', 'counter',
+                         ('cache',), lambda: {(name,): cache.hits for name, cache in caches.items()})
+        metrics.callback('duradora_cache_misses_total', 'Lookups not served from cache',
+                         'counter', ('cache',),
+                         lambda: {(name,): cache.misses for name, cache in caches.items()})
+        metrics.callback('duradora_cache_hit_ratio', 'Share of lookups served from cache',
+                         'gauge', ('cache',),
+                         lambda: {(name,): cache.hits / max(cache.hits + cache.misses, 1)
+                                  for name, cache in caches.items()})
+        metrics.callback('duradora_file_cache_entries', 'Mapped files kept open in cache',
+                         'gauge', (), lambda: {(): len(self.files.files)})
 
 
     async def save_file(self, filename: str, file: UploadFile):
         '''
         Saves file to self.storage/filename
+        File is replaced at once, so streams of the old one keep reading it
         '''
         if file is None:
             return
         contents: bytes  = await file.read()
-        with open(self.storage + '/' + filename, 'wb') as newfile:
+        path: str = self.storage + '/' + filename
+        with open(path + '.tmp', 'wb') as newfile:
             newfile.write(contents)
+        os.replace(path + '.tmp', path)
+
+    def build_peaks(self, uuid: str):
+        '''
+        Precomputes waveform peaks of track with uuid if its file exists
+        '''
+        path: str = self.storage + '/' + uuid + '.mp3'
+        if os.path.exists(path):
+            self.peaks.save(path, self.storage + '/' + uuid + '.peaks')
+
+    async def save_peaks(self, uuid: str):
+        '''
+        Builds peaks in threadpool, so parsing of the whole file does not block event loop
+        '''
+        await run_in_threadpool(self.build_peaks, uuid)
 
     async def add_track(self, executor: str, track: TrackWithFile) -> TrackUUID | Error:
         '''
@@ -61,6 +156,7 @@ class TrackHandler:
 
             uuid: str = self.controller.create_track(track)
             await self.save_file(uuid + '.mp3', track.file)
+            await self.save_peaks(uuid)
         except Exception as e:
             return Error(error=repr(e))
 
@@ -83,7 +179,10 @@ class TrackHandler:
 
             self.controller.update_track(track)
             if track.file is not None:
+                self.heads.invalidate(track.uuid)
                 await self.save_file(track.uuid + '.mp3', track.file)
+                self.files.invalidate(track.uuid)
+                await self.save_peaks(track.uuid)
 
         except Exception as e:
             return Error(error=repr(e))
@@ -99,15 +198,246 @@ class TrackHandler:
             return Error(error="No such track found")
         return out
 
-    async def stream_track(self, uuid: str) -> StreamingResponse | Error:
+    async def stream_track(self, uuid: str, headers: Optional[Mapping[str, str]] = None,
+                           username: Optional[str] = None,
+                           client: Optional[str] = None) -> Response | Error:
         '''
         Streams track with uuid if its file exists
+        Answers with 304 if client already has the same file
+        Answers with 429 or 503 if user (or client address for anonymous users) or worker
+        has too many streams; stream is paced at a multiple of track bitrate
+        Supports single byte range requests; file is sent from memory map kept between requests
+        Head of popular files is sent from shared memory, so cold pages are not waited for
+        Records start of listening if stream starts from the beginning
+        and its completion if the end of file was sent
         '''
-        if not os.path.exists(self.storage + '/' + uuid + '.mp3'):
+        path: str = self.storage + '/' + uuid + '.mp3'
+        mapped: Optional[MappedFile] = self.files.acquire(uuid, path)
+        if mapped is None:
             return Error(error="No file for such track exists")
+        etag, last_modified, size = self.cache.stat_validators(mapped.stat)
+
+        response_headers = self.cache.headers('stream', etag, last_modified)
+        response_headers['Accept-Ranges'] = 'bytes'
+        if self.cache.is_fresh(headers or {}, etag, last_modified):
+            self.files.release(mapped)
+            return Response(status_code=304, headers=response_headers)
+
+        try:
+            byte_range: Optional[Tuple[int, int]] = parse_range((headers or {}).get('range'), size)
+        except ValueError:
+            self.files.release(mapped)
+            response_headers['Content-Range'] = f'bytes */{size}'
+            return Response(status_code=416, headers=response_headers)
+        start, end = byte_range or (0, size)
+        if byte_range is not None:
+            response_headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+
+        stream_client: str = username or 'ip:' + str(client)
+        rejected: Optional[int] = self.admission.acquire(stream_client)
+        if rejected is not None:
+            self.files.release(mapped)
+            return JSONResponse({'error': 'Too many streams, retry later'}, rejected,
+                                {'Retry-After': str(self.stream_retry_after)})
+        try:
+            bitrate: int = (first_bitrate(mapped.view(0, 65536).tobytes())
+                            or self.stream_default_bitrate)
+            pacer: TokenBucket = self.admission.pacer(bitrate)
+
+            head: bytes = b''
+            if start == 0:
+                head = self.heads.get(uuid, last_modified, size) or b''
+                if not head and self.heads.admit(uuid):
+                    self.heads.put(uuid, last_modified, size,
+                                   mapped.view(0, self.heads.head_size))
+                self.plays.record(uuid, username, 'start')
+                self.plays.flush_if_full()
+
+            def complete():
+                self.plays.record(uuid, username, 'complete')
+
+            return MappedFileResponse(self.files, mapped, start, end,
+                                      206 if byte_range is not None else 200, response_headers,
+                                      'audio/mp3', head, complete if end == size else None,
+                                      lambda: self.admission.release(stream_client),
+                                      lambda size: self.admission.delay(pacer, size))
+        except Exception:
+            self.admission.release(stream_client)
+            self.files.release(mapped)
+            raise
+
+    def read_head(self, uuid: str) -> Optional[Tuple[int, int, bytes]]:
+        '''
+        Finds audio frames of track file and reads first prefetch_bytes of them
+        Returns offset of audio end, offset right after read head and the head,
+        or None if there is no file
+        '''
+        path: str = self.storage + '/' + uuid + '.mp3'
+        try:
+            start, end = audio_range(path, os.path.getsize(path))
+            with open(path, 'rb') as stream:
+                stream.seek(start)
+                head: bytes = stream.read(min(self.prefetch_bytes, end - start))
+        except OSError:
+            return None
+        return end, start + len(head), head
+
+    async def stream_tracks(self, uuids: List[str], username: Optional[str] = None,
+                            client: Optional[str] = None) -> StreamingResponse | Response:
+        '''
+        Streams tracks one after another in one multipart/mixed response
+        Every part holds only audio frames of one track (no ID3 tags and Xing frames),
+        so parts can be joined without gaps. While a track is sent, the head
+        of the next one is read in background. Tracks without files are skipped
+        Response takes one stream of admission and is paced like stream_track
+        When response ends or client is gone, open file is closed, prefetch of the next
+        track is cancelled and stream is released
+        '''
+        stream_client: str = username or 'ip:' + str(client)
+        rejected: Optional[int] = self.admission.acquire(stream_client)
+        if rejected is not None:
+            return JSONResponse({'error': 'Too many streams, retry later'}, rejected,
+                                {'Retry-After': str(self.stream_retry_after)})
+        boundary: str = 'duradora-' + uuid_module.uuid4().hex
+
+        def iterfiles() -> Iterator[Tuple[bytes, Optional[TokenBucket]]]:
+            following: Optional[Future] = None
+            try:
+                for i, uuid in enumerate(uuids):
+                    head: Optional[Tuple[int, int, bytes]] = (following.result() if following
+                                                              else self.read_head(uuid))
+                    following = (self.prefetcher.submit(self.read_head, uuids[i + 1])
+                                 if i + 1 < len(uuids) else None)
+                    if head is None:
+                        continue
+                    end, position, data = head
+                    pacer: TokenBucket = self.admission.pacer(first_bitrate(data)
+                                                              or self.stream_default_bitrate)
+
+                    self.plays.record(uuid, username, 'start')
+                    yield (f'--{boundary}\r\nContent-Type: audio/mpeg\r\n'
+                           f'X-Track-Id: {uuid}\r\n'
+                           f'Content-Length: {end - position + len(data)}\r\n\r\n'
+                           ).encode(), None
+                    stream_bytes.inc('playlist', value=len(data))
+                    yield data, pacer
+                    with open(self.storage + '/' + uuid + '.mp3', 'rb') as stream:
+                        stream.seek(position)
+                        while position < end:
+                            chunk: bytes = stream.read(min(65536, end - position))
+                            if not chunk:
+                                break
+                            position += len(chunk)
+                            stream_bytes.inc('playlist', value=len(chunk))
+                            yield chunk, pacer
+                    yield b'\r\n', None
+                    self.plays.record(uuid, username, 'complete')
+                yield f'--{boundary}--\r\n'.encode(), None
+            finally:
+                if following is not None:
+                    following.cancel()
+
+        files: Iterator[Tuple[bytes, Optional[TokenBucket]]] = iterfiles()
+        closed: bool = False
 
-        def iterfile():
-            with open(self.storage + '/' + uuid + '.mp3', 'rb') as stream:
-                yield from stream
+        def close():
+            # next() of files runs in thread that is not cancelled, so it has returned here
+            nonlocal closed
+            if not closed:
+                closed = True
+                files.close()
+                self.admission.release(stream_client)
+
+        async def paced() -> AsyncIterator[bytes]:
+            try:
+                async for chunk, pacer in iterate_in_threadpool(files):
+                    if pacer is not None:
+                        wait: float = self.admission.delay(pacer, len(chunk))
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+                    yield chunk
+            finally:
+                close()
+
+        return ClosingStreamingResponse(paced(), close,
+                                        media_type=f'multipart/mixed; boundary={boundary}')
+
+    async def get_plays(self, uuid: str, period: str, limit: int) -> List[PlayCount] | Error:
+        '''
+        Returns number of plays of track in last limit periods ('hour' or 'day')
+        '''
+        if period not in PERIODS:
+            return Error(error="Period should be one of: " + ', '.join(PERIODS))
+        try:
+            return self.plays.controller.track_plays(uuid, period, limit)
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def get_top_tracks(self, period: str, bucket: Optional[int],
+                             limit: int) -> List[ChartEntry] | Error:
+        '''
+        Returns most played tracks of period ('day', 'week' or 'all')
+        Bucket is any time inside wanted period, current period by default
+        '''
+        if period not in CHART_PERIODS:
+            return Error(error="Period should be one of: " + ', '.join(CHART_PERIODS))
+        try:
+            start: int = chart_bucket(period, int(time.time()) if bucket is None else bucket)
+            return self.plays.controller.top_tracks(period, start, limit)
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def get_artist_top(self, artist: str, limit: int) -> List[ChartEntry] | Error:
+        '''
+        Returns most played tracks of artist of all time
+        '''
+        try:
+            return self.plays.controller.artist_top(artist, limit)
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def artist_radio(self, artist: str, seed: Optional[int], offset: int,
+                           limit: int, weighted: bool) -> ShuffleWindow | Error:
+        '''
+        Returns window of all tracks of artist shuffled with seed
+        Random seed is chosen if not given; it is returned so next windows use the same order
+        If weighted, often played tracks tend to go first
+        '''
+        try:
+            ids: List[str] = self.controller.artist_track_ids(artist)
+            seed = random.randrange(2 ** 31) if seed is None else seed
+            weights = self.plays.controller.play_counts(ids) if weighted else None
+            window: List[str] = shuffle_window(ids, seed, offset, limit, weights)
+            return ShuffleWindow(seed=seed, offset=offset, total=len(ids),
+                                 tracks=self.controller.find_tracks(window))
+        except Exception as e:
+            return Error(error=repr(e))
+
+    async def get_peaks(self, uuid: str, resolution: int,
+                        headers: Optional[Mapping[str, str]] = None) -> Response | Error:
+        '''
+        Returns precomputed waveform peaks of track as unsigned bytes.
+        Peaks are built on first request for tracks uploaded before they existed
+        '''
+        try:
+            peaks_path: str = self.storage + '/' + uuid + '.peaks'
+            if not os.path.exists(peaks_path):
+                await self.save_peaks(uuid)
+            validators: Optional[Tuple[str, float, int]] = self.cache.file_validators(peaks_path)
+            if validators is None:
+                return Error(error="No file for such track exists")
+
+            out: Optional[Tuple[int, bytes]] = self.peaks.load(peaks_path, resolution)
+            if out is None:
+                return Error(error="Peaks for this track are broken")
+
+            etag: str = validators[0][:-1] + f'-{out[0]}"'
+            response_headers = self.cache.headers('peaks', etag, validators[1])
+            if self.cache.is_fresh(headers or {}, etag, validators[1]):
+                return Response(status_code=304, headers=response_headers)
+        except Exception as e:
+            return Error(error=repr(e))
 
-        return StreamingResponse(iterfile(), media_type='audio/mp3')
+        response_headers['X-Peaks-Resolution'] = str(out[0])
+        return Response(content=out[1], media_type='application/octet-stream',
+                        headers=response_headers)
@@ -3,19 +3,21 @@ Module that contains some useful methods for handling users
 '''
 
 from src.db.user_controller import UserController, User
-from src.config import config
+from src.resources import Resources
 from src.responses import Error, Success
+from src.tracing import trace_methods
 
 
+@trace_methods
 class UserHandler:
     '''
     Class that implements some userful methods for handling users
     '''
-    def __init__(self):
+    def __init__(self, resources: Resources):
         '''
-        Initializes database
+        Takes user controller from shared resources
         '''
-        self.controller = UserController(config['db_path'])
+        self.controller: UserController = resources.users
 
     def is_admin(self, username: str) -> bool:
         '''
@@ -0,0 +1,150 @@
+'''
+Contains watchdog that measures event loop lag and catches stacks of calls that block the loop
+'''
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.metrics import DB_BUCKETS, Counter, Histogram, Registry, registry
+from src.profiler import collapse
+
+
+logger = logging.getLogger(__name__)
+
+
+class BlockedStack(BaseModel):
+    '''
+    Pydantic model representing stack of event loop thread caught while loop was blocked
+    '''
+    stack: List[str]
+    count: int
+    max_ms: float
+
+
+class LoopWatchdog:
+    '''
+    Class that runs heartbeat task in event loop and monitor thread beside it.
+    Heartbeat sleeps for interval and measures how late it wakes up: that is loop lag.
+    If heartbeat is late by more than threshold, monitor takes stack of loop thread,
+    which shows the call that blocks the loop, counts it and logs it
+    at most once in log_interval seconds. Top of stacks by count is kept
+    '''
+    def __init__(self, interval: float, threshold: float, log_interval: float, top: int,
+                 metrics: Registry = registry):
+        '''
+        Saves intervals in seconds and creates lag metrics in registry
+        '''
+        self.interval: float = interval
+        self.threshold: float = threshold
+        self.log_interval: float = log_interval
+        self.top: int = top
+        self.lag: float = 0.0
+        self.beats: int = 0
+        self.last_beat: float = time.monotonic()
+        self.captured: Optional[Tuple[int, str]] = None
+        self.logged: float = float('-inf')
+        self.suppressed: int = 0
+        self.stacks: Dict[str, BlockedStack] = {}
+        self.lock = threading.Lock()
+        self.loop_thread: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = threading.Event()
+        self.lags: Histogram = metrics.histogram('duradora_event_loop_delay_seconds',
+                                                 'Delay of event loop heartbeat', (), DB_BUCKETS)
+        self.blocks: Counter = metrics.counter('duradora_event_loop_blocked_total',
+                                               'Times event loop was blocked longer than threshold')
+        metrics.callback('duradora_event_loop_lag_seconds', 'Last measured event loop lag',
+                         'gauge', (), lambda: {(): self.lag})
+
+    def start(self):
+        '''
+        Starts heartbeat in running loop and monitor thread
+        '''
+        self.loop_thread = threading.get_ident()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.heartbeat())
+        threading.Thread(target=self.monitor, name='loop-watchdog', daemon=True).start()
+
+    def stop(self):
+        '''
+        Stops heartbeat and monitor
+        '''
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def heartbeat(self):
+        '''
+        Sleeps for interval in loop and measures lag of every wake up
+        '''
+        while True:
+            self.last_beat = time.monotonic()
+            self.beats += 1
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.monotonic() - self.last_beat - self.interval, 0.0)
+            self.lags.observe(value=self.lag)
+            captured: Optional[Tuple[int, str]] = self.captured
+            if captured is not None and captured[0] == self.beats:
+                with self.lock:
+                    entry: Optional[BlockedStack] = self.stacks.get(captured[1])
+                    if entry is not None:
+                        entry.max_ms = max(entry.max_ms, self.lag * 1000)
+
+    def check(self):
+        '''
+        Catches stack of loop thread if current heartbeat is late by threshold
+        Every late heartbeat is caught once
+        '''
+        beats: int = self.beats
+        late: float = time.monotonic() - self.last_beat - self.interval
+        if late < self.threshold or (self.captured is not None and self.captured[0] == beats):
+            return
+        frame: Optional[FrameType] = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return
+        stack: List[str] = collapse(frame)
+        key: str = ';'.join(stack)
+        self.captured = (beats, key)
+        self.blocks.inc()
+        with self.lock:
+            entry: Optional[BlockedStack] = self.stacks.get(key)
+            if entry is None:
+                if len(self.stacks) >= self.top:
+                    del self.stacks[min(self.stacks, key=lambda k: self.stacks[k].count)]
+                entry = self.stacks[key] = BlockedStack.model_construct(stack=stack, count=0,
+                                                                        max_ms=0.0)
+            entry.count += 1
+            entry.max_ms = max(entry.max_ms, late * 1000)
+
+        now: float = time.monotonic()
+        if now - self.logged < self.log_interval:
+            self.suppressed += 1
+            return
+        logger.warning('Event loop is blocked for %.0f ms (%d more blocks since last report), '
+                       'loop thread stack:\n%s', late * 1000, self.suppressed,
+                       ''.join(traceback.format_stack(frame)))
+        self.logged = now
+        self.suppressed = 0
+
+    def monitor(self):
+        '''
+        Checks heartbeat several times per threshold until stopped
+        '''
+        while not self.stopped.wait(self.threshold / 4):
+            self.check()
+
+    def report(self) -> List[BlockedStack]:
+        '''
+        Returns caught stacks, most frequent first
+        '''
+        with self.lock:
+            return sorted((entry.model_copy() for entry in self.stacks.values()),
+                          key=lambda entry: entry.count, reverse=True)
@@ -0,0 +1,120 @@
+'''
+Builds, stores and reads precomputed waveform peaks for tracks
+'''
+import os
+import struct
+import wave
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from src.mp3 import MP3Frame, skip_id3, parse_mp3_header, find_first_frame, frame_global_gain
+
+
+PEAKS_MAGIC = b'DPK1'
+
+
+class PeaksBuilder:
+    '''
+    Class that computes waveform peaks of audio files at several resolutions
+    and stores them as compact binary files of unsigned bytes
+    '''
+    def __init__(self, resolutions: List[int]):
+        '''
+        Saves resolutions (number of peaks) that should be precomputed
+        '''
+        self.resolutions: List[int] = sorted(resolutions)
+
+    def mp3_levels(self, data: bytes) -> List[int]:
+        '''
+        Returns loudness level of every frame of mp3 data
+        '''
+        levels: List[int] = []
+        frame: Optional[MP3Frame] = find_first_frame(data, skip_id3(data))
+        while frame is not None:
+            levels.append(frame_global_gain(data, frame))
+            offset: int = frame.offset + frame.length
+            frame = parse_mp3_header(data, offset)
+            if frame is None and offset < len(data):
+                frame = find_first_frame(data, offset)
+        return levels
+
+    def wav_levels(self, path: str) -> List[int]:
+        '''
+        Returns absolute peak of every 1152 samples of 16-bit PCM wav file
+        '''
+        levels: List[int] = []
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                return levels
+            step: int = 1152 * wav.getnchannels()
+            samples = array('h', wav.readframes(wav.getnframes()))
+        for i in range(0, len(samples), step):
+            chunk = samples[i:i + step]
+            levels.append(max(max(chunk), -min(chunk)))
+        return levels
+
+    def levels(self, path: str) -> List[int]:
+        '''
+        Returns raw loudness levels of audio file
+        '''
+        with open(path, 'rb') as audio:
+            data: bytes = audio.read()
+        if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+            return self.wav_levels(path)
+        return self.mp3_levels(data)
+
+    def build(self, path: str) -> Dict[int, array]:
+        '''
+        Computes peaks of audio file for every resolution
+        Peaks are normalized to 0..255
+        '''
+        levels: List[int] = self.levels(path)
+        low: int = min(levels, default=0)
+        span: int = max(max(levels, default=0) - low, 1)
+
+        out: Dict[int, array] = {}
+        for resolution in self.resolutions:
+            count: int = min(resolution, len(levels))
+            peaks = array('B')
+            for i in range(count):
+                bucket: List[int] = levels[i * len(levels) // count:
+                                           (i + 1) * len(levels) // count]
+                peaks.append((max(bucket) - low) * 255 // span)
+            out[resolution] = peaks
+        return out
+
+    def save(self, path: str, peaks_path: str):
+        '''
+        Computes peaks of audio file and writes them to peaks_path
+        File layout: magic, number of blocks, (resolution, length) for every block, blocks
+        '''
+        peaks: Dict[int, array] = self.build(path)
+        header: bytes = PEAKS_MAGIC + struct.pack('<H', len(peaks))
+        for resolution, block in peaks.items():
+            header += struct.pack('<II', resolution, len(block))
+
+        with open(peaks_path + '.tmp', 'wb') as peaks_file:
+            peaks_file.write(header)
+            for block in peaks.values():
+                block.tofile(peaks_file)
+        os.replace(peaks_path + '.tmp', peaks_path)
+
+    def load(self, peaks_path: str, resolution: int) -> Optional[Tuple[int, bytes]]:
+        '''
+        Reads peaks with smallest stored resolution that is not less than requested one
+        (or the largest stored one). Returns stored resolution and peaks, or None if file is broken
+        '''
+        with open(peaks_path, 'rb') as peaks_file:
+            head: bytes = peaks_file.read(6)
+            if len(head) < 6 or head[:4] != PEAKS_MAGIC:
+                return None
+            count: int = struct.unpack('<H', head[4:])[0]
+            blocks: List[Tuple[int, int]] = [struct.unpack('<II', peaks_file.read(8))
+                                             for _ in range(count)]
+            if not blocks:
+                return None
+
+            chosen: int = next((i for i, (stored, _) in enumerate(blocks) if stored >= resolution),
+                               len(blocks) - 1)
+            peaks_file.seek(6 + 8 * count + sum(length for _, length in blocks[:chosen]))
+            return blocks[chosen][0], peaks_file.read(blocks[chosen][1])
@@ -0,0 +1,70 @@
+'''
+Tests for admin module
+'''
+import unittest
+from unittest.mock import MagicMock
+
+from src.admin import AdminHandler
+from src.db.querylog import QueryLog
+from src.profiler import SamplingProfiler
+from src.responses import Error
+from src.metrics import Registry
+from src.watchdog import LoopWatchdog
+
+
+class MockAdminHandler(AdminHandler):
+    '''
+    Mocking AdminHandler so it does not connect to db
+    '''
+    def __init__(self):
+        '''
+        User handler is MagicMock, query log is empty, watchdog is not started
+        '''
+        self.user_handler = MagicMock()
+        self.query_log = QueryLog(10, 5)
+        self.profiler = SamplingProfiler(0.05, 0.001)
+        self.watchdog = LoopWatchdog(0.01, 0.05, 60, 10, Registry())
+
+
+class TestAdminHandler(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for AdminHandler class
+    '''
+    async def test_slow_queries(self):
+        '''
+        Tests for slow_queries method
+        '''
+        handler = MockAdminHandler()
+        handler.user_handler.is_admin.return_value = False
+        self.assertIsInstance(await handler.slow_queries('dora'), Error)
+
+        handler.user_handler.is_admin.return_value = True
+        handler.query_log.record(None, 'SELECT 1', (), 0.5, 1, 'f')
+        out = await handler.slow_queries('admin')
+        self.assertEqual(out[0].max_ms, 500)
+
+    async def test_blocking_calls(self):
+        '''
+        Tests for blocking_calls method
+        '''
+        handler = MockAdminHandler()
+        handler.user_handler.is_admin.return_value = False
+        self.assertIsInstance(await handler.blocking_calls('dora'), Error)
+
+        handler.user_handler.is_admin.return_value = True
+        self.assertEqual(await handler.blocking_calls('admin'), [])
+
+    async def test_profile(self):
+        '''
+        Tests for profile method
+        '''
+        handler = MockAdminHandler()
+        handler.user_handler.is_admin.return_value = False
+        self.assertIsInstance(await handler.profile('dora', 1, 1), Error)
+
+        handler.user_handler.is_admin.return_value = True
+        out = await handler.profile('admin', 1, 1)
+        self.assertIn(b'MainThread;', out.body)
+
+        handler.profiler.lock.acquire()
+        self.assertIsInstance(await handler.profile('admin', 1, 1), Error)
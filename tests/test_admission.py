@@ -0,0 +1,60 @@
+'''
+Tests for admission module
+'''
+import unittest
+from unittest.mock import patch
+
+from src.admission import TokenBucket, StreamAdmission
+
+
+class TestTokenBucket(unittest.TestCase):
+    '''
+    Tests for TokenBucket class
+    '''
+    @patch('time.monotonic')
+    def test_take(self, monotonic):
+        '''
+        Tests that borrowed tokens are paid with waiting
+        '''
+        monotonic.return_value = 100.0
+        bucket = TokenBucket(10, 20)
+        self.assertEqual(bucket.take(15), 0)
+        self.assertEqual(bucket.take(15), 1.0)
+        monotonic.return_value = 101.0
+        self.assertEqual(bucket.take(0), 0)
+        monotonic.return_value = 200.0
+        bucket.take(0)
+        self.assertEqual(bucket.tokens, 20)
+
+
+class TestStreamAdmission(unittest.TestCase):
+    '''
+    Tests for StreamAdmission class
+    '''
+    def test_acquire_release(self):
+        '''
+        Tests per-client and per-node limits
+        '''
+        admission = StreamAdmission(1, 2, 2.0, 1, 0)
+        self.assertIsNone(admission.acquire('a'))
+        self.assertEqual(admission.acquire('a'), 429)
+        self.assertIsNone(admission.acquire('b'))
+        self.assertEqual(admission.acquire('c'), 503)
+        admission.release('a')
+        self.assertIsNone(admission.acquire('c'))
+        self.assertEqual(admission.total, 2)
+        self.assertNotIn('a', admission.active)
+        self.assertEqual(admission.rejected, {429: 1, 503: 1})
+
+    @patch('time.monotonic')
+    def test_pacing(self, monotonic):
+        '''
+        Tests pacing at multiple of bitrate and node egress limit
+        '''
+        monotonic.return_value = 100.0
+        admission = StreamAdmission(1, 2, 2.0, 1, 1000)
+        pacer = admission.pacer(8000)
+        self.assertEqual((pacer.rate, pacer.capacity), (2000, 1000))
+        self.assertEqual(admission.delay(pacer, 1000), 0)
+        self.assertEqual(admission.delay(pacer, 1000), 1.0)
+        self.assertEqual(admission.delay(admission.pacer(8000), 1000), 2.0)
@@ -52,6 +52,17 @@ class TestAuth(unittest.TestCase):
         self.assertEqual(decoded['cringe'], True)
         self.assertIn('exp', decoded)
 
+    def test_token_username(self):
+        '''
+        Tests for token_username method
+        '''
+        auth = MockAuth()
+        self.assertIsNone(auth.token_username('anime'))
+        self.assertIsNone(auth.token_username(jwt.encode({'username': 'mmmity'}, key='anime')))
+        self.assertEqual(auth.token_username(auth.create_access_token({'username': 'mmmity'})),
+                         'mmmity')
+        auth.controller.find_user.assert_not_called()
+
 
 class TestAsyncs(unittest.IsolatedAsyncioTestCase):
     '''
@@ -83,6 +94,21 @@ class TestAsyncs(unittest.IsolatedAsyncioTestCase):
         good_token_res = await auth.get_current_user(good_token)
         self.assertEqual(good_token_res, test_user)
 
+    async def test_get_optional_user(self):
+        '''
+        Tests for get_optional_user method
+        '''
+        auth = MockAuth()
+        self.assertIsNone(await auth.get_optional_user(None))
+        self.assertIsNone(await auth.get_optional_user('anime'))
+
+        test_user = User(username='mmmity', password='')
+        auth.controller.find_user.return_value = test_user
+        good_token = jwt.encode({'username': 'mmmity'},
+                                key=config['secret_key'],
+                                algorithm=config['algorithm'])
+        self.assertEqual(await auth.get_optional_user(good_token), test_user)
+
     async def test_register_user(self):
         '''
         Tests for register_user method
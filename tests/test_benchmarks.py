@@ -0,0 +1,94 @@
+'''
+Tests for benchmark statistics and in-process client
+'''
+import unittest
+
+from benchmarks.client import ASGIClient, multipart
+from benchmarks.report import compare, percentile, summarize
+
+
+class TestReport(unittest.TestCase):
+    '''
+    Tests for statistics and baseline comparison
+    '''
+    def test_percentile(self):
+        '''
+        Tests nearest-rank percentiles
+        '''
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1), 100)
+        self.assertEqual(percentile([], 0.5), 0)
+
+    def test_summarize(self):
+        '''
+        Tests throughput and latencies in milliseconds
+        '''
+        result = summarize([0.002, 0.001, 0.004, 0.003], 1, 2)
+        self.assertEqual(result['requests'], 4)
+        self.assertEqual(result['errors'], 1)
+        self.assertEqual(result['rps'], 2)
+        self.assertEqual(result['p50_ms'], 2)
+        self.assertEqual(result['max_ms'], 4)
+
+    def test_compare(self):
+        '''
+        Tests detection of regressions with default and per-scenario thresholds
+        '''
+        old = {'requests': 100, 'errors': 0, 'rps': 100, 'p50_ms': 10, 'p99_ms': 20}
+        baseline = {'thresholds': {'strict': 0.05},
+                    'results': {'stream': old, 'strict': old, 'gone': old}}
+        new = {'requests': 100, 'errors': 0, 'rps': 90, 'p50_ms': 11, 'p99_ms': 21}
+        self.assertEqual(compare({'stream': new, 'strict': new}, baseline, 0.2),
+                         ['strict: p50_ms 10 -> 11 (+10%)', 'strict: rps 100 -> 90 (-10%)'])
+
+        slow = {'requests': 100, 'errors': 2, 'rps': 100, 'p50_ms': 10, 'p99_ms': 30}
+        self.assertEqual(compare({'stream': slow}, baseline, 0.2),
+                         ['stream: p99_ms 20 -> 30 (+50%)', 'stream: errors 0 -> 2'])
+
+        fast = {'requests': 100, 'errors': 0, 'rps': 100, 'p50_ms': 0.1, 'p99_ms': 0.2}
+        noisy = dict(fast, p99_ms=0.4)
+        self.assertEqual(compare({'stream': noisy}, {'results': {'stream': fast}}, 0.2), [])
+
+
+class TestASGIClient(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for ASGIClient class
+    '''
+    async def test_request(self):
+        '''
+        Tests that request is passed to app and whole response is read
+        '''
+        async def app(scope, receive, send):
+            if scope['type'] == 'lifespan':
+                while True:
+                    message = await receive()
+                    await send({'type': message['type'] + '.complete'})
+                    if message['type'] == 'lifespan.shutdown':
+                        return
+            message = await receive()
+            headers = dict(scope['headers'])
+            await send({'type': 'http.response.start', 'status': 201,
+                        'headers': [(b'x-query', scope['query_string'])]})
+            await send({'type': 'http.response.body', 'body': headers[b'x-test'],
+                        'more_body': True})
+            await send({'type': 'http.response.body', 'body': message['body']})
+
+        client = ASGIClient(app)
+        await client.startup()
+        result = await client.request('POST', '/', {'a': 'b c'}, {'X-Test': 'head'}, b'body')
+        await client.shutdown()
+        self.assertEqual(result.status, 201)
+        self.assertEqual(result.headers['x-query'], 'a=b+c')
+        self.assertEqual(result.body, b'headbody')
+
+    def test_multipart(self):
+        '''
+        Tests encoding of file field
+        '''
+        body, content_type = multipart({'file': ('a.mp3', b'data', 'audio/mpeg')}, 'xyz')
+        self.assertEqual(content_type, 'multipart/form-data; boundary=xyz')
+        self.assertEqual(body, b'--xyz\r\nContent-Disposition: form-data; name="file"; '
+                               b'filename="a.mp3"\r\nContent-Type: audio/mpeg\r\n\r\n'
+                               b'data\r\n--xyz--\r\n')
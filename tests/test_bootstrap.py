@@ -0,0 +1,64 @@
+'''
+Tests for bootstrap module
+'''
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from src.bootstrap import bootstrap, schema_version
+from src.config import config
+from src.db.schema import SCHEMA_VERSION
+
+
+class TestBootstrap(unittest.TestCase):
+    '''
+    Tests for bootstrap function
+    '''
+    def setUp(self):
+        '''
+        Creates settings with database in temporary directory
+        '''
+        self.dir: str = tempfile.mkdtemp()
+        self.settings: dict = dict(config, db_path=os.path.join(self.dir, 'test.db'))
+
+    def tearDown(self):
+        '''
+        Removes temporary directory
+        '''
+        shutil.rmtree(self.dir)
+
+    def test_bootstrap(self):
+        '''
+        Tests that schema and admin are created once and initialized database is left alone
+        '''
+        bootstrap(self.settings)
+        con = sqlite3.connect(self.settings['db_path'])
+        self.assertEqual(schema_version(con), SCHEMA_VERSION)
+        self.assertEqual(con.execute('SELECT username, is_admin FROM users').fetchall(),
+                         [('admin', 1)])
+        tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master "
+                                                "WHERE type = 'table'")}
+        self.assertTrue({'tracks', 'playlists', 'plays', 'charts', 'related_tracks',
+                         'related_state'} <= tables)
+
+        con.execute('DELETE FROM users')
+        con.commit()
+        bootstrap(self.settings)
+        self.assertEqual(con.execute('SELECT COUNT(*) FROM users').fetchone(), (0,))
+        con.close()
+
+    def test_existing_admin(self):
+        '''
+        Tests that database without version gets schema, but existing admin is kept
+        '''
+        con = sqlite3.connect(self.settings['db_path'])
+        con.execute('CREATE TABLE users(username STRING PRIMARY KEY, password STRING, '
+                    'is_admin BOOLEAN)')
+        con.execute("INSERT INTO users VALUES('admin', 'hash', 1)")
+        con.commit()
+        bootstrap(self.settings)
+        self.assertEqual(con.execute('SELECT password FROM users').fetchall(), [('hash',)])
+        self.assertEqual(schema_version(con), SCHEMA_VERSION)
+        con.close()
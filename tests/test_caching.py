@@ -0,0 +1,75 @@
+'''
+Tests for caching module
+'''
+import unittest
+import os
+import random
+from email.utils import formatdate
+
+from fastapi import Response
+
+from src.caching import HTTPCache
+
+
+class TestHTTPCache(unittest.TestCase):
+    '''
+    Tests for HTTPCache class
+    '''
+    def setUp(self):
+        '''
+        Creates cache with one policy
+        '''
+        self.cache = HTTPCache({'track': 'public, max-age=60'})
+
+    def test_etag(self):
+        '''
+        Tests that etag depends only on given values
+        '''
+        self.assertEqual(self.cache.etag('u', 't'), self.cache.etag('u', 't'))
+        self.assertNotEqual(self.cache.etag('u', 't'), self.cache.etag('u', 'a'))
+        self.assertTrue(self.cache.etag('u').startswith('"'))
+
+    def test_file_validators(self):
+        '''
+        Tests getting validators from file stat
+        '''
+        path = 'test_file' + random.randbytes(5).hex()
+        self.assertIsNone(self.cache.file_validators(path))
+        with open(path, 'wb') as f:
+            f.write(b'contents')
+        etag, _, size = self.cache.file_validators(path)
+        os.remove(path)
+        self.assertEqual(size, 8)
+        self.assertTrue(etag.startswith('"8-'))
+
+    def test_is_fresh(self):
+        '''
+        Tests conditional request headers
+        '''
+        etag = self.cache.etag('u')
+        self.assertFalse(self.cache.is_fresh({}, etag, 1000))
+        self.assertTrue(self.cache.is_fresh({'if-none-match': '"a", ' + etag}, etag))
+        self.assertTrue(self.cache.is_fresh({'if-none-match': 'W/' + etag}, etag))
+        self.assertTrue(self.cache.is_fresh({'if-none-match': '*'}, etag))
+        self.assertFalse(self.cache.is_fresh({'if-none-match': '"a"'}, etag, 1000))
+
+        since = {'if-modified-since': formatdate(1000, usegmt=True)}
+        self.assertTrue(self.cache.is_fresh(since, etag, 1000.5))
+        self.assertFalse(self.cache.is_fresh(since, etag, 1001))
+        self.assertFalse(self.cache.is_fresh(since, etag))
+        self.assertFalse(self.cache.is_fresh({'if-modified-since': 'garbage'}, etag, 1000))
+
+    def test_respond(self):
+        '''
+        Tests setting headers and answering with 304
+        '''
+        etag = self.cache.etag('u')
+        response = Response()
+        self.assertIsNone(self.cache.respond({}, response, 'track', etag, 0))
+        self.assertEqual(response.headers['etag'], etag)
+        self.assertEqual(response.headers['cache-control'], 'public, max-age=60')
+        self.assertIn('last-modified', response.headers)
+
+        out = self.cache.respond({'if-none-match': etag}, Response(), 'other', etag)
+        self.assertEqual(out.status_code, 304)
+        self.assertNotIn('cache-control', out.headers)
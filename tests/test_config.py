@@ -0,0 +1,28 @@
+'''
+Tests for config module
+'''
+import os
+import tempfile
+import unittest
+
+from src.config import Config
+
+
+class TestConfig(unittest.TestCase):
+    '''
+    Tests for Config class
+    '''
+    def test_lazy(self):
+        '''
+        Tests that file is read on first access only
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, 'config.toml')
+            config = Config(path)
+            self.assertIsNone(config.data)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('db_path = "a.db"\n[cache]\ntrack = "no-cache"\n')
+            self.assertEqual(config['db_path'], 'a.db')
+            os.remove(path)
+            config['db_path'] = 'b.db'
+            self.assertEqual(dict(config), {'db_path': 'b.db', 'cache': {'track': 'no-cache'}})
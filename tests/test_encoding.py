@@ -0,0 +1,74 @@
+'''
+Tests for encoding module
+'''
+import unittest
+import gzip
+import json
+
+from src import encoding
+from src.encoding import ResponseEncoder, parse_quality
+from src.db.track_controller import DBTrack
+
+
+class TestEncoding(unittest.TestCase):
+    '''
+    Tests for ResponseEncoder class
+    '''
+    def setUp(self):
+        '''
+        Creates encoder and some data
+        '''
+        self.encoder = ResponseEncoder({'min_size': 100, 'gzip_level': 6, 'brotli_quality': 4})
+        self.tracks = [DBTrack(uuid=str(i), title='Doradura', artists='Dora') for i in range(10)]
+
+    def test_parse_quality(self):
+        '''
+        Tests parsing of headers with q-values
+        '''
+        self.assertEqual(parse_quality('gzip;q=0.5, br, *;q=0'), {'gzip': 0.5, 'br': 1.0, '*': 0})
+        self.assertEqual(parse_quality(None), {})
+        self.assertEqual(parse_quality('gzip;q=lol'), {'gzip': 0.0})
+
+    def test_content_encoding(self):
+        '''
+        Tests choosing compression
+        '''
+        self.assertIsNone(self.encoder.content_encoding(None))
+        self.assertIsNone(self.encoder.content_encoding('identity'))
+        self.assertIsNone(self.encoder.content_encoding('gzip;q=0'))
+        self.assertEqual(self.encoder.content_encoding('deflate, gzip'), 'gzip')
+        self.assertIn(self.encoder.content_encoding('*'), ('gzip', 'br'))
+
+    def test_encode(self):
+        '''
+        Tests serializing and compressing models
+        '''
+        out = self.encoder.encode({}, self.tracks)
+        self.assertEqual(out.media_type, 'application/json')
+        self.assertNotIn('content-encoding', out.headers)
+        self.assertEqual(json.loads(out.body)[0], self.tracks[0].model_dump())
+
+        out = self.encoder.encode({'accept-encoding': 'gzip'}, self.tracks)
+        self.assertEqual(out.headers['content-encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(out.body))[9]['uuid'], '9')
+
+        out = self.encoder.encode({'accept-encoding': 'gzip'}, self.tracks[0])
+        self.assertNotIn('content-encoding', out.headers)
+
+    @unittest.skipIf(encoding.msgpack is None, 'msgpack is not installed')
+    def test_encode_msgpack(self):
+        '''
+        Tests MessagePack bodies
+        '''
+        out = self.encoder.encode({'accept': 'application/msgpack'}, self.tracks)
+        self.assertEqual(out.media_type, 'application/msgpack')
+        self.assertEqual(encoding.msgpack.unpackb(out.body)[0]['title'], 'Doradura')
+
+    def test_wants_msgpack(self):
+        '''
+        Tests choosing media type
+        '''
+        self.assertFalse(self.encoder.wants_msgpack('application/json'))
+        self.assertFalse(self.encoder.wants_msgpack(None))
+        self.assertEqual(self.encoder.wants_msgpack('application/msgpack'),
+                         encoding.msgpack is not None)
@@ -0,0 +1,97 @@
+'''
+Tests for events module
+'''
+import unittest
+import json
+
+from src.events import PlaylistEvents
+
+
+class TestPlaylistEvents(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for PlaylistEvents class
+    '''
+    async def test_publish(self):
+        '''
+        Tests fan-out and overflow of slow subscribers
+        '''
+        events = PlaylistEvents(queue_size=2, keepalive=1)
+        first = events.subscribe(['a', 'b'])
+        second = events.subscribe(['a'])
+
+        events.publish('b', 1)
+        events.publish('c', 1)
+        self.assertEqual(first.qsize(), 1)
+        self.assertEqual(second.qsize(), 0)
+
+        events.publish('a', 1)
+        events.publish('a', 2)
+        self.assertEqual(first.get_nowait(), {'type': 'resync'})
+        self.assertTrue(first.empty())
+        self.assertEqual(second.qsize(), 2)
+
+        events.unsubscribe(first, ['a', 'b'])
+        events.unsubscribe(second, ['a'])
+        self.assertEqual(events.subscribers, {})
+
+    async def test_stream(self):
+        '''
+        Tests generating server-sent events
+        '''
+        events = PlaylistEvents(queue_size=2, keepalive=0.01)
+        stream = events.stream(['a'], lambda: {'a': 3})
+
+        first = await anext(stream)
+        self.assertEqual(json.loads(first.split('data: ')[1]), {'type': 'change', 'playlist': 'a',
+                                                                'version': 3})
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+        events.publish('a', 4)
+        self.assertTrue((await anext(stream)).startswith('event: change\n'))
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+
+        await stream.aclose()
+        self.assertEqual(events.subscribers, {})
+
+    async def test_subscribe_first(self):
+        '''
+        Tests that change published while versions are read is not lost
+        '''
+        events = PlaylistEvents(queue_size=2, keepalive=10)
+
+        def versions():
+            events.publish('a', 4)
+            return {'a': 3}
+
+        stream = events.stream(['a'], versions)
+        self.assertIn('"version": 3', await anext(stream))
+        self.assertIn('"version": 4', await anext(stream))
+        await stream.aclose()
+
+    async def test_poll(self):
+        '''
+        Tests that changes made by other workers are found by polling versions
+        '''
+        events = PlaylistEvents(queue_size=2, keepalive=0.01)
+        current = {'a': 3}
+        stream = events.stream(['a'], lambda: dict(current))
+        await anext(stream)
+        current['a'] = 5
+        self.assertIn('"version": 5', await anext(stream))
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+        await stream.aclose()
+
+    async def test_revoked(self):
+        '''
+        Tests that stream ends when playlist is gone from versions
+        '''
+        events = PlaylistEvents(queue_size=2, keepalive=0.01)
+        current = {'a': 3, 'b': 1}
+        stream = events.stream(['a', 'b'], lambda: dict(current))
+        await anext(stream)
+        await anext(stream)
+        del current['b']
+        self.assertEqual(json.loads((await anext(stream)).split('data: ')[1]),
+                         {'type': 'revoked', 'playlists': ['b']})
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(events.subscribers, {})
@@ -0,0 +1,154 @@
+'''
+Tests for filecache module
+'''
+import asyncio
+import unittest
+import os
+import shutil
+import random
+
+from src.filecache import FileCache, MappedFileResponse, parse_range
+
+
+class TestParseRange(unittest.TestCase):
+    '''
+    Tests for parse_range function
+    '''
+    def test_parse_range(self):
+        '''
+        Tests parsing of single byte ranges
+        '''
+        self.assertIsNone(parse_range(None, 10))
+        self.assertIsNone(parse_range('bytes=1-2,4-5', 10))
+        self.assertIsNone(parse_range('items=1-2', 10))
+        self.assertIsNone(parse_range('bytes=-', 10))
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 5))
+        self.assertEqual(parse_range('bytes=2-', 10), (2, 10))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 10))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 10))
+        self.assertEqual(parse_range('bytes=-30', 10), (0, 10))
+        self.assertRaises(ValueError, parse_range, 'bytes=10-', 10)
+        self.assertRaises(ValueError, parse_range, 'bytes=4-2', 10)
+
+
+class TestFileCache(unittest.TestCase):
+    '''
+    Tests for FileCache class
+    '''
+    def setUp(self):
+        '''
+        Creates directory with files
+        '''
+        self.storage = 'test_storage' + random.randbytes(5).hex()
+        os.makedirs(self.storage)
+        for name in 'abc':
+            with open(f'{self.storage}/{name}', 'wb') as f:
+                f.write(name.encode() * 4)
+
+    def tearDown(self):
+        '''
+        Removes directory
+        '''
+        shutil.rmtree(self.storage)
+
+    def test_acquire_release(self):
+        '''
+        Tests mapping, reuse and eviction of files
+        '''
+        cache = FileCache(2, 100)
+        self.assertIsNone(cache.acquire('x', self.storage + '/x'))
+
+        a = cache.acquire('a', self.storage + '/a')
+        self.assertEqual(bytes(a.view(1, 3)), b'aa')
+        self.assertIs(cache.acquire('a', self.storage + '/a'), a)
+        self.assertEqual((a.refs, cache.hits, cache.misses), (2, 1, 1))
+        cache.release(a)
+        cache.release(a)
+
+        b = cache.acquire('b', self.storage + '/b')
+        cache.acquire('c', self.storage + '/c')
+        self.assertEqual(list(cache.files), ['b', 'c'])
+        self.assertTrue(a.stale)
+        self.assertTrue(a.map.closed)
+
+        cache.invalidate('b')
+        self.assertFalse(b.map.closed)
+        self.assertEqual(bytes(b.view(0, 4)), b'bbbb')
+        cache.release(b)
+        self.assertTrue(b.map.closed)
+
+    def test_revalidate(self):
+        '''
+        Tests that replaced file is mapped again
+        '''
+        cache = FileCache(2, 0)
+        a = cache.acquire('a', self.storage + '/a')
+        cache.release(a)
+        with open(self.storage + '/a.tmp', 'wb') as f:
+            f.write(b'new')
+        os.replace(self.storage + '/a.tmp', self.storage + '/a')
+        new = cache.acquire('a', self.storage + '/a')
+        self.assertIsNot(new, a)
+        self.assertEqual(bytes(new.view(0, new.size)), b'new')
+        cache.release(new)
+
+
+class TestMappedFileResponse(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for MappedFileResponse class
+    '''
+    def setUp(self):
+        '''
+        Creates file of several chunks
+        '''
+        self.storage = 'test_storage' + random.randbytes(5).hex()
+        os.makedirs(self.storage)
+        with open(self.storage + '/a', 'wb') as f:
+            f.write(b'a' * (MappedFileResponse.chunk_size * 3))
+
+    def tearDown(self):
+        '''
+        Removes directory
+        '''
+        shutil.rmtree(self.storage)
+
+    async def run_response(self, receive) -> tuple:
+        '''
+        Sends file through response with given receive
+        Returns called callbacks, sent bytes and references of file left
+        '''
+        cache = FileCache(2, 100)
+        mapped = cache.acquire('a', self.storage + '/a')
+        called = []
+        response = MappedFileResponse(cache, mapped, 0, mapped.size,
+                                      on_complete=lambda: called.append('complete'),
+                                      on_close=lambda: called.append('close'))
+        sent = []
+
+        async def send(message):
+            await asyncio.sleep(0)
+            sent.append(len(message.get('body', b'')))
+
+        await response({'type': 'http'}, receive, send)
+        return called, sum(sent), mapped.refs
+
+    async def test_complete(self):
+        '''
+        Tests that whole file is sent while client stays
+        '''
+        async def receive():
+            await asyncio.Event().wait()
+
+        self.assertEqual(await self.run_response(receive),
+                         (['close', 'complete'], MappedFileResponse.chunk_size * 3, 0))
+
+    async def test_disconnect(self):
+        '''
+        Tests that sending stops on disconnect and stream is not completed
+        '''
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        called, sent, refs = await self.run_response(receive)
+        self.assertEqual((called, refs), (['close'], 0))
+        self.assertLess(sent, MappedFileResponse.chunk_size * 3)
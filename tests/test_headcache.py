@@ -0,0 +1,75 @@
+'''
+Tests for headcache module
+'''
+import unittest
+import os
+
+from src.headcache import HeadCache
+
+
+class TestHeadCache(unittest.TestCase):
+    '''
+    Tests for HeadCache class
+    '''
+    def setUp(self):
+        '''
+        Creates cache with two sets of two slots
+        '''
+        self.path = 'test_heads.cache'
+        self.cache = HeadCache(self.path, 4, 2, 8, 2)
+
+    def tearDown(self):
+        '''
+        Removes cache file
+        '''
+        self.cache.map.close()
+        os.remove(self.path)
+
+    def test_admit(self):
+        '''
+        Tests that file is admitted after several streams
+        '''
+        self.assertFalse(self.cache.admit('a'))
+        self.assertTrue(self.cache.admit('a'))
+        self.assertFalse(self.cache.admit('a'))
+
+    def test_get_put(self):
+        '''
+        Tests storing heads and checking that file was not changed
+        '''
+        self.assertIsNone(self.cache.get('a', 1.0, 100))
+        self.cache.put('a', 1.0, 100, b'0123456789')
+        self.assertEqual(self.cache.get('a', 1.0, 100), b'01234567')
+        self.assertIsNone(self.cache.get('a', 2.0, 100))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertAlmostEqual(self.cache.hit_rate(), 1 / 3)
+
+        other = HeadCache(self.path, 4, 2, 8, 2)
+        self.assertEqual(other.get('a', 1.0, 100), b'01234567')
+        other.map.close()
+
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a', 1.0, 100))
+
+    def test_eviction(self):
+        '''
+        Tests that least recently used slot of set is replaced
+        '''
+        keys = [str(i) for i in range(50)]
+        same = [key for key in keys if self.cache.slots(key) == self.cache.slots(keys[0])][:3]
+        self.cache.put(same[0], 1.0, 1, b'a')
+        self.cache.put(same[1], 1.0, 1, b'b')
+        self.cache.get(same[0], 1.0, 1)
+        self.cache.put(same[2], 1.0, 1, b'c')
+        self.assertEqual(self.cache.get(same[0], 1.0, 1), b'a')
+        self.assertIsNone(self.cache.get(same[1], 1.0, 1))
+        self.assertEqual(self.cache.get(same[2], 1.0, 1), b'c')
+
+    def test_torn_slot(self):
+        '''
+        Tests that slot with broken contents is a miss
+        '''
+        self.cache.put('a', 1.0, 100, b'01234567')
+        offset = self.cache.find('a')
+        self.cache.map[offset + 68] ^= 0xff
+        self.assertIsNone(self.cache.get('a', 1.0, 100))
@@ -0,0 +1,127 @@
+'''
+Tests for metrics module
+'''
+import unittest
+import threading
+
+from src.metrics import Registry, MetricsMiddleware, format_labels
+
+
+class TestMetrics(unittest.TestCase):
+    '''
+    Tests for metric classes and Registry
+    '''
+    def test_format_labels(self):
+        '''
+        Tests escaping of label values
+        '''
+        self.assertEqual(format_labels((), ()), '')
+        self.assertEqual(format_labels(('a', 'b'), ('x"y', 'z\\')), '{a="x\\"y",b="z\\\\"}')
+        self.assertEqual(format_labels(('a',), ('x',), 'le="1"'), '{a="x",le="1"}')
+
+    def test_counter(self):
+        '''
+        Tests that counter sums values of all threads
+        '''
+        registry = Registry()
+        counter = registry.counter('requests_total', 'Requests', ('route',))
+        self.assertIs(registry.counter('requests_total', 'Requests', ('route',)), counter)
+
+        def work():
+            for _ in range(1000):
+                counter.inc('/a')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc('/b', value=2)
+        self.assertEqual(counter.value('/a'), 4000)
+        self.assertEqual(registry.render(),
+                         '# HELP requests_total Requests\n# TYPE requests_total counter\n'
+                         'requests_total{route="/a"} 4000\nrequests_total{route="/b"} 2\n')
+
+    def test_histogram(self):
+        '''
+        Tests cumulative buckets, sum and count
+        '''
+        registry = Registry()
+        histogram = registry.histogram('seconds', 'Time', (), (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value=value)
+        self.assertEqual(histogram.samples(), [
+            'seconds_bucket{le="0.1"} 2', 'seconds_bucket{le="1"} 3',
+            'seconds_bucket{le="+Inf"} 4', 'seconds_sum 5.65', 'seconds_count 4',
+        ])
+
+    def test_callback(self):
+        '''
+        Tests metrics read on render and skipping of broken ones
+        '''
+        registry = Registry()
+        registry.callback('in_flight', 'Streams', 'gauge', ('kind',), lambda: {('x',): 3})
+        registry.callback('broken', 'Broken', 'gauge', (), lambda: 1 / 0)
+        self.assertEqual(registry.render(),
+                         '# HELP in_flight Streams\n# TYPE in_flight gauge\nin_flight{kind="x"} 3\n')
+
+    def test_callback_replaced(self):
+        '''
+        Tests that callback of later registration is read, not the first one
+        '''
+        registry = Registry()
+        registry.callback('cached', 'Files', 'gauge', (), lambda: {(): 1})
+        registry.callback('cached', 'Files', 'gauge', (), lambda: {(): 2})
+        self.assertIn('cached 2\n', registry.render())
+
+
+class TestMetricsMiddleware(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for MetricsMiddleware class
+    '''
+    async def test_middleware(self):
+        '''
+        Tests that requests are observed by route template and status
+        '''
+        class Route:
+            path = '/user/{username}/playlists'
+
+        async def app(scope, receive, send):
+            scope['route'] = Route()
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+
+        async def send(message):
+            pass
+
+        registry = Registry()
+        middleware = MetricsMiddleware(app, registry)
+        await middleware({'type': 'http', 'method': 'GET', 'path': '/user/dora/playlists'},
+                         None, send)
+        self.assertIn(('/user/{username}/playlists', 'GET', '404'),
+                      middleware.requests.values())
+
+
+class TestControllerTiming(unittest.TestCase):
+    '''
+    Tests that controller methods are timed
+    '''
+    def test_timed(self):
+        '''
+        Tests wrapping of public methods of controller subclasses
+        '''
+        from src.db.controller import Controller, untimed
+        from src.metrics import db_seconds
+
+        class SomeController(Controller):
+            def query(self):
+                return self.cur.execute('SELECT 1').fetchone()
+
+            @untimed
+            def convert(self, t):
+                return t[0]
+
+        controller = SomeController(':memory:')
+        self.assertEqual(controller.convert(controller.query()), 1)
+        self.assertEqual(SomeController.query.__name__, 'query')
+        self.assertEqual(db_seconds.values()[('SomeController', 'query')][-1], 1)
+        self.assertNotIn(('SomeController', 'convert'), db_seconds.values())
@@ -0,0 +1,85 @@
+'''
+Tests for mp3 module
+'''
+import unittest
+import os
+
+from src.mp3 import (parse_mp3_header, find_first_frame, skip_id3, frame_global_gain,
+                     audio_range, first_bitrate)
+
+
+def make_frame(gains) -> bytes:
+    '''
+    Makes mono MPEG1 Layer III 128kbps 44100Hz frame with global_gain of both granules set
+    '''
+    side = 0
+    for granule, gain in enumerate(gains):
+        position = 18 + granule * 59 + 21
+        side |= gain << (17 * 8 - position - 8)
+    frame = b'\xff\xfb\x90\xc0' + side.to_bytes(17, 'big')
+    return frame + b'\x00' * (417 - len(frame))
+
+
+class TestMP3Parsing(unittest.TestCase):
+    '''
+    Tests for mp3 frame parsing functions
+    '''
+    def test_parse_mp3_header(self):
+        '''
+        Tests parsing of frame header
+        '''
+        frame = parse_mp3_header(make_frame([0, 0]), 0)
+        self.assertEqual(frame.length, 417)
+        self.assertEqual(frame.bitrate, 128000)
+        self.assertEqual(frame.sample_rate, 44100)
+        self.assertEqual(frame.channels, 1)
+        self.assertIsNone(parse_mp3_header(b'\xff\xfb', 0))
+        self.assertIsNone(parse_mp3_header(b'\x00\xfb\x90\xc0', 0))
+
+    def test_find_first_frame(self):
+        '''
+        Tests searching for first frame after garbage and ID3 tag
+        '''
+        tag = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'\xff' * 5
+        data = tag + b'\x00\xff\xfb' + make_frame([1, 2]) * 2
+        self.assertEqual(skip_id3(data), 15)
+        self.assertEqual(find_first_frame(data, skip_id3(data)).offset, 18)
+        self.assertIsNone(find_first_frame(b'\x00' * 100))
+
+    def test_frame_global_gain(self):
+        '''
+        Tests extracting global_gain from side info
+        '''
+        data = make_frame([100, 170])
+        self.assertEqual(frame_global_gain(data, parse_mp3_header(data, 0)), 170)
+
+    def test_audio_range(self):
+        '''
+        Tests cutting ID3 tags and Xing frame off audio
+        '''
+        info = bytearray(make_frame([0, 0]))
+        info[4 + 17:4 + 21] = b'Info'
+        tag = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'\xff' * 5
+        data = tag + bytes(info) + make_frame([1, 2]) * 2 + b'TAG' + b'\x00' * 125
+        path = 'test_audio_range.mp3'
+        with open(path, 'wb') as f:
+            f.write(data)
+        try:
+            self.assertEqual(audio_range(path, len(data)), (15 + 417, 15 + 417 * 3))
+            with open(path, 'wb') as f:
+                f.write(b'\x00' * 10)
+            self.assertEqual(audio_range(path, 10), (0, 10))
+        finally:
+            os.remove(path)
+
+    def test_first_bitrate(self):
+        '''
+        Tests reading bitrate of first audio frame
+        '''
+        info = bytearray(make_frame([0, 0])[:104])
+        info[2] = 0x10
+        info[4 + 17:4 + 21] = b'Info'
+        self.assertEqual(parse_mp3_header(bytes(info), 0).length, 104)
+        self.assertEqual(first_bitrate(bytes(info) + make_frame([1, 2])), 128000)
+        self.assertEqual(first_bitrate(make_frame([1, 2]) * 2), 128000)
+        self.assertIsNone(first_bitrate(b'\x00' * 100))
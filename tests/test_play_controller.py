@@ -0,0 +1,73 @@
+'''
+Tests for play_controller module
+'''
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+from src.db.play_controller import PlayController, PlayCount, ChartEntry
+
+
+class TestPlayController(unittest.TestCase):
+    '''
+    Tests for PlayController class
+    '''
+    @patch('sqlite3.connect')
+    def setUp(self, _):
+        '''
+        Creates controller with mocked connection
+        '''
+        self.controller = PlayController('.db')
+
+    def test_record(self):
+        '''
+        Tests writing events and rollups
+        '''
+        self.controller.cur.fetchall.return_value = [('t', 'Dora, Dura')]
+        self.controller.record([('t', 'u', 'start', 0)], [('day', 0, 't', 'u', 1, 0)],
+                               [('all', 0, 't', 1), ('day', 0, 't', 1)])
+        self.assertEqual(self.controller.cur.executemany.call_count, 4)
+        self.controller.cur.executemany.assert_called_with(
+            'INSERT INTO artist_charts VALUES(?, ?, ?) '
+            'ON CONFLICT(artist, track) DO UPDATE SET plays = plays + excluded.plays',
+            [('Dora', 't', 1), ('Dura', 't', 1)]
+        )
+        self.controller.con.commit.assert_called_once()
+
+    def test_record_rollback(self):
+        '''
+        Tests that failed write is rolled back and not committed
+        '''
+        self.controller.cur.executemany.side_effect = [None, sqlite3.OperationalError]
+        self.assertRaises(sqlite3.OperationalError, self.controller.record,
+                          [('t', 'u', 'start', 0)], [('day', 0, 't', 'u', 1, 0)], [])
+        self.controller.con.rollback.assert_called_once()
+        self.controller.con.commit.assert_not_called()
+
+    def test_charts(self):
+        '''
+        Tests reading charts
+        '''
+        self.controller.cur.fetchall.return_value = [('t', 'title', None, 5)]
+        entry = ChartEntry(uuid='t', title='title', plays=5)
+        self.assertEqual(self.controller.top_tracks('day', 0, 1), [entry])
+        self.assertEqual(self.controller.artist_top('Dora', 1), [entry])
+
+        self.controller.prune_charts('day', 0)
+        self.controller.con.commit.assert_called_once()
+
+    def test_track_plays(self):
+        '''
+        Tests reading rollups of track
+        '''
+        self.controller.cur.fetchall.return_value = [(86400, 3, 1)]
+        self.assertEqual(self.controller.track_plays('t', 'day', 1),
+                         [PlayCount(bucket=86400, starts=3, completes=1)])
+
+    def test_play_counts(self):
+        '''
+        Tests reading all-time plays of tracks
+        '''
+        self.controller.cur.fetchall.return_value = [('t', 5)]
+        self.assertEqual(self.controller.play_counts(['t', 'u']), {'t': 5})
+        self.controller.cur.execute.assert_called_once()
@@ -3,8 +3,10 @@ Tests for playlist_controller module
 '''
 import unittest
 from unittest.mock import patch
+import random
 
-from src.db.playlist_controller import PlaylistController, Playlist, DBPlaylist, Access
+from src.db.playlist_controller import (PlaylistController, Playlist, DBPlaylist, Access,
+                                        RelatedTrack, diff_tracks, cooccurrence_delta)
 
 class TestPlaylistController(unittest.TestCase):
     '''
@@ -20,9 +22,10 @@ class TestPlaylistController(unittest.TestCase):
                               title='t',
                               creator='c',
                               access=Access.PUBLIC,
-                              tracks=['something']
+                              tracks=['something'],
+                              version=3
                             )
-        self.entry = ('u', 't', 'c', 0, '["something"]')
+        self.entry = ('u', 't', 'c', 0, '["something"]', 3)
 
     def test_create_playlist(self):
         '''
@@ -56,10 +59,172 @@ class TestPlaylistController(unittest.TestCase):
         self.controller.cur.fetchall.return_value = [self.entry, self.entry]
         self.assertEqual(self.controller.user_playlists('u'), [self.playlist, self.playlist])
 
+    def test_playlist_versions(self):
+        '''
+        Tests reading versions of several playlists at once
+        '''
+        self.controller.cur.fetchall.return_value = [('u', 3, 'c', 0)]
+        self.assertEqual(self.controller.playlist_versions(['u', 'v']), [('u', 3, 'c', 0)])
+        self.controller.cur.execute.assert_called_once_with(
+            'SELECT uuid, version, creator, access FROM playlists WHERE uuid IN (?, ?)', ['u', 'v']
+        )
+
     def test_update_playlist(self):
         '''
         Tests updating playlist
         '''
+        self.controller.cur.fetchone.return_value = None
+        self.controller.update_playlist(self.playlist)
+        self.controller.con.commit.assert_not_called()
+
+        self.controller.cur.fetchone.return_value = ('["other", "something"]', 3, 0)
         self.controller.update_playlist(self.playlist)
-        self.controller.cur.execute.assert_called_once()
         self.controller.con.commit.assert_called_once()
+        self.controller.cur.executemany.assert_any_call(
+            'INSERT INTO playlist_changes VALUES(?, ?, ?, ?, ?)',
+            [('u', 4, 'remove', 'other', None)]
+        )
+        self.controller.cur.executemany.assert_any_call(
+            'DELETE FROM related_tracks WHERE track = ? AND other = ? AND weight <= 0',
+            [('other', 'something'), ('something', 'other')]
+        )
+        self.assertEqual(self.playlist.version, 4)
+
+    def test_update_access(self):
+        '''
+        Tests that counts of playlist are removed when it stops being public
+        and that too many changes are left to rebuild
+        '''
+        self.controller.cur.fetchone.return_value = ('["other", "something"]', 3, 0)
+        self.playlist.access = Access.PRIVATE
+        self.controller.update_playlist(self.playlist)
+        inserted = [sorted(call.args[1]) for call in self.controller.cur.executemany.call_args_list
+                    if call.args[0].startswith('INSERT INTO related_tracks')]
+        self.assertEqual(inserted, [[('other', 'something', -1), ('something', 'other', -1)]])
+
+        self.controller.cur.reset_mock()
+        self.controller.related_max_delta = 1
+        self.playlist.access = Access.PUBLIC
+        self.playlist.tracks = ['other', 'something']
+        self.controller.cur.fetchone.return_value = ('["other", "something"]', 4, 2)
+        self.controller.update_playlist(self.playlist)
+        self.controller.cur.execute.assert_any_call('UPDATE related_state SET stale = 1')
+        self.assertFalse(any(call.args[0].startswith('INSERT INTO related_tracks')
+                             for call in self.controller.cur.executemany.call_args_list))
+
+    def test_add_cooccurrences(self):
+        '''
+        Tests that tracks which gained counts are trimmed to top ones
+        '''
+        self.controller.related_top = 7
+        self.controller.add_cooccurrences([('a', 'b', 1), ('b', 'a', 1), ('c', 'd', -1)])
+        call = self.controller.cur.executemany.call_args_list[-1]
+        self.assertTrue(call.args[0].startswith('DELETE FROM related_tracks WHERE track = ?1'))
+        self.assertEqual(sorted(call.args[1]), [('a', 7), ('b', 7)])
+
+    def test_changes_since(self):
+        '''
+        Tests reading change log
+        '''
+        self.controller.changelog_versions = 2
+        self.assertIsNone(self.controller.changes_since(self.playlist, 4))
+        self.assertIsNone(self.controller.changes_since(self.playlist, -1))
+        self.assertIsNone(self.controller.changes_since(self.playlist, 0))
+
+        self.controller.cur.fetchall.return_value = [(3, 'add', 'something', 0)]
+        changes = self.controller.changes_since(self.playlist, 2)
+        self.assertEqual(changes[0].op, 'add')
+        self.assertEqual(changes[0].position, 0)
+
+    def test_related_tracks(self):
+        '''
+        Tests reading and rebuilding co-occurrence counts
+        '''
+        self.controller.cur.fetchall.return_value = [('a', 't', None, 2)]
+        self.assertEqual(self.controller.related_tracks('b', 1),
+                         [RelatedTrack(uuid='a', title='t', weight=2)])
+
+        self.controller.related_top = 1
+        self.controller.cur.fetchone.return_value = (2, 5.0)
+        self.controller.cur.fetchall.return_value = [('["a", "b", "c"]',), ('["a", "c"]',)]
+        self.assertTrue(self.controller.rebuild_related())
+        sql, rows = self.controller.cur.executemany.call_args.args
+        self.assertEqual(sql, 'INSERT INTO related_tracks VALUES(?, ?, ?)')
+        self.assertEqual(sorted(rows), [('a', 'c', 2), ('b', 'a', 1), ('c', 'a', 2)])
+        self.controller.cur.execute.assert_called_with('UPDATE related_state SET stale = 0')
+        self.controller.con.commit.assert_called_once()
+
+        self.controller.cur.fetchone.side_effect = [(2, 5.0), (2, 6.0)]
+        self.assertFalse(self.controller.rebuild_related())
+        self.controller.cur.executemany.assert_called_once()
+
+
+class TestCooccurrenceDelta(unittest.TestCase):
+    '''
+    Tests for cooccurrence_delta function
+    '''
+    def counts(self, playlists, max_size):
+        '''
+        Counts co-occurrences of playlists directly
+        '''
+        out = {}
+        for tracks in playlists:
+            if len(tracks) <= max_size:
+                for a in tracks:
+                    for b in tracks:
+                        if a != b:
+                            out[(a, b)] = out.get((a, b), 0) + 1
+        return out
+
+    def test_random(self):
+        '''
+        Tests that applying deltas of random updates gives direct counts
+        '''
+        rng = random.Random(42)
+        playlists = [[] for _ in range(5)]
+        counts = {}
+        for _ in range(300):
+            i = rng.randrange(5)
+            new = rng.sample(range(12), rng.randint(0, 8))
+            for a, b, delta in cooccurrence_delta(playlists[i], new, 6):
+                counts[(a, b)] = counts.get((a, b), 0) + delta
+                if counts[(a, b)] == 0:
+                    del counts[(a, b)]
+            playlists[i] = new
+            self.assertEqual(counts, self.counts(playlists, 6))
+
+
+class TestDiffTracks(unittest.TestCase):
+    '''
+    Tests for diff_tracks function
+    '''
+    def apply(self, tracks, ops):
+        '''
+        Applies operations like a client would
+        '''
+        tracks = list(tracks)
+        for op, track, position in ops:
+            if op != 'add':
+                tracks.remove(track)
+            if op != 'remove':
+                tracks.insert(position, track)
+        return tracks
+
+    def test_simple(self):
+        '''
+        Tests single operations
+        '''
+        self.assertEqual(diff_tracks(['a', 'b'], ['a', 'b']), [])
+        self.assertEqual(diff_tracks(['a'], ['a', 'b']), [('add', 'b', 1)])
+        self.assertEqual(diff_tracks(['a', 'b'], ['b']), [('remove', 'a', None)])
+        self.assertEqual(diff_tracks(['a', 'b', 'c'], ['c', 'a', 'b']), [('move', 'c', 0)])
+
+    def test_random(self):
+        '''
+        Tests that applying diff of random lists gives the new list
+        '''
+        rng = random.Random(42)
+        for _ in range(200):
+            old = rng.sample(range(20), rng.randint(0, 10))
+            new = rng.sample(range(20), rng.randint(0, 10))
+            self.assertEqual(self.apply(old, diff_tracks(old, new)), new)
@@ -4,9 +4,10 @@ Tests for playlists module
 import unittest
 from unittest.mock import MagicMock, AsyncMock
 
-from src.playlists import PlaylistHandler, PlaylistForCreation, PlaylistUUID
-from src.db.playlist_controller import DBPlaylist, Access
-from src.db.track_controller import Track
+from src.playlists import (PlaylistHandler, PlaylistForCreation, PlaylistUUID, PlaylistDelta,
+                           PlaylistBatch, PlaylistOperation)
+from src.db.playlist_controller import DBPlaylist, Access, PlaylistChange
+from src.db.track_controller import Track, DBTrack
 from src.responses import Error, Success
 
 
@@ -20,7 +21,10 @@ class MockPlaylistHandler(PlaylistHandler):
         '''
         self.controller = MagicMock()
         self.track_controller = MagicMock()
+        self.play_controller = MagicMock()
         self.user_handler = MagicMock()
+        self.events = MagicMock()
+        self.batch_limit = 3
 
 
 class TestPlaylistHandler(unittest.IsolatedAsyncioTestCase):
@@ -71,6 +75,7 @@ class TestPlaylistHandler(unittest.IsolatedAsyncioTestCase):
         )
         self.assertIsInstance(await handler.add_track_to_playlist('u', 'p', 't'), Success)
         handler.controller.update_playlist.assert_called_once()
+        handler.events.publish.assert_called_once()
 
         handler.controller.find_playlist.side_effect = KeyError
         self.assertIsInstance(await handler.add_track_to_playlist('u', 'p', 't'), Error)
@@ -156,8 +161,151 @@ class TestPlaylistHandler(unittest.IsolatedAsyncioTestCase):
         handler.get_playlist.return_value = Error(error='error')
         self.assertIsInstance(await handler.search_playlist('', '', ''), Error)
 
-        handler.track_controller.find_track.return_value = Track(title='Doradura')
+        handler.track_controller.find_tracks.return_value = [Track(title='Doradura'),
+                                                             Track(title='Doradura'),
+                                                             Track()]
         handler.get_playlist.return_value = DBPlaylist(creator='c', uuid='u', tracks=['a', 'b'])
 
         self.assertEqual(len(await handler.search_playlist('', '', 'Dora')), 2)
         self.assertEqual(len(await handler.search_playlist('', '', 'Oora')), 0)
+
+    async def test_get_changes(self):
+        '''
+        Tests for get_changes method
+        '''
+        handler = MockPlaylistHandler()
+        handler.get_playlist = AsyncMock()
+
+        handler.get_playlist.return_value = Error(error='error')
+        self.assertIsInstance(await handler.get_changes('', '', 0), Error)
+
+        handler.get_playlist.return_value = DBPlaylist(creator='c', uuid='u', tracks=['a'],
+                                                       version=5)
+        handler.controller.changes_since.return_value = None
+        delta = await handler.get_changes('', '', 0)
+        self.assertTrue(delta.full)
+        self.assertEqual(delta.tracks, ['a'])
+
+        change = PlaylistChange(version=5, op='add', track='a', position=0)
+        handler.controller.changes_since.return_value = [change]
+        self.assertEqual(await handler.get_changes('', '', 4),
+                         PlaylistDelta(uuid='u', version=5, changes=[change]))
+
+        handler.controller.changes_since.side_effect = KeyError()
+        self.assertIsInstance(await handler.get_changes('', '', 4), Error)
+
+    async def test_watch_playlists(self):
+        '''
+        Tests for watch_playlists method
+        '''
+        handler = MockPlaylistHandler()
+        handler.get_playlist = AsyncMock()
+
+        handler.get_playlist.return_value = Error(error='error')
+        self.assertIsInstance(await handler.watch_playlists('', ['a']), Error)
+
+        handler.get_playlist.return_value = DBPlaylist(creator='c', uuid='u', version=2)
+        handler.user_handler.is_admin.return_value = False
+        out = await handler.watch_playlists('', ['u'])
+        self.assertEqual(out.media_type, 'text/event-stream')
+        playlist_ids, versions = handler.events.stream.call_args.args
+        self.assertEqual(playlist_ids, ['u'])
+        handler.controller.playlist_versions.return_value = [('u', 3, 'c', int(Access.LINK))]
+        self.assertEqual(versions(), {'u': 3})
+        handler.controller.playlist_versions.assert_called_with(['u'])
+        handler.controller.playlist_versions.return_value = [('u', 4, 'c', int(Access.PRIVATE))]
+        self.assertEqual(versions(), {})
+        handler.controller.playlist_versions.return_value = []
+        self.assertEqual(versions(), {})
+
+    def test_apply_operations(self):
+        '''
+        Tests for apply_operations method
+        '''
+        handler = MockPlaylistHandler()
+        tracks = ['a', 'b']
+        operations = [PlaylistOperation(op='add', track_id='c', position=0),
+                      PlaylistOperation(op='add', track_id='d'),
+                      PlaylistOperation(op='remove', track_id='a'),
+                      PlaylistOperation(op='move', track_id='d', position=1)]
+        self.assertIsNone(handler.apply_operations(tracks, operations))
+        self.assertEqual(tracks, ['c', 'd', 'b'])
+
+        for operation in [PlaylistOperation(op='add', track_id='c'),
+                          PlaylistOperation(op='remove', track_id='a'),
+                          PlaylistOperation(op='move', track_id='c'),
+                          PlaylistOperation(op='add', track_id='e', position=5)]:
+            self.assertIsNotNone(handler.apply_operations(['c'], [operation]))
+
+    async def test_apply_batch(self):
+        '''
+        Tests for apply_batch method
+        '''
+        handler = MockPlaylistHandler()
+        handler.user_handler.is_admin.return_value = False
+        add = PlaylistOperation(op='add', track_id='t')
+
+        self.assertIsInstance(await handler.apply_batch('u', PlaylistBatch(
+            playlist_id='p', operations=[add] * 4
+        )), Error)
+
+        handler.controller.find_playlist.return_value = None
+        batch = PlaylistBatch(playlist_id='p', operations=[add, add])
+        self.assertIsInstance(await handler.apply_batch('u', batch), Error)
+
+        handler.controller.find_playlist.return_value = DBPlaylist(creator='not_u', uuid='p')
+        self.assertIsInstance(await handler.apply_batch('u', batch), Error)
+
+        handler.controller.find_playlist.return_value = DBPlaylist(creator='u', uuid='p')
+        self.assertIsInstance(await handler.apply_batch('u', batch), Error)
+        handler.controller.update_playlist.assert_not_called()
+
+        handler.controller.find_playlist.return_value = DBPlaylist(creator='u', uuid='p')
+        batch = PlaylistBatch(playlist_id='p', operations=[add])
+        self.assertIsInstance(await handler.apply_batch('u', batch), Success)
+        handler.controller.update_playlist.assert_called_once()
+        handler.events.publish.assert_called_once()
+
+        handler.controller.find_playlist.side_effect = KeyError()
+        self.assertIsInstance(await handler.apply_batch('u', batch), Error)
+
+    async def test_get_related(self):
+        '''
+        Tests for get_related method
+        '''
+        handler = MockPlaylistHandler()
+        handler.controller.related_tracks.return_value = []
+        self.assertEqual(await handler.get_related('t', 5), [])
+        handler.controller.related_tracks.assert_called_once_with('t', 5)
+
+        handler.controller.related_tracks.side_effect = KeyError()
+        self.assertIsInstance(await handler.get_related('t', 5), Error)
+
+    async def test_shuffle_playlist(self):
+        '''
+        Tests for shuffle_playlist method
+        '''
+        handler = MockPlaylistHandler()
+        handler.get_playlist = AsyncMock()
+
+        handler.get_playlist.return_value = Error(error='error')
+        self.assertIsInstance(await handler.shuffle_playlist('', '', 1, 0, 2, False), Error)
+
+        handler.get_playlist.return_value = DBPlaylist(creator='c', uuid='u',
+                                                       tracks=['a', 'b', 'c'])
+        handler.track_controller.find_tracks.side_effect = lambda ids: [DBTrack(uuid=i)
+                                                                        for i in ids]
+        out = await handler.shuffle_playlist('', '', None, 0, 2, False)
+        self.assertEqual(out.total, 3)
+        self.assertEqual(len(out.tracks), 2)
+        again = await handler.shuffle_playlist('', '', out.seed, 0, 3, False)
+        self.assertEqual(again.tracks[:2], out.tracks)
+        handler.play_controller.play_counts.assert_not_called()
+
+        handler.play_controller.play_counts.return_value = {}
+        out = await handler.shuffle_playlist('', '', 1, 0, 3, True)
+        self.assertEqual(len(out.tracks), 3)
+        handler.play_controller.play_counts.assert_called_once_with(['a', 'b', 'c'])
+
+        handler.track_controller.find_tracks.side_effect = KeyError()
+        self.assertIsInstance(await handler.shuffle_playlist('', '', 1, 0, 2, False), Error)
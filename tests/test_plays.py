@@ -0,0 +1,101 @@
+'''
+Tests for plays module
+'''
+import unittest
+from unittest.mock import MagicMock, patch
+import threading
+
+from src.plays import PlayRecorder, chart_bucket
+
+
+class TestPlayRecorder(unittest.TestCase):
+    '''
+    Tests for PlayRecorder class
+    '''
+    def setUp(self):
+        '''
+        Creates recorder with mocked controller
+        '''
+        self.recorder = PlayRecorder(MagicMock(), batch_size=3, flush_seconds=1,
+                                     chart_retention=2)
+
+    @patch('time.time')
+    def test_rollups(self, mock_time: MagicMock):
+        '''
+        Tests aggregation of events into hourly and daily rows
+        '''
+        mock_time.return_value = 86400 + 3600 + 5
+        self.recorder.record('t', 'u', 'start')
+        self.recorder.record('t', 'u', 'start')
+        self.recorder.record('t', None, 'complete')
+        mock_time.return_value = 86400 + 5
+        self.recorder.record('t', 'u', 'complete')
+
+        rollups = sorted(self.recorder.rollups(self.recorder.buffer))
+        self.assertEqual(rollups, [
+            ('day', 86400, 't', '', 0, 1),
+            ('day', 86400, 't', 'u', 2, 1),
+            ('hour', 86400, 't', 'u', 0, 1),
+            ('hour', 86400 + 3600, 't', '', 0, 1),
+            ('hour', 86400 + 3600, 't', 'u', 2, 0),
+        ])
+
+    def test_chart_bucket(self):
+        '''
+        Tests periods of charts
+        '''
+        self.assertEqual(chart_bucket('day', 86400 * 3 + 5), 86400 * 3)
+        self.assertEqual(chart_bucket('all', 86400 * 3 + 5), 0)
+        self.assertEqual(chart_bucket('week', 86400 * 4), 86400 * 4)
+        self.assertEqual(chart_bucket('week', 86400 * 10 + 5), 86400 * 4)
+        self.assertEqual(chart_bucket('week', 86400 * 11), 86400 * 11)
+
+    @patch('time.time')
+    def test_charts(self, mock_time: MagicMock):
+        '''
+        Tests counting plays for charts
+        '''
+        mock_time.return_value = 86400 * 11 + 5
+        self.recorder.record('t', 'u', 'start')
+        self.recorder.record('t', 'v', 'start')
+        self.recorder.record('t', 'u', 'complete')
+        self.assertEqual(sorted(self.recorder.charts(self.recorder.buffer)), [
+            ('all', 0, 't', 2), ('day', 86400 * 11, 't', 2), ('week', 86400 * 11, 't', 2)
+        ])
+
+        self.recorder.prune_charts()
+        self.recorder.controller.prune_charts.assert_any_call('day', 86400 * 9)
+        self.recorder.controller.prune_charts.assert_any_call('week', 86400 * -3)
+        self.assertEqual(self.recorder.controller.prune_charts.call_count, 2)
+
+    def test_flush(self):
+        '''
+        Tests batching of writes
+        '''
+        self.recorder.flush()
+        self.recorder.controller.record.assert_not_called()
+
+        threads = [threading.Thread(target=self.recorder.record, args=('t', 'u', 'start'))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.recorder.flush_if_full()
+        self.recorder.controller.record.assert_not_called()
+
+        self.recorder.record('t', 'u', 'complete')
+        self.recorder.flush_if_full()
+        self.recorder.controller.record.assert_called_once()
+        self.assertEqual(len(self.recorder.controller.record.call_args[0][0]), 3)
+        self.assertEqual(self.recorder.buffer, [])
+
+    def test_flush_error(self):
+        '''
+        Tests that events are kept if writing fails
+        '''
+        self.recorder.controller.record.side_effect = KeyError()
+        self.recorder.record('t', 'u', 'start')
+        with self.assertRaises(KeyError):
+            self.recorder.flush()
+        self.assertEqual(len(self.recorder.buffer), 1)
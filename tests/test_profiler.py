@@ -0,0 +1,46 @@
+'''
+Tests for profiler module
+'''
+import unittest
+import sys
+import threading
+from collections import Counter
+
+from src.profiler import SamplingProfiler, collapse
+
+
+class TestProfiler(unittest.TestCase):
+    '''
+    Tests for SamplingProfiler class
+    '''
+    def test_collapse(self):
+        '''
+        Tests that stack is listed from outermost function
+        '''
+        def inner():
+            return collapse(sys._getframe())
+
+        stack = inner()
+        self.assertEqual(stack[-1], __name__ + ':TestProfiler.test_collapse.<locals>.inner')
+        self.assertEqual(stack[-2], __name__ + ':TestProfiler.test_collapse')
+
+    def test_sample(self):
+        '''
+        Tests sampling of other threads
+        '''
+        event = threading.Event()
+
+        def waiting():
+            event.wait()
+
+        thread = threading.Thread(target=waiting, name='waiter')
+        thread.start()
+        stacks = Counter()
+        try:
+            SamplingProfiler(1, 0.001).sample(stacks)
+        finally:
+            event.set()
+            thread.join()
+        self.assertTrue(any(stack.startswith('waiter;') and 'waiting' in stack
+                            for stack in stacks))
+        self.assertFalse(any(stack.startswith('MainThread;') for stack in stacks))
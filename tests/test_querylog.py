@@ -0,0 +1,84 @@
+'''
+Tests for querylog module
+'''
+import unittest
+import sqlite3
+
+from src.db.querylog import QueryLog, TracedCursor
+
+
+class TestTracedCursor(unittest.TestCase):
+    '''
+    Tests for TracedCursor and QueryLog classes
+    '''
+    def setUp(self):
+        '''
+        Creates in-memory database with traced cursor
+        '''
+        self.con = sqlite3.connect(':memory:')
+        self.cur = self.con.cursor(factory=TracedCursor)
+        self.cur.log = QueryLog(0, 3)
+
+    def tearDown(self):
+        '''
+        Closes database
+        '''
+        self.con.close()
+
+    def run_queries(self):
+        '''
+        Creates table and runs statements of all kinds
+        '''
+        self.cur.execute('CREATE TABLE playlists(uuid TEXT, creator TEXT)')
+        self.cur.executemany('INSERT INTO playlists VALUES(?, ?)', [('a', 'dora'), ('b', 'dora')])
+        self.cur.execute('SELECT * FROM playlists WHERE creator = ?', ('dora',))
+        return self.cur.fetchall()
+
+    def test_report(self):
+        '''
+        Tests that statements are reported with rows, callers and plans
+        '''
+        with self.assertLogs('src.db.querylog', 'WARNING'):
+            self.assertEqual(len(self.run_queries()), 2)
+        report = {entry.sql: entry for entry in self.cur.log.report()}
+        self.assertEqual(len(report), 3)
+
+        select = report['SELECT * FROM playlists WHERE creator = ?']
+        self.assertEqual(select.caller, 'TestTracedCursor.run_queries')
+        self.assertEqual(select.rows, 2)
+        self.assertTrue(any('SCAN' in line for line in select.plan))
+        self.assertEqual(report['INSERT INTO playlists VALUES(?, ?)'].rows, 2)
+
+    def test_pending(self):
+        '''
+        Tests that SELECT without fetch is reported on next statement
+        '''
+        self.cur.log.threshold = 10
+        self.cur.execute('SELECT 1')
+        self.assertEqual(self.cur.log.report(), [])
+        self.cur.execute('SELECT 2').fetchone()
+        self.assertEqual({entry.sql: entry.rows for entry in self.cur.log.report()},
+                         {'SELECT 1': 0, 'SELECT 2': 1})
+
+    def test_top(self):
+        '''
+        Tests that only slowest statements are kept
+        '''
+        log = QueryLog(10, 2)
+        log.record(self.con, 'A', (), 0.003, 0, 'f')
+        log.record(self.con, 'B', (), 0.001, 0, 'f')
+        log.record(self.con, 'C', (), 0.002, 0, 'f')
+        log.record(self.con, 'D', (), 0.0005, 0, 'f')
+        log.record(self.con, 'A', (), 0.001, 0, 'f')
+        self.assertEqual([(entry.sql, entry.count) for entry in log.report()], [('A', 2), ('C', 1)])
+
+    def test_configure(self):
+        '''
+        Tests that smaller top from config drops fastest statements
+        '''
+        log = QueryLog()
+        log.record(self.con, 'A', (), 0.003, 0, 'f')
+        log.record(self.con, 'B', (), 0.001, 0, 'f')
+        log.configure(10, 1)
+        self.assertEqual((log.threshold, log.top), (10, 1))
+        self.assertEqual([entry.sql for entry in log.report()], ['A'])
@@ -0,0 +1,101 @@
+'''
+Tests for ratelimit module
+'''
+import unittest
+
+from src.ratelimit import RateLimitMiddleware
+from src.metrics import Registry
+
+
+SETTINGS = {
+    'max_in_flight': 2,
+    'shed_in_flight': 1,
+    'target_latency_ms': 100,
+    'max_clients': 4,
+    'routes': {
+        'default': {'client': [1, 2]},
+        '/login': {'route': [1, 1]},
+        '/search': {'shed': True},
+    },
+}
+
+
+def make_scope(path, token=None, client='1.1.1.1'):
+    '''
+    Makes ASGI scope of http request
+    '''
+    headers = [(b'authorization', b'Bearer ' + token.encode())] if token else []
+    return {'type': 'http', 'path': path, 'headers': headers, 'client': (client, 1000)}
+
+
+class TestRateLimitMiddleware(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for RateLimitMiddleware class
+    '''
+    def setUp(self):
+        '''
+        Creates middleware over app that answers with 200
+        '''
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        self.middleware = RateLimitMiddleware(app,
+                                              lambda token: token if token != 'bad' else None,
+                                              SETTINGS, Registry())
+
+    async def request(self, scope):
+        '''
+        Runs request through middleware and returns status and headers
+        '''
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await self.middleware(scope, None, send)
+        return messages[0]['status'], dict(messages[0]['headers'])
+
+    async def test_client_buckets(self):
+        '''
+        Tests that users and addresses have separate buckets
+        '''
+        for _ in range(2):
+            self.assertEqual((await self.request(make_scope('/track')))[0], 200)
+        status, headers = await self.request(make_scope('/track'))
+        self.assertEqual(status, 429)
+        self.assertEqual(headers[b'retry-after'], b'1')
+
+        self.assertEqual((await self.request(make_scope('/track', 'dora')))[0], 200)
+        self.assertEqual((await self.request(make_scope('/track', 'bad')))[0], 429)
+        self.assertEqual((await self.request(make_scope('/track', None, '2.2.2.2')))[0], 200)
+        self.assertEqual(self.middleware.rejected.value('client', 'default'), 2)
+        self.assertEqual(self.middleware.in_flight, 0)
+
+    async def test_route_bucket(self):
+        '''
+        Tests bucket shared by all clients of route
+        '''
+        self.assertEqual((await self.request(make_scope('/login')))[0], 200)
+        self.assertEqual((await self.request(make_scope('/login', None, '2.2.2.2')))[0], 429)
+        self.assertEqual(self.middleware.rejected.value('route', '/login'), 1)
+
+    async def test_shedding(self):
+        '''
+        Tests rejecting requests when worker is overloaded
+        '''
+        self.middleware.in_flight = 1
+        self.middleware.latency = 1.0
+        self.assertEqual((await self.request(make_scope('/search')))[0], 503)
+        self.assertEqual((await self.request(make_scope('/login')))[0], 200)
+        self.middleware.in_flight = 2
+        self.assertEqual((await self.request(make_scope('/login')))[0], 503)
+        self.assertEqual(self.middleware.rejected.value('overload', '/login'), 1)
+
+    def test_bucket_pruning(self):
+        '''
+        Tests that number of buckets stays bounded
+        '''
+        for i in range(10):
+            self.middleware.bucket('default', str(i), (1, 2)).try_take()
+        self.assertLessEqual(len(self.middleware.buckets), 4)
@@ -0,0 +1,110 @@
+'''
+Tests for resources module
+'''
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from src.bootstrap import bootstrap
+from src.config import config
+from src.db.playlist_controller import Access, DBPlaylist, Playlist
+from src.db.user_controller import UserController
+from src.resources import Resources
+
+
+class TestResources(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for Resources class
+    '''
+    def setUp(self):
+        '''
+        Creates settings pointing to temporary directory
+        '''
+        self.dir: str = tempfile.mkdtemp()
+        self.settings: dict = dict(config, db_path=os.path.join(self.dir, 'test.db'),
+                                   storage_path=os.path.join(self.dir, 'storage'),
+                                   head_cache_path=os.path.join(self.dir, 'heads.bin'))
+
+    def tearDown(self):
+        '''
+        Removes temporary directory
+        '''
+        shutil.rmtree(self.dir)
+
+    async def test_shared_connection(self):
+        '''
+        Tests that all controllers use one connection and closing one of them keeps it open
+        '''
+        resources = Resources(self.settings)
+        controllers = [resources.users, resources.tracks, resources.playlists, resources.plays]
+        self.assertTrue(all(controller.con is resources.con for controller in controllers))
+        self.assertFalse(resources.users.owns_connection)
+        del controllers
+        resources.users = None
+        resources.con.execute('SELECT 1')
+        self.assertTrue(os.path.isdir(self.settings['storage_path']))
+        await resources.close()
+
+    async def test_head_cache_path(self):
+        '''
+        Tests that relative path of head cache is taken inside storage
+        '''
+        resources = Resources(dict(self.settings, head_cache_path='heads.cache'))
+        self.assertTrue(os.path.isfile(os.path.join(self.settings['storage_path'],
+                                                    'heads.cache')))
+        await resources.close()
+
+    async def test_close(self):
+        '''
+        Tests that close stops background work and releases everything
+        '''
+        resources = Resources(self.settings)
+        resources.start()
+        flusher, rebuilder = resources.flusher, resources.rebuilder
+        await resources.close()
+        self.assertTrue(flusher.cancelled())
+        self.assertTrue(rebuilder.cancelled())
+        self.assertIsNone(resources.flusher)
+        self.assertTrue(resources.watchdog.stopped.is_set())
+        self.assertRaises(RuntimeError, resources.prefetcher.submit, print)
+        self.assertRaises(sqlite3.ProgrammingError, resources.con.execute, 'SELECT 1')
+
+    def test_owned_connection(self):
+        '''
+        Tests that controller given a path owns and closes its connection
+        '''
+        controller = UserController(self.settings['db_path'])
+        self.assertTrue(controller.owns_connection)
+        con: sqlite3.Connection = controller.con
+        del controller
+        self.assertRaises(sqlite3.ProgrammingError, con.execute, 'SELECT 1')
+
+    async def test_rebuild_related(self):
+        '''
+        Tests that only public playlists are counted and stale counts are rebuilt
+        on separate connection
+        '''
+        bootstrap(self.settings)
+        resources = Resources(dict(self.settings, related_max_delta=2))
+        playlists = resources.playlists
+        self.assertTrue(playlists.related_stale())
+        self.assertTrue(resources.rebuild_related())
+        self.assertFalse(playlists.related_stale())
+
+        playlists.create_playlist(Playlist(creator='c', tracks=['a', 'b']))
+        hidden = playlists.create_playlist(Playlist(creator='c', access=Access.PRIVATE,
+                                                    tracks=['a', 'b']))
+        self.assertEqual([t.weight for t in playlists.related_tracks('a', 5)], [1])
+
+        playlists.update_playlist(DBPlaylist(uuid=hidden, creator='c', tracks=['a', 'b']))
+        self.assertEqual([t.weight for t in playlists.related_tracks('a', 5)], [2])
+
+        playlists.update_playlist(DBPlaylist(uuid=hidden, creator='c', tracks=['a', 'b', 'c']))
+        self.assertTrue(playlists.related_stale())
+        self.assertEqual(len(playlists.related_tracks('a', 5)), 1)
+        self.assertTrue(resources.rebuild_related())
+        self.assertEqual(len(playlists.related_tracks('a', 5)), 2)
+        self.assertFalse(playlists.related_stale())
+        await resources.close()
@@ -0,0 +1,68 @@
+'''
+Tests for shuffle module
+'''
+import unittest
+
+from src.shuffle import FeistelPermutation, shuffle_window, seeded_hash
+
+
+class TestFeistelPermutation(unittest.TestCase):
+    '''
+    Tests for FeistelPermutation class
+    '''
+    def test_permutation(self):
+        '''
+        Tests that every size gives a permutation
+        '''
+        for size in [0, 1, 2, 3, 7, 16, 100, 1000]:
+            permutation = FeistelPermutation(size, seed=42)
+            self.assertEqual(sorted(permutation.window(0, size)), list(range(size)))
+
+    def test_window(self):
+        '''
+        Tests that windows are consistent and depend on seed
+        '''
+        permutation = FeistelPermutation(100, seed=1)
+        self.assertEqual(permutation.window(0, 10) + permutation.window(10, 10),
+                         permutation.window(0, 20))
+        self.assertEqual(permutation.window(95, 10), permutation.window(0, 100)[95:])
+        self.assertEqual(permutation.window(-5, 5), [])
+        self.assertNotEqual(permutation.window(0, 100), list(range(100)))
+        self.assertNotEqual(permutation.window(0, 100), FeistelPermutation(100, 2).window(0, 100))
+        with self.assertRaises(IndexError):
+            _ = permutation[100]
+
+
+class TestShuffleWindow(unittest.TestCase):
+    '''
+    Tests for shuffle_window function
+    '''
+    def test_shuffle(self):
+        '''
+        Tests windows of shuffled ids
+        '''
+        ids = [str(i) for i in range(50)]
+        first = shuffle_window(ids, 7, 0, 25)
+        second = shuffle_window(ids, 7, 25, 25)
+        self.assertEqual(sorted(first + second, key=int), ids)
+        self.assertEqual(shuffle_window(ids, 7, 0, 25), first)
+
+    def test_weighted(self):
+        '''
+        Tests that weighted shuffle prefers tracks with more plays
+        '''
+        ids = [str(i) for i in range(20)]
+        weights = {'0': 10000}
+        firsts = [shuffle_window(ids, seed, 0, 1, weights)[0] for seed in range(50)]
+        self.assertGreater(firsts.count('0'), 40)
+
+        window = shuffle_window(ids, 3, 0, 20, {})
+        self.assertEqual(sorted(window, key=int), ids)
+        self.assertEqual(shuffle_window(ids, 3, 5, 5, {}), window[5:10])
+
+    def test_seeded_hash(self):
+        '''
+        Tests bit length of hashes
+        '''
+        self.assertLess(seeded_hash(1, 'a', 3), 8)
+        self.assertEqual(seeded_hash(1, 'a'), seeded_hash(1, 'a'))
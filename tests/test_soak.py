@@ -0,0 +1,63 @@
+'''
+Tests for soak test helpers
+'''
+import tomllib
+import unittest
+from collections import Counter
+
+from benchmarks.soak import compare, dump_toml, parse_metrics, summarize
+
+
+class TestSoak(unittest.TestCase):
+    '''
+    Tests for config writing, metrics parsing and report of soak test
+    '''
+    def test_dump_toml(self):
+        '''
+        Tests that config written back is read the same
+        '''
+        with open('config.toml', 'rb') as file:
+            config = tomllib.load(file)
+        config['rate_limits']['routes'] = {'default': {}, '/login': {'client': [0.5, 5]}}
+        self.assertEqual(tomllib.loads(dump_toml(config)), config)
+
+    def test_parse_metrics(self):
+        '''
+        Tests parsing of samples with and without labels
+        '''
+        text = ('# HELP duradora_streams_in_flight Streams\n'
+                '# TYPE duradora_streams_in_flight gauge\n'
+                'duradora_streams_in_flight 3\n'
+                'duradora_threadpool_threads{state="busy"} 1.0\n')
+        self.assertEqual(parse_metrics(text), {'duradora_streams_in_flight': 3,
+                                               'duradora_threadpool_threads{state="busy"}': 1})
+
+    def test_summarize(self):
+        '''
+        Tests peaks and growth; descriptors of cached files are not leaked
+        '''
+        samples = [
+            {'rss_mb': 50, 'fds': 20, 'threads': 4, 'cached_files': 0},
+            {'rss_mb': 120, 'fds': 900, 'threads': 6, 'cached_files': 10, 'loop_lag_ms': 30},
+            {'rss_mb': 80, 'fds': 32, 'threads': 5, 'cached_files': 10},
+        ]
+        summary = summarize(samples, Counter(stream=5), Counter(x=2), 2 ** 20)
+        self.assertEqual(summary['rss_peak_mb'], 120)
+        self.assertEqual(summary['rss_growth_mb'], 30)
+        self.assertEqual(summary['fds_leaked'], 2)
+        self.assertEqual(summary['loop_lag_peak_ms'], 30)
+        self.assertEqual(summary['streams_done'], 5)
+        self.assertEqual(summary['received_mb'], 1)
+        self.assertEqual(summary['errors'], 2)
+
+    def test_compare(self):
+        '''
+        Tests regressions of memory and leaked descriptors
+        '''
+        old = {'rss_peak_mb': 100, 'rss_growth_mb': 20, 'threadpool_busy_peak': 2,
+               'loop_lag_peak_ms': 0, 'fds_leaked': 0}
+        new = dict(old, rss_peak_mb=110, loop_lag_peak_ms=1)
+        self.assertEqual(compare(new, old, 0.2), [])
+        new = dict(old, rss_growth_mb=40, fds_leaked=100)
+        self.assertEqual(compare(new, old, 0.2), ['rss_growth_mb: 20 -> 40',
+                                                  'fds_leaked: 0 -> 100'])
@@ -0,0 +1,173 @@
+'''
+Tests for tracing module
+'''
+import asyncio
+import json
+import os
+import time
+import unittest
+
+from src.tracing import (Span, SpanExporter, Tracer, TracingMiddleware, current_span,
+                         parse_traceparent, traced)
+
+
+class MockExporter(SpanExporter):
+    '''
+    Exporter that keeps spans in list
+    '''
+    def __init__(self):
+        '''
+        Starts with no spans
+        '''
+        super().__init__('', '', 10, 0.1, 10)
+        self.spans = []
+
+    def export(self, span: Span):
+        '''
+        Saves span
+        '''
+        self.spans.append(span)
+
+
+class TestTracing(unittest.TestCase):
+    '''
+    Tests for Tracer class and traced decorator
+    '''
+    def test_parse_traceparent(self):
+        '''
+        Tests parsing of valid and broken traceparent headers
+        '''
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        self.assertEqual(parse_traceparent(f'00-{trace_id}-{parent_id}-01'),
+                         (trace_id, parent_id, True))
+        self.assertEqual(parse_traceparent(f'00-{trace_id}-{parent_id}-00'),
+                         (trace_id, parent_id, False))
+        self.assertIsNone(parse_traceparent(None))
+        self.assertIsNone(parse_traceparent(f'00-{trace_id}-{parent_id}'))
+        self.assertIsNone(parse_traceparent(f'00-{"0" * 32}-{parent_id}-01'))
+        self.assertIsNone(parse_traceparent(f'00-{"x" * 32}-{parent_id}-01'))
+
+    def test_sampling(self):
+        '''
+        Tests that traces are sampled by rate unless traceparent decides
+        '''
+        exporter = MockExporter()
+        trace_id, span = Tracer(0, exporter).start_trace('GET /')
+        self.assertEqual(len(trace_id), 32)
+        self.assertIsNone(span)
+        self.assertIsNotNone(Tracer(1, exporter).start_trace('GET /')[1])
+
+        header = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+        trace_id, span = Tracer(0, exporter).start_trace('GET /', header)
+        self.assertEqual(trace_id, '4bf92f3577b34da6a3ce929d0e0e4736')
+        self.assertEqual(span.parent_id, '00f067aa0ba902b7')
+        self.assertIsNone(Tracer(1, exporter).start_trace('GET /', header[:-1] + '0')[1])
+
+    def test_nested_spans(self):
+        '''
+        Tests that spans are children of current span and nothing is traced without it
+        '''
+        exporter = MockExporter()
+        tracer = Tracer(1, exporter)
+        with tracer.span('lost') as span:
+            self.assertIsNone(span)
+        tracer.add_span('lost', 0.1)
+        self.assertEqual(exporter.spans, [])
+
+        root = Span('root', 'a' * 32)
+        token = current_span.set(root)
+        try:
+            with tracer.span('outer', key='value') as outer:
+                tracer.add_span('sql', 0.5, rows=1)
+            self.assertIs(current_span.get(), root)
+        finally:
+            current_span.reset(token)
+
+        sql, finished = exporter.spans
+        self.assertEqual((finished.name, finished.parent_id), ('outer', root.span_id))
+        self.assertIs(finished, outer)
+        self.assertEqual((sql.name, sql.parent_id, sql.trace_id), ('sql', outer.span_id, 'a' * 32))
+        self.assertGreaterEqual(sql.end - sql.start, 5 * 10 ** 8)
+        self.assertEqual(sql.export()['attributes'], [{'key': 'rows', 'value': {'stringValue': '1'}}])
+
+    def test_traced(self):
+        '''
+        Tests decorator of sync and async functions
+        '''
+        import src.tracing
+        exporter = MockExporter()
+        tracer, src.tracing.tracer = src.tracing.tracer, Tracer(1, exporter)
+
+        class Handler:
+            @traced
+            def work(self, x: int) -> int:
+                return x + 1
+
+            @traced
+            async def async_work(self, x: int) -> int:
+                return x + 2
+
+        token = current_span.set(Span('root', 'a' * 32))
+        try:
+            self.assertEqual(Handler().work(1), 2)
+            self.assertEqual(asyncio.run(Handler().async_work(1)), 3)
+        finally:
+            current_span.reset(token)
+            src.tracing.tracer = tracer
+        self.assertEqual([span.name for span in exporter.spans],
+                         ['TestTracing.test_traced.<locals>.Handler.work',
+                          'TestTracing.test_traced.<locals>.Handler.async_work'])
+        self.assertEqual(Handler.work.__name__, 'work')
+
+    def test_exporter(self):
+        '''
+        Tests that exporter writes spans to file from its thread
+        '''
+        path = 'test_spans.jsonl'
+        exporter = SpanExporter(path, '', 10, 0.05, 10)
+        try:
+            span = Span('root', 'a' * 32)
+            span.end = span.start
+            exporter.export(span)
+            deadline = time.monotonic() + 5
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual([json.loads(line)['spanId'] for line in file], [span.span_id])
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class TestTracingMiddleware(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for TracingMiddleware class
+    '''
+    async def test_middleware(self):
+        '''
+        Tests trace id header and root span named by route template
+        '''
+        class Route:
+            path = '/track/{uuid}'
+
+        exporter = MockExporter()
+
+        async def app(scope, receive, send):
+            scope['route'] = Route()
+            self.assertIsNotNone(current_span.get())
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = TracingMiddleware(app, Tracer(1, exporter))
+        await middleware({'type': 'http', 'method': 'GET', 'path': '/track/1', 'headers': []},
+                         None, send)
+        span, = exporter.spans
+        self.assertEqual(span.name, 'GET /track/{uuid}')
+        self.assertEqual(span.attributes['http.status_code'], 200)
+        self.assertIn((b'x-trace-id', span.trace_id.encode()), messages[0]['headers'])
+        self.assertIsNone(current_span.get())
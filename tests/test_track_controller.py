@@ -3,7 +3,7 @@ Tests for track_controller module
 '''
 import unittest
 from unittest.mock import patch, MagicMock
-from src.db.track_controller import Track, TrackController, DBTrack
+from src.db.track_controller import Track, TrackController, DBTrack, split_artists
 
 
 class TestTrackController(unittest.TestCase):
@@ -53,12 +53,49 @@ class TestTrackController(unittest.TestCase):
         controller.cur.fetchone.return_value = ('u', 't', 'a')
         self.assertEqual(controller.find_track('u'), controller.track_from_entry(('u', 't', 'a')))
 
+    @patch('sqlite3.connect')
+    def test_find_tracks(self, _):
+        '''
+        Tests searching for many tracks in DB
+        '''
+        controller = TrackController('duradora.db')
+        controller.cur.fetchall.return_value = [('b', 't', 'a'), ('a', 't', 'a')]
+        out = controller.find_tracks(['a', 'c', 'b'])
+        self.assertEqual([track.uuid for track in out], ['a', 'b'])
+        controller.cur.execute.assert_called_once()
+
+        controller.cur.fetchall.return_value = []
+        controller.find_tracks([str(i) for i in range(1200)])
+        self.assertEqual(controller.cur.execute.call_count, 4)
+
     @patch('sqlite3.connect')
     def test_update_track(self, _):
         '''
         Tests updating track
         '''
         controller = TrackController('duradora.db')
-        controller.update_track(DBTrack(title='t', artists='a', uuid='u'))
+        controller.update_track(DBTrack(title='t', artists='a, b', uuid='u'))
         controller.con.commit.assert_called_once()
-        controller.cur.execute.assert_called_once()
+        controller.cur.execute.assert_any_call(
+            'UPDATE tracks SET title = ?, artists = ? WHERE uuid = ?', ('t', 'a, b', 'u')
+        )
+        controller.cur.executemany.assert_called_once_with(
+            'INSERT OR IGNORE INTO track_artists VALUES(?, ?)', [('a', 'u'), ('b', 'u')]
+        )
+
+    @patch('sqlite3.connect')
+    def test_artists(self, _):
+        '''
+        Tests index of tracks by artist
+        '''
+        self.assertEqual(split_artists(' Dora,Dura , '), ['Dora', 'Dura'])
+        self.assertEqual(split_artists(None), [])
+
+        controller = TrackController('duradora.db')
+        controller.cur.fetchall.return_value = [('u', 'Dora, Dura'), ('v', None)]
+        controller.rebuild_artists()
+        controller.cur.executemany.assert_called_once_with(
+            'INSERT OR IGNORE INTO track_artists VALUES(?, ?)', [('Dora', 'u'), ('Dura', 'u')]
+        )
+        controller.cur.fetchall.return_value = [('u',)]
+        self.assertEqual(controller.artist_track_ids('Dora'), ['u'])
@@ -1,15 +1,23 @@
 '''
 Tests for tracks module
 '''
+import asyncio
 import unittest
 from unittest.mock import MagicMock, AsyncMock
 import os
 import shutil
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 from src.tracks import TrackHandler, TrackUUID
+from src.waveform import PeaksBuilder
+from src.caching import HTTPCache
+from src.headcache import HeadCache
+from src.filecache import FileCache
+from src.admission import StreamAdmission
 from src.db.track_controller import DBTrack
 from src.responses import Error
+from tests.test_mp3 import make_frame
 
 class MockTrackHandler(TrackHandler):
     '''
@@ -22,13 +30,40 @@ class MockTrackHandler(TrackHandler):
         self.controller = MagicMock()
         self.storage = 'test_storage' + random.randbytes(5).hex()
         self.user_handler = MagicMock()
+        self.peaks = PeaksBuilder([4, 16])
+        self.cache = HTTPCache({'stream': 'public'})
+        self.plays = MagicMock()
+        self.prefetch_bytes = 500
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
         os.makedirs(self.storage, exist_ok=True)
+        self.heads = HeadCache(self.storage + '.heads', 8, 2, 4, 2)
+        self.files = FileCache(4, 0)
+        self.admission = StreamAdmission(2, 3, 2.0, 10, 0)
+        self.stream_default_bitrate = 320000
+        self.stream_retry_after = 5
 
     def __del__(self):
         '''
-        Removes storage directory
+        Removes storage directory and head cache
         '''
         shutil.rmtree(self.storage)
+        os.remove(self.storage + '.heads')
+
+
+async def send_response(response):
+    '''
+    Runs ASGI response and returns its status and body
+    '''
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    await response({'type': 'http'}, receive, send)
+    return messages[0]['status'], b''.join(bytes(m['body']) for m in messages[1:])
 
 
 class MockDBTrackWithFile(DBTrack):
@@ -106,3 +141,232 @@ class TestTrackHandler(unittest.IsolatedAsyncioTestCase):
 
         handler.controller.find_track.side_effect = KeyError()
         self.assertIsInstance(await handler.update_track(None, None), Error)
+
+    async def test_get_peaks(self):
+        '''
+        Tests for get_peaks method
+        '''
+        handler = MockTrackHandler()
+        self.assertIsInstance(await handler.get_peaks('u', 16), Error)
+
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(b'not really an mp3')
+        out = await handler.get_peaks('u', 16)
+        self.assertTrue(os.path.exists(handler.storage + '/u.peaks'))
+        self.assertEqual(out.body, b'')
+        self.assertEqual(out.headers['X-Peaks-Resolution'], '16')
+
+        out = await handler.get_peaks('u', 16, {'if-none-match': out.headers['ETag']})
+        self.assertEqual(out.status_code, 304)
+        etag = out.headers['ETag']
+        out = await handler.get_peaks('u', 10, {'if-none-match': etag})
+        self.assertEqual(out.status_code, 304)
+        out = await handler.get_peaks('u', 4, {'if-none-match': etag})
+        self.assertEqual(out.headers['X-Peaks-Resolution'], '4')
+
+    async def test_stream_track(self):
+        '''
+        Tests for stream_track method
+        '''
+        handler = MockTrackHandler()
+        self.assertIsInstance(await handler.stream_track('u'), Error)
+
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(b'contents')
+        out = await handler.stream_track('u', username='dora')
+        self.assertEqual(out.headers['Content-Length'], '8')
+        self.assertEqual(out.headers['Cache-Control'], 'public')
+        handler.plays.record.assert_called_once_with('u', 'dora', 'start')
+        status, body = await send_response(out)
+        self.assertEqual((status, body), (200, b'contents'))
+        handler.plays.record.assert_called_with('u', 'dora', 'complete')
+
+        out = await handler.stream_track('u', {'if-none-match': out.headers['ETag']})
+        self.assertEqual(out.status_code, 304)
+
+        for _ in range(3):
+            out = await handler.stream_track('u')
+            self.assertEqual(await send_response(out), (200, b'contents'))
+        self.assertEqual(handler.heads.hits, 2)
+        self.assertEqual(handler.heads.misses, 2)
+        self.assertEqual(handler.files.misses, 1)
+        self.assertEqual(handler.files.files['u'].refs, 0)
+
+    async def test_stream_track_range(self):
+        '''
+        Tests for range requests to stream_track
+        '''
+        handler = MockTrackHandler()
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(b'contents')
+        out = await handler.stream_track('u', {'range': 'bytes=2-4'})
+        self.assertEqual(out.headers['Content-Range'], 'bytes 2-4/8')
+        self.assertEqual(await send_response(out), (206, b'nte'))
+        handler.plays.record.assert_not_called()
+
+        out = await handler.stream_track('u', {'range': 'bytes=-3'})
+        self.assertEqual(await send_response(out), (206, b'nts'))
+        handler.plays.record.assert_called_once_with('u', None, 'complete')
+
+        out = await handler.stream_track('u', {'range': 'bytes=8-'})
+        self.assertEqual(out.status_code, 416)
+        self.assertEqual(out.headers['Content-Range'], 'bytes */8')
+        self.assertEqual(handler.files.files['u'].refs, 0)
+
+    async def test_stream_track_admission(self):
+        '''
+        Tests limits of concurrent streams
+        '''
+        handler = MockTrackHandler()
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(b'contents')
+        first = await handler.stream_track('u', username='dora')
+        await handler.stream_track('u', username='dora')
+        out = await handler.stream_track('u', username='dora')
+        self.assertEqual(out.status_code, 429)
+        self.assertEqual(out.headers['Retry-After'], '5')
+
+        await handler.stream_track('u', client='127.0.0.1')
+        out = await handler.stream_track('u', client='127.0.0.2')
+        self.assertEqual(out.status_code, 503)
+
+        await send_response(first)
+        self.assertEqual(handler.admission.active['dora'], 1)
+        out = await handler.stream_track('u', client='127.0.0.2')
+        self.assertEqual(out.status_code, 200)
+        self.assertEqual(handler.files.files['u'].refs, 3)
+
+    async def test_get_plays(self):
+        '''
+        Tests for get_plays method
+        '''
+        handler = MockTrackHandler()
+        self.assertIsInstance(await handler.get_plays('u', 'week', 1), Error)
+
+        handler.plays.controller.track_plays.return_value = []
+        self.assertEqual(await handler.get_plays('u', 'day', 1), [])
+
+        handler.plays.controller.track_plays.side_effect = KeyError()
+        self.assertIsInstance(await handler.get_plays('u', 'day', 1), Error)
+
+    async def test_charts(self):
+        '''
+        Tests for get_top_tracks and get_artist_top methods
+        '''
+        handler = MockTrackHandler()
+        self.assertIsInstance(await handler.get_top_tracks('year', None, 1), Error)
+
+        handler.plays.controller.top_tracks.return_value = []
+        self.assertEqual(await handler.get_top_tracks('day', 86400 + 5, 1), [])
+        handler.plays.controller.top_tracks.assert_called_with('day', 86400, 1)
+        handler.plays.controller.artist_top.return_value = []
+        self.assertEqual(await handler.get_artist_top('Dora', 1), [])
+
+        handler.plays.controller.top_tracks.side_effect = KeyError()
+        handler.plays.controller.artist_top.side_effect = KeyError()
+        self.assertIsInstance(await handler.get_top_tracks('all', None, 1), Error)
+        self.assertIsInstance(await handler.get_artist_top('Dora', 1), Error)
+
+    async def test_artist_radio(self):
+        '''
+        Tests for artist_radio method
+        '''
+        handler = MockTrackHandler()
+        handler.controller.artist_track_ids.return_value = ['a', 'b', 'c']
+        handler.controller.find_tracks.side_effect = lambda ids: [DBTrack(uuid=i) for i in ids]
+        out = await handler.artist_radio('Dora', 5, 1, 5, False)
+        self.assertEqual((out.seed, out.offset, out.total, len(out.tracks)), (5, 1, 3, 2))
+
+        handler.plays.controller.play_counts.return_value = {'a': 1}
+        out = await handler.artist_radio('Dora', None, 0, 5, True)
+        self.assertEqual(len(out.tracks), 3)
+
+        handler.controller.artist_track_ids.side_effect = KeyError()
+        self.assertIsInstance(await handler.artist_radio('Dora', 5, 0, 5, False), Error)
+
+    async def test_stream_tracks(self):
+        '''
+        Tests streaming of several tracks in one response
+        '''
+        handler = MockTrackHandler()
+        tag = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'\xff' * 5
+        frames = make_frame([1, 2]) * 3
+        with open(handler.storage + '/first.mp3', 'wb') as f:
+            f.write(tag + frames + b'TAG' + b'\x00' * 125)
+        with open(handler.storage + '/second.mp3', 'wb') as f:
+            f.write(frames)
+
+        out = await handler.stream_tracks(['first', 'missing', 'second'], 'user')
+        boundary = out.media_type.split('boundary=')[1]
+        body = b''.join([chunk async for chunk in out.body_iterator])
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[-1], b'--\r\n')
+        for part, uuid in zip(parts[1:3], ['first', 'second']):
+            headers, data = part.split(b'\r\n\r\n', 1)
+            self.assertIn(f'X-Track-Id: {uuid}'.encode(), headers)
+            self.assertIn(f'Content-Length: {len(frames)}'.encode(), headers)
+            self.assertEqual(data, frames + b'\r\n')
+        self.assertEqual(handler.plays.record.call_count, 4)
+        handler.plays.record.assert_called_with('second', 'user', 'complete')
+        self.assertEqual(handler.admission.total, 0)
+
+    async def test_stream_tracks_admission(self):
+        '''
+        Tests that playlist streams share limits and pacing with single streams
+        '''
+        handler = MockTrackHandler()
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(make_frame([1, 2]) * 3)
+        first = await handler.stream_tracks(['u'], 'dora')
+        await handler.stream_track('u', username='dora')
+        out = await handler.stream_tracks(['u'], 'dora')
+        self.assertEqual(out.status_code, 429)
+
+        handler.admission.delay = MagicMock(return_value=0.0)
+        async for _ in first.body_iterator:
+            pass
+        self.assertEqual(handler.admission.active['dora'], 1)
+        self.assertGreater(handler.admission.delay.call_count, 0)
+
+    async def test_stream_tracks_disconnect(self):
+        '''
+        Tests that stream is released and files are closed when client is gone,
+        even before body is started
+        '''
+        handler = MockTrackHandler()
+        for uuid in ['a', 'b']:
+            with open(handler.storage + f'/{uuid}.mp3', 'wb') as f:
+                f.write(make_frame([1, 2]) * 3)
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await asyncio.sleep(0.01)
+
+        out = await handler.stream_tracks(['a', 'b'], 'dora')
+        await out({'type': 'http'}, receive, send)
+        self.assertEqual(handler.admission.total, 0)
+        handler.plays.record.assert_not_called()
+
+        out = await handler.stream_tracks(['a', 'b'], 'dora')
+        await anext(out.body_iterator)
+        out.on_close()
+        out.on_close()
+        self.assertEqual(handler.admission.total, 0)
+        await out.body_iterator.aclose()
+        self.assertEqual(handler.admission.total, 0)
+
+    async def test_stream_track_error(self):
+        '''
+        Tests that stream slot and file are released if stream fails to start
+        '''
+        handler = MockTrackHandler()
+        with open(handler.storage + '/u.mp3', 'wb') as f:
+            f.write(b'contents')
+        handler.heads.get = MagicMock(side_effect=OSError)
+        with self.assertRaises(OSError):
+            await handler.stream_track('u', username='dora')
+        self.assertEqual(handler.admission.total, 0)
+        self.assertEqual(handler.files.files['u'].refs, 0)
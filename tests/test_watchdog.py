@@ -0,0 +1,93 @@
+'''
+Tests for watchdog module
+'''
+import asyncio
+import threading
+import time
+import unittest
+
+from src.metrics import Registry
+from src.watchdog import LoopWatchdog
+
+
+def block(seconds: float):
+    '''
+    Blocks calling thread like synchronous database call does
+    '''
+    time.sleep(seconds)
+
+
+def check_elsewhere(watchdog: LoopWatchdog):
+    '''
+    Checks watchdog from another function, so caught stack differs
+    '''
+    watchdog.check()
+
+
+def check_deeper(watchdog: LoopWatchdog):
+    '''
+    Checks watchdog from one more function
+    '''
+    check_elsewhere(watchdog)
+
+
+class TestLoopWatchdog(unittest.IsolatedAsyncioTestCase):
+    '''
+    Tests for LoopWatchdog class
+    '''
+    async def test_blocked_loop(self):
+        '''
+        Tests that lag is measured and stack of blocking call is caught and logged once
+        '''
+        registry = Registry()
+        watchdog = LoopWatchdog(0.01, 0.05, 60, 10, registry)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            with self.assertLogs('src.watchdog', 'WARNING') as logs:
+                block(0.2)
+                await asyncio.sleep(0.05)
+                block(0.2)
+                await asyncio.sleep(0.05)
+        finally:
+            watchdog.stop()
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('in block', logs.output[0])
+        self.assertEqual(watchdog.blocks.value(), 2)
+        report = watchdog.report()
+        self.assertEqual(report[0].count, 2)
+        self.assertTrue(report[0].stack[-1].endswith(':block'))
+        self.assertGreaterEqual(report[0].max_ms, 150)
+        self.assertIn('duradora_event_loop_lag_seconds ', registry.render())
+        self.assertGreaterEqual(watchdog.lags.values()[()][-1], 4)
+
+    async def test_idle_loop(self):
+        '''
+        Tests that nothing is caught while loop is free
+        '''
+        watchdog = LoopWatchdog(0.01, 0.05, 60, 10, Registry())
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+        self.assertEqual(watchdog.report(), [])
+        self.assertLess(watchdog.lag, 0.05)
+
+    def test_top(self):
+        '''
+        Tests that least frequent stack is dropped when top is full
+        '''
+        watchdog = LoopWatchdog(0.01, 0.0, 60, 2, Registry())
+        watchdog.loop_thread = threading.get_ident()
+        watchdog.last_beat = time.monotonic() - 1
+        for beats in range(3):
+            watchdog.beats = beats
+            watchdog.check()
+            watchdog.check()
+        watchdog.beats = 3
+        check_elsewhere(watchdog)
+        watchdog.beats = 4
+        check_deeper(watchdog)
+        report = watchdog.report()
+        self.assertEqual([entry.count for entry in report], [3, 1])
+        self.assertTrue(report[1].stack[-3].endswith(':check_deeper'))
@@ -0,0 +1,54 @@
+'''
+Tests for waveform module
+'''
+import unittest
+import os
+import random
+
+from src.waveform import PeaksBuilder
+from tests.test_mp3 import make_frame
+
+
+class TestPeaksBuilder(unittest.TestCase):
+    '''
+    Tests for PeaksBuilder class
+    '''
+    def setUp(self):
+        '''
+        Writes mp3 file with 8 frames of growing loudness
+        '''
+        self.path = 'test_audio' + random.randbytes(5).hex()
+        with open(self.path + '.mp3', 'wb') as f:
+            for i in range(8):
+                f.write(make_frame([100 + i * 10, 100 + i * 10]))
+
+    def tearDown(self):
+        '''
+        Removes written files
+        '''
+        for ext in ('.mp3', '.peaks'):
+            if os.path.exists(self.path + ext):
+                os.remove(self.path + ext)
+
+    def test_build(self):
+        '''
+        Tests computing peaks at several resolutions
+        '''
+        peaks = PeaksBuilder([16, 4]).build(self.path + '.mp3')
+        self.assertEqual(list(peaks[4]), [36, 109, 182, 255])
+        self.assertEqual(len(peaks[16]), 8)
+        self.assertEqual(peaks[16][0], 0)
+
+    def test_save_load(self):
+        '''
+        Tests writing peaks file and reading blocks back
+        '''
+        builder = PeaksBuilder([2, 4, 8])
+        builder.save(self.path + '.mp3', self.path + '.peaks')
+        self.assertEqual(builder.load(self.path + '.peaks', 3), (4, bytes([36, 109, 182, 255])))
+        self.assertEqual(builder.load(self.path + '.peaks', 100)[0], 8)
+        self.assertEqual(builder.load(self.path + '.peaks', 1), (2, bytes([109, 255])))
+
+        with open(self.path + '.peaks', 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(builder.load(self.path + '.peaks', 3))